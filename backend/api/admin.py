@@ -1,9 +1,42 @@
 from django.contrib import admin
 from .models import Challenge, Result
-from .models import GenerationRequest, GeneratedChallenge
+from .models import GenerationRequest, GeneratedChallenge, GenerationAttempt, LeaderboardEntry, ReverificationRun
+
+
+class GenerationAttemptInline(admin.TabularInline):
+    model = GenerationAttempt
+    extra = 0
+    can_delete = False
+    fields = ["number", "vuln_type", "seed_topic", "model", "outcome", "duration_ms", "input_tokens", "output_tokens", "detail"]
+    readonly_fields = fields
+
+
+@admin.register(GenerationRequest)
+class GenerationRequestAdmin(admin.ModelAdmin):
+    list_display = ["id", "created_by", "status", "priority", "created_at", "queue_wait_ms", "heartbeat_at", "runs"]
+    list_filter = ["status", "priority"]
+    inlines = [GenerationAttemptInline]
+
+
+@admin.register(GenerationAttempt)
+class GenerationAttemptAdmin(admin.ModelAdmin):
+    list_display = ["generation", "number", "vuln_type", "model", "outcome", "duration_ms", "input_tokens", "output_tokens", "promoted_to"]
+    list_filter = ["vuln_type", "outcome", "provider", "model"]
+    readonly_fields = ["spans", "bundle", "results", "bundle_sha", "reverified_at", "promoted_to"]
+
+
+@admin.register(GeneratedChallenge)
+class GeneratedChallengeAdmin(admin.ModelAdmin):
+    list_display = ["id", "vuln_type", "difficulty", "created_at", "is_stale", "verified_image", "verified_at"]
+    list_filter = ["vuln_type", "difficulty", "is_stale"]
+
+
+@admin.register(ReverificationRun)
+class ReverificationRunAdmin(admin.ModelAdmin):
+    list_display = ["id", "image_digest", "status", "total", "checked", "regressed", "restored", "errors", "started_at", "checkpoint_at"]
+    list_filter = ["status"]
 
-admin.site.register(GenerationRequest)
-admin.site.register(GeneratedChallenge)
 
 admin.site.register(Challenge)
 admin.site.register(Result)
+admin.site.register(LeaderboardEntry)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend.api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import metrics, profiling, queues, tracing
+        metrics.connect_celery_signals()
+        tracing.connect_celery_signals()
+        profiling.connect_celery_signals()
+        queues.connect_celery_signals()
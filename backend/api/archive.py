@@ -0,0 +1,110 @@
+"""
+Retention tier for the verbose part of generated challenges.
+
+``artifact["verification"]`` holds the raw sandbox output of both runs and
+is by far the largest part of an artifact, but nothing player-facing reads
+it. Once a challenge is older than ARTIFACT_RETENTION_DAYS, ``archive_old``
+appends its verification block to a gzip-compressed NDJSON file in
+ARTIFACT_ARCHIVE_DIR (one file per creation month, one ``{"id", "verification"}``
+object per line) and leaves a stub in the artifact:
+``{"archived": "<file name>", "attempt": n}``.
+
+``load_verification`` reads an archived block back; ``rehydrate`` puts it
+back into the database. Archive files are only appended to (each batch is a
+new gzip member), so an interrupted run at worst leaves duplicate lines,
+of which the last wins.
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GeneratedChallenge
+
+
+def archive_dir():
+    return Path(settings.ARTIFACT_ARCHIVE_DIR)
+
+
+def archive_name(created_at):
+    return f"verification-{created_at:%Y-%m}.ndjson.gz"
+
+
+def archive_old(older_than_days=None, batch_size=200, dry_run=False):
+    """Archive the verification block of challenges older than the retention period; returns counts."""
+    days = settings.ARTIFACT_RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+    ids = list(
+        GeneratedChallenge.objects
+        .filter(created_at__lt=cutoff, verification_archived_at=None)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    stats = {"challenges": 0, "bytes_archived": 0, "files": set()}
+    if dry_run:
+        stats["challenges"] = len(ids)
+        return stats
+
+    archive_dir().mkdir(parents=True, exist_ok=True)
+    for start in range(0, len(ids), batch_size):
+        chunk = GeneratedChallenge.objects.filter(id__in=ids[start:start + batch_size]).order_by("id")
+        by_file = {}
+        for ch in chunk:
+            by_file.setdefault(archive_name(ch.created_at), []).append(ch)
+
+        for name, challenges in by_file.items():
+            lines = []
+            for ch in challenges:
+                verification = ch.artifact.get("verification")
+                line = json.dumps({"id": ch.id, "verification": verification}, separators=(",", ":"))
+                lines.append(line)
+                stats["bytes_archived"] += len(line)
+                ch.artifact["verification"] = {
+                    "archived": name,
+                    "attempt": (verification or {}).get("attempt"),
+                }
+            # Durable on disk before the database drops its copy
+            with open(archive_dir() / name, "ab") as f:
+                f.write(gzip.compress(("\n".join(lines) + "\n").encode()))
+                f.flush()
+                os.fsync(f.fileno())
+
+            now = timezone.now()
+            with transaction.atomic():
+                for ch in challenges:
+                    ch.verification_archived_at = now
+                GeneratedChallenge.objects.bulk_update(challenges, ["artifact", "verification_archived_at"])
+            stats["challenges"] += len(challenges)
+            stats["files"].add(name)
+    return stats
+
+
+def load_verification(ch):
+    """The verification block of ``ch``, read from the archive if it has been moved there."""
+    stub = ch.artifact.get("verification") or {}
+    if ch.verification_archived_at is None or "archived" not in stub:
+        return stub or None
+    found = None
+    with gzip.open(archive_dir() / stub["archived"], "rt", encoding="utf-8") as f:
+        for line in f:
+            # Cheap prefix check before parsing: lines start with {"id":<id>,
+            if line.startswith(f'{{"id":{ch.id},'):
+                found = json.loads(line)["verification"]
+    if found is None:
+        raise LookupError(f"Challenge {ch.id} not found in {stub['archived']}")
+    return found
+
+
+def rehydrate(ch):
+    """Move the archived verification block of ``ch`` back into the database."""
+    if ch.verification_archived_at is None:
+        return ch
+    ch.artifact["verification"] = load_verification(ch)
+    ch.verification_archived_at = None
+    ch.save(update_fields=["artifact", "verification_archived_at"])
+    return ch
@@ -1,46 +1,259 @@
 # backend/api/docker_runner.py
+import asyncio
+import hashlib
 import json
+import os
+import platform
+import signal
 import subprocess
-from typing import Any, Dict
+import sys
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.core.exceptions import ImproperlyConfigured
+
+from . import metrics, tracing
+from .errors import SandboxError
+from .instrumentation import add_span, span
 
 IMAGE = "challenge-runner"  # <-- set to your real image tag
 
-def run_in_container(job: Dict[str, Any], timeout: int = 180) -> Dict[str, Any]:
-    payload = json.dumps(job)
+# Keys of the runner result that hold one tool invocation each
+TOOL_KEYS = ("tests", "bandit", "semgrep", "pip_audit")
+# Resource usage the runner reports per tool (POSIX only)
+RESOURCE_KEYS = ("cpu_user_ms", "cpu_sys_ms", "max_rss_kb")
+
+# SANDBOX_BACKEND=local runs runner.py directly on the host, without any
+# isolation. Only for benchmarks and development with trusted bundles: the
+# tool that replays them sets LOCAL_BACKEND_ALLOWED in its own process, so
+# the environment variable alone can't turn the sandbox off for a worker.
+LOCAL_RUNNER = Path(__file__).resolve().parents[2] / "challenge_runner" / "runner.py"
+LOCAL_BACKEND_ALLOWED = False
+
+# Seconds to wait for a killed run (and `docker kill`) to finish
+KILL_TIMEOUT = 10
+# Seconds a whole sandbox run may take: above the sum of the runner's own tool
+# timeouts (challenge_runner/runner.py TOOLS, 300s) plus container start-up, so
+# a candidate that hangs a tool is reported by the runner, not killed here
+RUN_TIMEOUT = 360
 
-    cmd = [
+def sandbox_backend() -> str:
+    backend = os.getenv("SANDBOX_BACKEND", "docker").lower()
+    if backend == "local" and not LOCAL_BACKEND_ALLOWED:
+        raise ImproperlyConfigured(
+            "SANDBOX_BACKEND=local runs generated code on the host; it is only available to the benchmark tooling"
+        )
+    return backend
+
+def runner_command(name: Optional[str] = None) -> List[str]:
+    if sandbox_backend() == "local":
+        return [sys.executable, str(LOCAL_RUNNER)]
+    return [
         "docker", "run", "--rm",
         "-i",                 # keep stdin open
+        *(["--name", name] if name else []),  # so it can be killed if the client is
+        "--label", "safecode.sandbox=1",
         IMAGE,
         "python", "/work/runner.py"
     ]
 
+# runner_image_digest() results per backend: (digest, time.monotonic() when read)
+_image_digests: Dict[str, Any] = {}
+
+def runner_image_digest(max_age: float = 300) -> str:
+    """
+    Identity of the runner that verifies challenges: the image id of IMAGE
+    (``docker image inspect``), or for the local backend a hash of runner.py
+    with the host's Python version. Cached for ``max_age`` seconds (0 reads
+    it again). Raises SandboxError if the image can't be inspected.
+    """
+    backend = sandbox_backend()
+    cached = _image_digests.get(backend)
+    if cached and time.monotonic() - cached[1] < max_age:
+        return cached[0]
+    if backend == "local":
+        runner_hash = hashlib.sha256(LOCAL_RUNNER.read_bytes()).hexdigest()[:16]
+        digest = f"local:{runner_hash}:python{platform.python_version()}"
+    else:
+        try:
+            out = subprocess.run(
+                ["docker", "image", "inspect", "--format", "{{.Id}}", IMAGE],
+                capture_output=True, text=True, timeout=30,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise SandboxError(f"Can't inspect runner image {IMAGE}: {e}") from e
+        if out.returncode != 0:
+            raise SandboxError(f"Can't inspect runner image {IMAGE}: {out.stderr.strip()[:500]}")
+        digest = out.stdout.strip()
+    _image_digests[backend] = (digest, time.monotonic())
+    return digest
+
+def sandbox_concurrency() -> int:
+    """Most sandbox runs one event loop drives at once (SANDBOX_CONCURRENCY)."""
+    return max(1, int(os.getenv("SANDBOX_CONCURRENCY", "16")))
+
+# One semaphore per event loop: asyncio primitives can't be shared across loops,
+# and the sync wrappers below start a fresh loop per call.
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _semaphores.get(loop)
+    if sem is None:
+        sem = _semaphores[loop] = asyncio.Semaphore(sandbox_concurrency())
+    return sem
+
+async def _kill(proc: asyncio.subprocess.Process, container: Optional[str]) -> None:
+    """
+    Stop a sandbox run that timed out or was cancelled. Killing the docker
+    CLI doesn't stop the container, so it is also killed by name; the local
+    runner is killed with its whole process group (the tools it started).
+    """
+    if container:
+        try:
+            killer = await asyncio.create_subprocess_exec(
+                "docker", "kill", container,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            )
+            await asyncio.wait_for(killer.wait(), KILL_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            pass  # --rm still removes it once it exits on its own
+    if proc.returncode is None:
+        try:
+            if container is None and hasattr(os, "killpg"):
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except ProcessLookupError:
+            pass
     try:
-        proc = subprocess.run(
-            cmd,
-            input=payload,
-            text=True,
-            capture_output=True,
-            timeout=timeout,
-        )
-    except subprocess.TimeoutExpired as e:
-        raise RuntimeError(f"Docker run timed out after {timeout}s") from e
-    except FileNotFoundError as e:
-        raise RuntimeError("Docker executable not found. Is Docker Desktop installed and in PATH?") from e
-
-    if proc.returncode != 0:
-        # Include both stderr and stdout for debugging; containers sometimes write errors to stdout.
-        stderr = (proc.stderr or "")[:4000]
-        stdout = (proc.stdout or "")[:4000]
-        raise RuntimeError(f"Docker run failed (rc={proc.returncode}).\nSTDERR:\n{stderr}\nSTDOUT:\n{stdout}")
-
-    # runner should print JSON; if not, surface a readable error
-    try:
-        return json.loads(proc.stdout or "")
-    except json.JSONDecodeError as e:
-        stdout = (proc.stdout or "")[:4000]
-        stderr = (proc.stderr or "")[:4000]
-        raise RuntimeError(
-            "Container returned non-JSON output.\n"
-            f"STDOUT:\n{stdout}\nSTDERR:\n{stderr}"
-        ) from e
+        await asyncio.wait_for(proc.wait(), KILL_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+
+async def run_in_container_async(job: Dict[str, Any], timeout: int = RUN_TIMEOUT, label: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run ``job`` through the sandbox runner and return its JSON result.
+
+    At most sandbox_concurrency() runs of one event loop execute at once;
+    the rest wait for a slot (not counted against ``timeout``). A run that
+    exceeds ``timeout`` or whose caller is cancelled is killed, container
+    included. Failures of the run itself raise SandboxError.
+    """
+    container = None
+    if sandbox_backend() == "local":
+        cmd = runner_command()
+    else:
+        container = f"safecode-sandbox-{uuid.uuid4().hex[:12]}"
+        cmd = runner_command(container)
+
+    with span("sandbox", label=label, backend=sandbox_backend()) as s:
+        traceparent = tracing.current_traceparent()
+        # The runner times each tool as a child span of this sandbox span
+        payload = json.dumps({**job, "trace": {"traceparent": traceparent}} if traceparent else job)
+
+        metrics.SANDBOX_WAITING.inc()
+        try:
+            await _semaphore().acquire()
+        finally:
+            metrics.SANDBOX_WAITING.dec()
+        started = time.perf_counter()
+        metrics.SANDBOX_IN_FLIGHT.inc()
+        try:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    # On the host the cgroup is not the sandbox's; don't report it
+                    env={**os.environ, "RUNNER_CGROUP_STATS": "0"} if container is None else None,
+                    # Own process group, so a kill reaches the tools the local runner started
+                    start_new_session=container is None,
+                )
+            except FileNotFoundError as e:
+                raise SandboxError("Docker executable not found. Is Docker Desktop installed and in PATH?") from e
+
+            try:
+                out, err = await asyncio.wait_for(proc.communicate(payload.encode()), timeout)
+            except asyncio.TimeoutError as e:
+                metrics.SANDBOX_KILLED.inc(reason="timeout")
+                await _kill(proc, container)
+                raise SandboxError(f"Docker run timed out after {timeout}s") from e
+            except asyncio.CancelledError:
+                metrics.SANDBOX_KILLED.inc(reason="cancelled")
+                await _kill(proc, container)
+                raise
+        finally:
+            metrics.SANDBOX_IN_FLIGHT.dec()
+            _semaphore().release()
+        wall_ms = (time.perf_counter() - started) * 1000
+        stdout = out.decode(errors="replace")
+        stderr = err.decode(errors="replace")
+
+        if proc.returncode != 0:
+            # Include both stderr and stdout for debugging; containers sometimes write errors to stdout.
+            raise SandboxError(f"Docker run failed (rc={proc.returncode}).\nSTDERR:\n{stderr[:4000]}\nSTDOUT:\n{stdout[:4000]}")
+
+        # runner should print JSON; if not, surface a readable error
+        try:
+            result = json.loads(stdout)
+        except json.JSONDecodeError as e:
+            raise SandboxError(
+                "Container returned non-JSON output.\n"
+                f"STDOUT:\n{stdout[:4000]}\nSTDERR:\n{stderr[:4000]}"
+            ) from e
+
+        # Per-tool timings reported by the runner; whatever is left of the
+        # wall time is container start-up/teardown.
+        tool_ms = 0.0
+        for key in TOOL_KEYS:
+            tool = result.get(key)
+            if isinstance(tool, dict) and tool.get("duration_ms") is not None:
+                tool_ms += tool["duration_ms"]
+                resources = {k: tool[k] for k in RESOURCE_KEYS if tool.get(k) is not None}
+                add_span(
+                    key, tool["duration_ms"], label=label,
+                    outcome="timeout" if tool.get("timeout") else "ok",
+                    returncode=tool.get("returncode"),
+                    **resources,
+                )
+                if resources:
+                    cpu_s = (resources.get("cpu_user_ms", 0) + resources.get("cpu_sys_ms", 0)) / 1000
+                    metrics.SANDBOX_TOOL_CPU.inc(cpu_s, tool=key)
+        s["overhead_ms"] = round(max(wall_ms - tool_ms, 0.0), 1)
+        tracing.export(result.pop("spans", None), service_name="challenge-runner")
+        if result.get("container"):
+            s["container"] = result["container"]
+        return result
+
+async def run_many_async(jobs: Sequence[Dict[str, Any]], timeout: int = RUN_TIMEOUT,
+                         labels: Optional[Sequence[Optional[str]]] = None) -> List[Dict[str, Any]]:
+    """
+    Run several jobs concurrently (bounded by sandbox_concurrency()) and
+    return their results in order. Every run finishes or is killed before
+    the first error, if any, is raised.
+    """
+    labels = labels or [None] * len(jobs)
+    results = await asyncio.gather(
+        *(run_in_container_async(job, timeout, label) for job, label in zip(jobs, labels)),
+        return_exceptions=True,
+    )
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return list(results)
+
+# --- Sync wrappers for Celery tasks and scripts --------------------------------
+# Each call runs its own event loop, so they must not be called from async code
+# (await the *_async functions there instead).
+
+def run_in_container(job: Dict[str, Any], timeout: int = RUN_TIMEOUT, label: Optional[str] = None) -> Dict[str, Any]:
+    return asyncio.run(run_in_container_async(job, timeout, label))
+
+def run_many(jobs: Sequence[Dict[str, Any]], timeout: int = RUN_TIMEOUT,
+             labels: Optional[Sequence[Optional[str]]] = None) -> List[Dict[str, Any]]:
+    return asyncio.run(run_many_async(jobs, timeout, labels))
@@ -0,0 +1,85 @@
+"""
+Failure classes of the generation pipeline.
+
+A generation attempt can fail for two different reasons, which are
+handled differently by generate_challenge:
+
+- CandidateError: the LLM's bundle is unusable (unparseable, missing
+  fields). Retrying it can't help; the attempt is spent and the next one
+  asks the LLM for a new bundle.
+- InfrastructureError: something the candidate can't be blamed for went
+  wrong (the sandbox or Docker daemon, a network error, an LLM timeout or
+  rate limit). The same stage is retried with the same input through
+  ``retry_stage``, and the attempt is not spent.
+"""
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateError(ValueError):
+    """The LLM returned a bundle that can't be used."""
+
+
+class InfrastructureError(RuntimeError):
+    """A transient failure outside the candidate; retrying the stage may succeed."""
+
+
+class SandboxError(InfrastructureError):
+    """The sandbox run itself failed (Docker, the runner), as opposed to the tests failing."""
+
+
+class LLMTransientError(InfrastructureError):
+    """The LLM call timed out, could not connect, was rate limited or hit a server error."""
+
+
+# Exception classes of the openai and anthropic SDKs that are worth retrying
+# (matched by name so neither package has to be importable here)
+_TRANSIENT_LLM_ERRORS = {
+    "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError", "OverloadedError",
+}
+_TRANSIENT_STATUS = {408, 409, 429}
+
+
+def is_transient_llm_error(exc):
+    if any(cls.__name__ in _TRANSIENT_LLM_ERRORS for cls in type(exc).__mro__):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and (status in _TRANSIENT_STATUS or status >= 500)
+
+
+def backoff_delay(retry, base=None, cap=None):
+    """Seconds to wait before retry number ``retry`` (1-based): exponential, capped, full jitter."""
+    base = settings.GENERATION_RETRY_BASE_DELAY if base is None else base
+    cap = settings.GENERATION_RETRY_MAX_DELAY if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** (retry - 1)))
+
+
+def retry_stage(stage, fn, retries=None, on_retry=None, sleep=time.sleep):
+    """
+    Call ``fn()``, retrying it up to ``retries`` (GENERATION_STAGE_RETRIES)
+    times while it raises InfrastructureError. ``on_retry(retry, exc)``
+    runs before each backoff sleep. The last error propagates; any other
+    exception propagates at once.
+    """
+    retries = settings.GENERATION_STAGE_RETRIES if retries is None else retries
+    retry = 0
+    while True:
+        try:
+            return fn()
+        except InfrastructureError as exc:
+            if retry >= retries:
+                raise
+            retry += 1
+            delay = backoff_delay(retry)
+            metrics.STAGE_RETRIES.inc(stage=stage, error=type(exc).__name__)
+            logger.warning("%s failed (%.200s), retry %d/%d in %.1fs", stage, exc, retry, retries, delay)
+            if on_retry is not None:
+                on_retry(retry, exc)
+            sleep(delay)
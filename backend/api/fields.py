@@ -0,0 +1,68 @@
+"""
+Model fields.
+
+CompressedJSONField stores a JSON value as a compressed blob. The first
+byte names the codec ("z" zlib, "s" zstd), so rows written with either
+codec can be read back whatever ARTIFACT_COMPRESSION is set to now. zstd
+needs the optional ``zstandard`` package; without it, zlib is used. The
+column can't be queried by JSON key; filter on regular columns instead.
+"""
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is always available
+    zstandard = None
+
+ZLIB, ZSTD = b"z", b"s"
+
+
+def compress(data: bytes, codec: str = "") -> bytes:
+    codec = codec or getattr(settings, "ARTIFACT_COMPRESSION", "zlib")
+    if codec == "zstd" and zstandard is not None:
+        return ZSTD + zstandard.ZstdCompressor(level=10).compress(data)
+    return ZLIB + zlib.compress(data, 6)
+
+
+def decompress(blob: bytes) -> bytes:
+    blob = bytes(blob)  # memoryview from some backends
+    marker, payload = blob[:1], blob[1:]
+    if marker == ZLIB:
+        return zlib.decompress(payload)
+    if marker == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("This row is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown compression marker {marker!r}")
+
+
+class CompressedJSONField(models.BinaryField):
+    description = "JSON, stored compressed"
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("editable", False)
+        super().__init__(*args, **kwargs)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return json.loads(decompress(value))
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return json.loads(decompress(value))
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return compress(json.dumps(value, cls=DjangoJSONEncoder, separators=(",", ":")).encode())
+
+    def value_to_string(self, obj):
+        # dumpdata/loaddata: plain JSON rather than the base64 blob BinaryField would write
+        return self.value_from_object(obj)
@@ -0,0 +1,171 @@
+"""
+Liveness of running generations.
+
+A worker claims a GenerationRequest before working on it (``claim``),
+which records its Celery task id as the owner and counts the run. While it
+works it writes ``heartbeat_at`` at every stage boundary, and every
+GENERATION_HEARTBEAT_INTERVAL seconds from a thread (``beating``) during the
+LLM and sandbox stages, which can outlast GENERATION_STALE_AFTER when a
+call is slow or waits for a sandbox slot. It keeps the LLM candidate it is verifying in ``candidate``, so a run that dies mid-way
+can be resumed without paying for the LLM call again. A run that gives up
+on a sandbox or LLM that keeps failing (errors.InfrastructureError) leaves
+its candidate the same way when generate_challenge queues it again.
+
+``reap`` (the reap_stale_generations task, scheduled by Celery beat) finds
+requests whose worker went quiet for GENERATION_STALE_AFTER seconds, or
+that sat queued for GENERATION_QUEUED_TIMEOUT, and queues them again; after
+GENERATION_MAX_RUNS runs (a requeue of a request never claimed counts as
+one) they are marked failed instead. Every write made
+on behalf of a run is fenced on its task id, so a run that was given up on
+but is still going cannot overwrite its successor.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .errors import InfrastructureError
+from .models import GenerationRequest
+from .queues import enqueue_generation, settle_followers
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class LostOwnership(RuntimeError):
+    """The request was reaped and handed to another run while this one was working."""
+
+
+def claim(generation_id, task_id):
+    """
+    Take ownership of a generation for the Celery task ``task_id``; False if
+    it is finished or another live run owns it. A redelivery of the same
+    task (acks_late after a worker crash) may take over its own claim.
+    """
+    now = timezone.now()
+    claimable = Q(status="queued") | Q(status="running", heartbeat_at__lt=now - stale_after())
+    if task_id:
+        claimable |= Q(status="running", task_id=task_id)
+    return GenerationRequest.objects.filter(claimable, id=generation_id).update(
+        status="running", task_id=task_id or "", started_at=now, heartbeat_at=now, runs=F("runs") + 1,
+    ) == 1
+
+
+def owned(gr):
+    """Queryset of ``gr`` that only matches while this run still owns it."""
+    return GenerationRequest.objects.filter(id=gr.id, status="running", task_id=gr.task_id)
+
+
+def beat(gr, candidate=_UNSET):
+    """Record that the run is alive; optionally set or clear (None) the saved candidate."""
+    fields = {"heartbeat_at": timezone.now()}
+    if candidate is not _UNSET:
+        fields["candidate"] = candidate
+        gr.candidate = candidate
+    if not owned(gr).update(**fields):
+        raise LostOwnership(f"Generation {gr.id} is no longer owned by task {gr.task_id or '(direct call)'}")
+
+
+@contextmanager
+def beating(gr):
+    """
+    Beat every GENERATION_HEARTBEAT_INTERVAL seconds from a thread while the
+    block runs. If the run lost ownership meanwhile, LostOwnership is raised
+    when the block ends (unless it raised something itself).
+    """
+    done = threading.Event()
+    lost = []
+
+    def pulse():
+        try:
+            while not done.wait(settings.GENERATION_HEARTBEAT_INTERVAL):
+                try:
+                    beat(gr)
+                except LostOwnership as exc:
+                    lost.append(exc)
+                    return
+                except Exception:
+                    logger.exception("Heartbeat of generation %s failed", gr.id)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=pulse, name=f"heartbeat-{gr.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+    if lost:
+        raise lost[0]
+
+
+@contextmanager
+def attempt_scope(gr):
+    """
+    Beat when an attempt starts; forget its candidate when it ends in-process,
+    unless it ends in an InfrastructureError (the candidate was not at fault).
+    """
+    beat(gr)
+    try:
+        yield
+    except InfrastructureError:
+        raise
+    except BaseException:
+        _forget_candidate(gr)
+        raise
+    else:
+        _forget_candidate(gr)
+
+
+def _forget_candidate(gr):
+    # Only a run that dies outright, or gives up on the infrastructure, leaves its
+    # candidate behind for the next one. No ownership check: the attempt may have
+    # just finished the request.
+    gr.candidate = None
+    owned(gr).update(heartbeat_at=timezone.now(), candidate=None)
+
+
+def stale_after():
+    return timedelta(seconds=settings.GENERATION_STALE_AFTER)
+
+
+def reap(now=None):
+    """Queue stale requests again or fail them; returns {"requeued": [ids], "failed": [ids]}."""
+    now = now or timezone.now()
+    running_cutoff = now - stale_after()
+    queued_cutoff = now - timedelta(seconds=settings.GENERATION_QUEUED_TIMEOUT)
+    stale = GenerationRequest.objects.filter(coalesced_into=None).filter(
+        Q(status="running", heartbeat_at__lt=running_cutoff)
+        | Q(status="running", heartbeat_at=None, created_at__lt=running_cutoff)
+        | Q(status="queued", enqueued_at__lt=queued_cutoff)
+        | Q(status="queued", enqueued_at=None, created_at__lt=queued_cutoff)
+    )
+
+    reaped = {"requeued": [], "failed": []}
+    for gr in stale:
+        # Act only if nothing moved since the query (the worker may have just beaten)
+        unchanged = GenerationRequest.objects.filter(id=gr.id, status=gr.status, heartbeat_at=gr.heartbeat_at)
+        if gr.runs >= settings.GENERATION_MAX_RUNS:
+            gr.error = f"Gave up after {gr.runs} runs: the request went stale while {gr.status}"
+            gr.status = "failed"
+            if unchanged.update(status=gr.status, error=gr.error):
+                settle_followers(gr)
+                reaped["failed"].append(gr.id)
+        elif unchanged.update(status="queued", task_id="", runs=F("runs") + int(gr.status == "queued")):
+            # A request no worker ever picked up has no claim to count its runs,
+            # so each requeue counts as one
+            gr.runs += int(gr.status == "queued")
+            gr.status, gr.task_id = "queued", ""
+            enqueue_generation(gr)
+            reaped["requeued"].append(gr.id)
+
+    if reaped["requeued"] or reaped["failed"]:
+        logger.warning("Reaped stale generations: %s", reaped)
+    return reaped
@@ -0,0 +1,198 @@
+"""
+Stage timing for the challenge generation pipeline.
+
+generate_challenge wraps each attempt in ``record_attempt``; code anywhere
+below it (llm_generator, docker_runner) times its work with ``span`` and
+the spans land on that attempt's GenerationAttempt row. Outside an attempt
+(scripts, shell) ``span`` still times the block but records nothing, and
+importing this module doesn't need Django's app registry to be ready.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import metrics, tracing
+
+_active = contextvars.ContextVar("generation_attempt_recorder", default=None)
+
+
+class AttemptRecorder:
+    def __init__(self, number, vuln_type, seed_topic):
+        self.number = number
+        self.vuln_type = vuln_type
+        self.seed_topic = seed_topic
+        self.outcome = "rejected"
+        self.detail = ""
+        self.spans = []
+        self.bundle = None   # the candidate, once there is one
+        self.results = None  # {"secure": ..., "insecure": ...} once the sandbox has run
+        self.promoted_to = None  # the GeneratedChallenge of an accepted attempt
+        self.t0 = time.perf_counter()
+
+    def add(self, record):
+        self.spans.append(record)
+
+    def offset_ms(self, t):
+        return round((t - self.t0) * 1000, 1)
+
+    def tokens(self):
+        return (
+            sum(s.get("input_tokens", 0) for s in self.spans),
+            sum(s.get("output_tokens", 0) for s in self.spans),
+        )
+
+    def llm(self):
+        """(provider, model) of the last LLM call in this attempt."""
+        for s in reversed(self.spans):
+            if s["stage"] == "llm":
+                return s.get("provider", ""), s.get("model", "")
+        return "", ""
+
+
+def token_cost(model, input_tokens, output_tokens):
+    """USD cost of a call from settings.LLM_TOKEN_PRICES, or None if the model has no price."""
+    price = settings.LLM_TOKEN_PRICES.get(model)
+    if not price:
+        return None
+    return (input_tokens * price.get("input", 0) + output_tokens * price.get("output", 0)) / 1_000_000
+
+
+class TokenBudget:
+    """
+    LLM spend of one generation request against GENERATION_TOKEN_BUDGET and
+    GENERATION_COST_BUDGET_USD (0 = unlimited). record_attempt charges it
+    when an attempt ends; the caller checks ``exhausted()`` before the next.
+    """
+
+    def __init__(self, max_tokens=None, max_usd=None):
+        self.max_tokens = settings.GENERATION_TOKEN_BUDGET if max_tokens is None else max_tokens
+        self.max_usd = settings.GENERATION_COST_BUDGET_USD if max_usd is None else max_usd
+        self.tokens = 0
+        self.usd = 0.0
+
+    def charge(self, model, input_tokens, output_tokens):
+        self.tokens += input_tokens + output_tokens
+        self.usd += token_cost(model, input_tokens, output_tokens) or 0.0
+
+    def charge_attempts(self, attempts):
+        """Charge the tokens of recorded GenerationAttempt rows, e.g. the earlier runs of a requeued request."""
+        totals = attempts.order_by().values_list("model").annotate(Sum("input_tokens"), Sum("output_tokens"))
+        for model, input_tokens, output_tokens in totals:
+            self.charge(model, input_tokens or 0, output_tokens or 0)
+
+    def exhausted(self):
+        """A reason string once a limit is reached, else ""."""
+        if self.max_tokens and self.tokens >= self.max_tokens:
+            return f"Token budget exhausted ({self.tokens}/{self.max_tokens} tokens)"
+        if self.max_usd and self.usd >= self.max_usd:
+            return f"Cost budget exhausted (${self.usd:.4f}/${self.max_usd:.4f})"
+        return ""
+
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Time a block as pipeline stage ``stage``.
+
+    Yields the span dict so the block can attach results such as
+    ``input_tokens``/``output_tokens``. An exception marks the span as
+    an error and propagates.
+    """
+    recorder = _active.get()
+    record = {"stage": stage, **attrs, "outcome": "ok"}
+    trace_span = tracing.begin(stage, **attrs)
+    start = time.perf_counter()
+    if recorder is not None:
+        record["start_ms"] = recorder.offset_ms(start)
+    try:
+        yield record
+    except BaseException as exc:
+        record["outcome"] = "error"
+        record["error"] = f"{type(exc).__name__}: {exc}"[:500]
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if recorder is not None:
+            recorder.add(record)
+        if trace_span is not None:
+            trace_span.set(**{k: v for k, v in record.items() if k not in ("stage", "start_ms", "error")})
+            tracing.end(trace_span, record.get("error"))
+
+
+def add_span(stage, duration_ms, **attrs):
+    """Record a stage timed elsewhere (e.g. a tool run inside the sandbox)."""
+    recorder = _active.get()
+    if recorder is not None:
+        recorder.add({"stage": stage, "outcome": "ok", **attrs, "duration_ms": duration_ms})
+
+
+@contextmanager
+def record_attempt(generation, number, vuln_type, seed_topic="", budget=None):
+    """
+    Collect the spans of one generation attempt and persist them.
+
+    The block sets ``recorder.outcome`` (and optionally ``detail``,
+    ``bundle``, ``results`` and ``promoted_to``, which are stored with it); if it raises,
+    the attempt is stored with outcome "error" before the exception
+    propagates. A one-line summary is appended to ``generation.logs``, and
+    the attempt's tokens are charged to ``budget`` if given.
+    """
+    recorder = AttemptRecorder(number, vuln_type, seed_topic)
+    trace_span = tracing.begin(f"attempt {number}", attempt=number, vuln_type=vuln_type, seed_topic=seed_topic)
+    token = _active.set(recorder)
+    started_at = timezone.now()
+    try:
+        yield recorder
+    except BaseException as exc:
+        recorder.outcome = "error"
+        recorder.detail = f"{type(exc).__name__}: {exc}"[:4000]
+        raise
+    finally:
+        _active.reset(token)
+        if trace_span is not None:
+            trace_span.set(outcome=recorder.outcome)
+            tracing.end(trace_span, recorder.detail if recorder.outcome == "error" else None)
+        duration_ms = recorder.offset_ms(time.perf_counter())
+        input_tokens, output_tokens = recorder.tokens()
+        provider, model = recorder.llm()
+        if budget is not None:
+            budget.charge(model, input_tokens, output_tokens)
+        from .models import GenerationAttempt
+
+        GenerationAttempt.objects.create(
+            generation=generation,
+            number=number,
+            vuln_type=vuln_type,
+            seed_topic=seed_topic,
+            provider=provider,
+            model=model,
+            outcome=recorder.outcome,
+            detail=recorder.detail,
+            started_at=started_at,
+            duration_ms=duration_ms,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            spans=recorder.spans,
+            bundle=recorder.bundle,
+            bundle_sha=GenerationAttempt.bundle_digest(recorder.bundle),
+            results=recorder.results,
+            promoted_to=recorder.promoted_to,
+        )
+
+        metrics.GENERATION_ATTEMPTS.inc(vuln_type=vuln_type, outcome=recorder.outcome)
+        if recorder.outcome == "accepted":
+            metrics.GENERATION_ACCEPTED.inc(vuln_type=vuln_type)
+        for s in recorder.spans:
+            metrics.STAGE_DURATION.observe(s["duration_ms"] / 1000, stage=s["stage"], vuln_type=vuln_type)
+
+        stages = ", ".join(f"{s['stage']} {s['duration_ms'] / 1000:.1f}s" for s in recorder.spans if "start_ms" in s)
+        generation.logs += (
+            f"[{started_at:%H:%M:%S}] attempt {number} {vuln_type}: {recorder.outcome} "
+            f"in {duration_ms / 1000:.1f}s" + (f" ({stages})" if stages else "")
+            + f", tokens in/out {input_tokens}/{output_tokens}\n"
+        )
+        generation.save(update_fields=["logs"])
@@ -0,0 +1,171 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import GeneratedChallenge, LeaderboardEntry, Result
+
+WINDOWS = ("all", "week", "month")
+
+
+def period_key(window, when=None):
+    """The period string of ``window`` that contains ``when`` (default: now)."""
+    if window == "all":
+        return "all"
+    when = timezone.localtime(when or timezone.now())
+    if window == "week":
+        year, week, _ = when.isocalendar()
+        return f"w{year}-{week:02d}"
+    if window == "month":
+        return f"m{when.year}-{when.month:02d}"
+    raise ValueError(f"Unknown leaderboard window: {window}")
+
+
+def _scopes(result, vuln_type):
+    for vt in {"", vuln_type or ""}:
+        for window in WINDOWS:
+            yield vt, period_key(window, result.created_at)
+
+
+def record_results(results):
+    """
+    Add freshly inserted results to the materialised leaderboard.
+
+    Deltas are summed per (user, vuln_type, period) and applied with a
+    single INSERT ... ON CONFLICT DO UPDATE, so a result costs one statement
+    however many scopes it touches.
+    """
+    results = list(results)
+    if not results:
+        return
+
+    vuln_by_challenge = {}
+    challenge_ids = {r.generated_challenge_id for r in results if r.generated_challenge_id}
+    if challenge_ids:
+        vuln_by_challenge = dict(
+            GeneratedChallenge.objects.filter(id__in=challenge_ids).values_list("id", "vuln_type")
+        )
+
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for r in results:
+        for vt, period in _scopes(r, vuln_by_challenge.get(r.generated_challenge_id)):
+            d = deltas[(r.user_id, vt, period)]
+            d[0] += r.score
+            d[1] += int(r.is_correct)
+            d[2] += 1
+
+    table = connection.ops.quote_name(LeaderboardEntry._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(deltas))
+    params = []
+    for (user_id, vt, period), (score, correct, total) in deltas.items():
+        params += [user_id, vt, period, score, correct, total, now]
+
+    # Supported by both SQLite (3.24+) and PostgreSQL
+    sql = (
+        f"INSERT INTO {table} (user_id, vuln_type, period, score, correct, total, updated_at) "
+        f"VALUES {rows} "
+        "ON CONFLICT (user_id, vuln_type, period) DO UPDATE SET "
+        f"score = {table}.score + excluded.score, "
+        f"correct = {table}.correct + excluded.correct, "
+        f"total = {table}.total + excluded.total, "
+        "updated_at = excluded.updated_at"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def rebuild(windows=WINDOWS, when=None):
+    """
+    Recompute the current period of each window from Result.
+
+    Corrects any drift from the incremental path (deleted results, inserts
+    that bypassed record_results, races between retries). Earlier periods
+    keep the totals they had when they closed.
+
+    Each period is replaced in one transaction that locks the leaderboard
+    before aggregating, so a result recorded meanwhile is either in the
+    aggregate or added by its record_results after the rebuild commits.
+    """
+    totals = {
+        "score_sum": Sum("score"),
+        "correct_count": Count("id", filter=Q(is_correct=True)),
+        "total_count": Count("id"),
+    }
+
+    for window in windows:
+        period = period_key(window, when)
+        with transaction.atomic():
+            _lock_entries()
+            # On SQLite the delete takes the database write lock before the aggregate reads
+            LeaderboardEntry.objects.filter(period=period).delete()
+
+            qs = Result.objects.all()
+            if window != "all":
+                qs = qs.filter(created_at__gte=_period_start(window, when))
+            rows = [("", row) for row in qs.values("user_id").annotate(**totals)]
+            # Results on static challenges have no vuln_type and only count globally
+            rows += [
+                (row["generated_challenge__vuln_type"], row)
+                for row in qs.filter(generated_challenge__isnull=False)
+                .values("user_id", "generated_challenge__vuln_type")
+                .annotate(**totals)
+            ]
+            LeaderboardEntry.objects.bulk_create([
+                LeaderboardEntry(
+                    user_id=row["user_id"], vuln_type=vt, period=period,
+                    score=row["score_sum"] or 0, correct=row["correct_count"], total=row["total_count"],
+                )
+                for vt, row in rows
+            ], batch_size=500)
+
+
+def _lock_entries():
+    """
+    Block record_results until the transaction ends. Its upserts wait for
+    the lock, and a writer that already upserted is waited for, so its
+    result is in the aggregate.
+    """
+    if connection.vendor == "postgresql":
+        table = connection.ops.quote_name(LeaderboardEntry._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+
+
+def _period_start(window, when=None):
+    when = timezone.localtime(when or timezone.now())
+    start = when.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == "week":
+        return start - timedelta(days=when.weekday())
+    return start.replace(day=1)
+
+
+def ranked(qs):
+    return qs.order_by("-score", "-correct", "total", "user_id")
+
+
+def top(vuln_type="", window="all", limit=10):
+    """Top ``limit`` entries with competition ranks (ties share a rank)."""
+    qs = ranked(LeaderboardEntry.objects.filter(vuln_type=vuln_type, period=period_key(window)))
+    rows = list(qs.select_related("user")[:limit])
+    out, rank, prev = [], 0, None
+    for i, entry in enumerate(rows, start=1):
+        key = (entry.score, entry.correct)
+        if key != prev:
+            rank, prev = i, key
+        out.append((rank, entry))
+    return out
+
+
+def rank_of(user, vuln_type="", window="all"):
+    """(rank, entry) for ``user`` in a scope, or (None, None) if they have no results there."""
+    scope = LeaderboardEntry.objects.filter(vuln_type=vuln_type, period=period_key(window))
+    entry = scope.filter(user=user).first()
+    if entry is None:
+        return None, None
+    ahead = scope.filter(
+        Q(score__gt=entry.score) | Q(score=entry.score, correct__gt=entry.correct)
+    ).count()
+    return ahead + 1, entry
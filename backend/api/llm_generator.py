@@ -1,39 +1,47 @@
 # backend/api/llm_generator.py
 import os
 import json
-from typing import Any, Dict, Optional, Literal
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Literal
 
-# Support both OpenAI and Anthropic
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    OpenAI = None  # type: ignore
+from .errors import CandidateError, InfrastructureError, LLMTransientError, is_transient_llm_error
+from .instrumentation import span
 
-try:
+if TYPE_CHECKING:
     from anthropic import Anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
-    Anthropic = None  # type: ignore
+    from openai import OpenAI
+
+# The SDKs are imported by the client getters on first use, so processes that
+# never call a provider (web, management commands, tests) don't pay for them.
+_openai_client: Optional["OpenAI"] = None
+_anthropic_client: Optional["Anthropic"] = None
 
-_openai_client: Optional["OpenAI"] = None  # type: ignore
-_anthropic_client: Optional["Anthropic"] = None  # type: ignore
+LLMProvider = Literal["openai", "anthropic", "replay"]
 
-LLMProvider = Literal["openai", "anthropic"]
+# Provider name -> generate(vuln_type, seed_topic, difficulty), filled by @register_provider
+PROVIDERS: Dict[str, Callable[[str, str, str], Dict[str, Any]]] = {}
+
+def register_provider(name: str):
+    def decorator(fn):
+        PROVIDERS[name] = fn
+        return fn
+    return decorator
 
 def get_provider() -> LLMProvider:
     """Determine which LLM provider to use based on environment variables."""
     provider = os.getenv("LLM_PROVIDER", "anthropic").lower()
-    if provider not in ["openai", "anthropic"]:
-        raise RuntimeError(f"Invalid LLM_PROVIDER: {provider}. Must be 'openai' or 'anthropic'")
+    if provider not in PROVIDERS:
+        raise RuntimeError(f"Invalid LLM_PROVIDER: {provider}. Must be one of: {', '.join(sorted(PROVIDERS))}")
     return provider
 
-def get_openai_client() -> OpenAI:
+def get_openai_client() -> "OpenAI":
     global _openai_client
     if _openai_client is None:
-        if not OPENAI_AVAILABLE:
+        try:
+            from openai import OpenAI
+        except ImportError:
             raise RuntimeError("OpenAI package not installed. Run: pip install openai")
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
@@ -41,10 +49,12 @@ def get_openai_client() -> OpenAI:
         _openai_client = OpenAI(api_key=api_key)
     return _openai_client
 
-def get_anthropic_client() -> Anthropic:
+def get_anthropic_client() -> "Anthropic":
     global _anthropic_client
     if _anthropic_client is None:
-        if not ANTHROPIC_AVAILABLE:
+        try:
+            from anthropic import Anthropic
+        except ImportError:
             raise RuntimeError("Anthropic package not installed. Run: pip install anthropic")
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
@@ -395,6 +405,7 @@ def test_security_check():
 ```
 """
 
+@register_provider("openai")
 def generate_with_openai(vuln_type: str, seed_topic: str, difficulty: str = "easy") -> Dict[str, Any]:
     """Generate challenge using OpenAI API."""
     client = get_openai_client()
@@ -403,22 +414,28 @@ def generate_with_openai(vuln_type: str, seed_topic: str, difficulty: str = "eas
     system_prompt = BASE_SYSTEM_PROMPT + "\n\n" + VULN_GUIDANCE.get(vuln_type, "")
     user_prompt = f"Create a {difficulty} {vuln_type} challenge about: {seed_topic}"
 
-    resp = client.chat.completions.create(
-        model=os.getenv("OPENAI_MODEL", "gpt-4o-2024-08-06"),
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        response_format={
-            "type": "json_schema",
-            "json_schema": CHALLENGE_SCHEMA
-        },
-        temperature=0.7,
-    )
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-2024-08-06")
+    with span("llm", provider="openai", model=model) as s:
+        resp = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": CHALLENGE_SCHEMA
+            },
+            temperature=0.7,
+        )
+        usage = getattr(resp, "usage", None)
+        s["input_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+        s["output_tokens"] = getattr(usage, "completion_tokens", 0) or 0
 
     content = resp.choices[0].message.content
     return json.loads(content)
 
+@register_provider("anthropic")
 def generate_with_anthropic(vuln_type: str, seed_topic: str, difficulty: str = "easy") -> Dict[str, Any]:
     """Generate challenge using Anthropic Claude API."""
     client = get_anthropic_client()
@@ -454,14 +471,19 @@ NOT from 'secure_code' or 'insecure_code' - those modules don't exist!
 
 Respond ONLY with the JSON, no other text."""
 
-    response = client.messages.create(
-        model=os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022"),
-        max_tokens=4096,
-        temperature=0.8,  # Higher temperature for more variety
-        messages=[
-            {"role": "user", "content": full_prompt}
-        ]
-    )
+    model = os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022")
+    with span("llm", provider="anthropic", model=model) as s:
+        response = client.messages.create(
+            model=model,
+            max_tokens=4096,
+            temperature=0.8,  # Higher temperature for more variety
+            messages=[
+                {"role": "user", "content": full_prompt}
+            ]
+        )
+        usage = getattr(response, "usage", None)
+        s["input_tokens"] = getattr(usage, "input_tokens", 0) or 0
+        s["output_tokens"] = getattr(usage, "output_tokens", 0) or 0
 
     # Extract JSON from response
     content = response.content[0].text
@@ -522,7 +544,7 @@ Respond ONLY with the JSON, no other text."""
     fix_exp = extract_field("fix", content) or "Use parameterized queries"
 
     if not all([secure_code, insecure_code, tests]):
-        raise ValueError(f"Could not extract required fields from Claude's response. Content: {content[:500]}")
+        raise CandidateError(f"Could not extract required fields from Claude's response. Content: {content[:500]}")
 
     # Build proper JSON structure
     return {
@@ -539,6 +561,48 @@ Respond ONLY with the JSON, no other text."""
         }
     }
 
+# Recorded bundles for LLM_PROVIDER=replay (benchmarks, offline development)
+DEFAULT_REPLAY_CORPUS = Path(__file__).resolve().parent.parent / "bench" / "bundles.jsonl"
+_replay_lock = threading.Lock()
+_replay_corpus: Optional[List[Dict[str, Any]]] = None
+_replay_cursor: Dict[str, int] = {}
+
+def _load_replay_corpus() -> List[Dict[str, Any]]:
+    global _replay_corpus
+    if _replay_corpus is None:
+        path = Path(os.getenv("LLM_REPLAY_CORPUS") or DEFAULT_REPLAY_CORPUS)
+        with open(path, encoding="utf-8") as f:
+            try:
+                _replay_corpus = [json.loads(line) for line in f if line.strip()]
+            except json.JSONDecodeError as e:
+                # A broken corpus, not a bad candidate
+                raise RuntimeError(f"Replay corpus {path} is not JSON lines: {e}") from e
+        if not _replay_corpus:
+            raise RuntimeError(f"Replay corpus {path} is empty")
+    return _replay_corpus
+
+@register_provider("replay")
+def generate_with_replay(vuln_type: str, seed_topic: str, difficulty: str = "easy") -> Dict[str, Any]:
+    """Return the next recorded bundle for vuln_type instead of calling an LLM.
+
+    Bundles rotate per vuln_type (any bundle if the type is not in the corpus).
+    The recorded token usage is reported, and LLM_REPLAY_SPEED scales the
+    recorded latency that is simulated (0, the default, replays instantly).
+    """
+    corpus = _load_replay_corpus()
+    candidates = [b for b in corpus if b["vuln_type"] == vuln_type] or corpus
+    with _replay_lock:
+        index = _replay_cursor.get(vuln_type, 0)
+        _replay_cursor[vuln_type] = index + 1
+    entry = json.loads(json.dumps(candidates[index % len(candidates)]))  # private copy
+    recording = entry.pop("recording", {})
+
+    with span("llm", provider="replay", model=recording.get("model", "")) as s:
+        time.sleep(recording.get("latency_ms", 0) / 1000 * float(os.getenv("LLM_REPLAY_SPEED", "0")))
+        s["input_tokens"] = recording.get("input_tokens", 0)
+        s["output_tokens"] = recording.get("output_tokens", 0)
+    return entry
+
 def generate_challenge_bundle(vuln_type: str, seed_topic: str, difficulty: str = "easy") -> Dict[str, Any]:
     """Generate a challenge bundle for any vulnerability type using the configured LLM provider.
 
@@ -549,15 +613,30 @@ def generate_challenge_bundle(vuln_type: str, seed_topic: str, difficulty: str =
 
     Returns:
         Dictionary containing secure_code, insecure_code, tests, and metadata
+
+    Raises:
+        LLMTransientError: the call timed out, was rate limited or hit a server error; worth retrying
+        CandidateError: the response is not a usable bundle; ask again
     """
     provider = get_provider()
-
-    if provider == "openai":
-        return generate_with_openai(vuln_type, seed_topic, difficulty)
-    elif provider == "anthropic":
-        return generate_with_anthropic(vuln_type, seed_topic, difficulty)
-    else:
-        raise RuntimeError(f"Unsupported provider: {provider}")
+    try:
+        bundle = PROVIDERS[provider](vuln_type, seed_topic, difficulty)
+    except (InfrastructureError, CandidateError):
+        raise
+    except json.JSONDecodeError as e:
+        # Only the response failing to decode; other ValueErrors (configuration, SDK misuse) propagate
+        raise CandidateError(f"Unusable {provider} response: {e}") from e
+    except Exception as e:
+        if is_transient_llm_error(e):
+            raise LLMTransientError(f"{provider}: {type(e).__name__}: {e}") from e
+        raise
+
+    if not isinstance(bundle, dict):
+        raise CandidateError(f"{provider} response is a {type(bundle).__name__}, not a bundle object")
+    missing = [k for k in CHALLENGE_SCHEMA["schema"]["required"] if k not in bundle]
+    if missing:
+        raise CandidateError(f"{provider} bundle is missing {', '.join(missing)}")
+    return bundle
 
 # Legacy function for backward compatibility
 def generate_bundle_sqli_easy(seed_topic: str = "users table lookup") -> Dict[str, Any]:
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.api import archive
+from backend.api.models import GeneratedChallenge
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the sandbox output of old generated challenges to compressed NDJSON archive files, "
+        "or read / restore archived output."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int,
+                            help="Archive challenges older than this (default: ARTIFACT_RETENTION_DAYS)")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived")
+        parser.add_argument("--show", type=int, metavar="ID", help="Print the verification block of a challenge")
+        parser.add_argument("--rehydrate", type=int, nargs="+", metavar="ID",
+                            help="Move archived verification blocks back into the database")
+
+    def handle(self, *args, **options):
+        if options["show"] is not None:
+            self.stdout.write(json.dumps(archive.load_verification(self._get(options["show"])), indent=2))
+            return
+
+        if options["rehydrate"]:
+            for challenge_id in options["rehydrate"]:
+                archive.rehydrate(self._get(challenge_id))
+                self.stdout.write(f"Rehydrated challenge {challenge_id}")
+            return
+
+        stats = archive.archive_old(options["older_than_days"], dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"{stats['challenges']} challenges would be archived")
+            return
+        self.stdout.write(
+            f"Archived {stats['challenges']} challenges ({stats['bytes_archived'] / 1e6:.1f} MB of JSON) "
+            f"into {', '.join(sorted(stats['files'])) or 'no files'} in {archive.archive_dir()}"
+        )
+
+    def _get(self, challenge_id):
+        try:
+            return GeneratedChallenge.objects.get(id=challenge_id)
+        except GeneratedChallenge.DoesNotExist:
+            raise CommandError(f"Generated challenge {challenge_id} does not exist.")
@@ -0,0 +1,55 @@
+from collections import defaultdict
+from datetime import timedelta
+import json
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.api.models import GenerationAttempt
+from backend.scripts._benchutil import percentile
+
+
+class Command(BaseCommand):
+    help = "Latency breakdown of generation attempts per vuln_type and pipeline stage."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7, help="Only attempts started in the last N days")
+        parser.add_argument("--vuln-type", help="Restrict to one vulnerability type")
+        parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+
+    def handle(self, *args, **options):
+        qs = GenerationAttempt.objects.filter(started_at__gte=timezone.now() - timedelta(days=options["days"]))
+        if options["vuln_type"]:
+            qs = qs.filter(vuln_type=options["vuln_type"])
+
+        durations = defaultdict(list)
+        for vuln_type, spans, total_ms in qs.values_list("vuln_type", "spans", "duration_ms").iterator():
+            durations[(vuln_type, "attempt")].append(total_ms)
+            for span in spans:
+                stage = span["stage"] + (f":{span['label']}" if span.get("label") else "")
+                durations[(vuln_type, stage)].append(span["duration_ms"])
+
+        rows = [
+            {
+                "vuln_type": vuln_type,
+                "stage": stage,
+                "count": len(values),
+                "mean_ms": round(statistics.fmean(values), 1),
+                "p50_ms": percentile(values, 0.50),
+                "p95_ms": percentile(values, 0.95),
+                "total_s": round(sum(values) / 1000, 1),
+            }
+            for (vuln_type, stage), values in sorted(durations.items())
+        ]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(f"{'VULN_TYPE':<16} {'STAGE':<20} {'N':>5} {'MEAN_MS':>10} {'P50_MS':>10} {'P95_MS':>10} {'TOTAL_S':>9}")
+        for r in rows:
+            self.stdout.write(
+                f"{r['vuln_type']:<16} {r['stage']:<20} {r['count']:>5} {r['mean_ms']:>10} "
+                f"{r['p50_ms']:>10} {r['p95_ms']:>10} {r['total_s']:>9}"
+            )
@@ -0,0 +1,57 @@
+import fnmatch
+import io
+import json
+import pstats
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.api.profiling import profile_dir
+
+
+class Command(BaseCommand):
+    help = "Aggregate the profile samples in PROFILE_DIR and print the top functions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--match", default="*",
+            help="Glob on sample names, e.g. 'view-user_stats*' or 'task-*generate_challenge*'",
+        )
+        parser.add_argument("--sort", choices=["cumulative", "tottime", "calls"], default="cumulative")
+        parser.add_argument("--limit", type=int, default=25, help="Number of functions to show")
+        parser.add_argument("--dir", help="Sample directory (default: PROFILE_DIR)")
+        parser.add_argument("--json", action="store_true", help="Print JSON instead of a pstats table")
+
+    def handle(self, *args, **options):
+        directory = Path(options["dir"]) if options["dir"] else profile_dir()
+        files = sorted(p for p in directory.glob("*.prof") if fnmatch.fnmatch(p.name, options["match"]))
+        if not files:
+            raise CommandError(f"No samples matching {options['match']!r} in {directory}")
+
+        stats = pstats.Stats(str(files[0]), stream=io.StringIO())
+        for path in files[1:]:
+            stats.add(str(path))
+        stats.sort_stats(options["sort"])
+
+        if options["json"]:
+            rows = []
+            for func in stats.fcn_list[:options["limit"]]:
+                cc, nc, tt, ct, _ = stats.stats[func]
+                filename, line, name = func
+                rows.append({
+                    "function": f"{filename}:{line}({name})",
+                    "calls": nc,
+                    "tottime_s": round(tt, 6),
+                    "cumtime_s": round(ct, 6),
+                    # Per sample, so numbers stay comparable as the sample count changes
+                    "cumtime_per_sample_ms": round(ct / len(files) * 1000, 3),
+                })
+            self.stdout.write(json.dumps({"samples": len(files), "sort": options["sort"], "functions": rows}, indent=2))
+            return
+
+        self.stdout.write(f"{len(files)} samples matching {options['match']!r} in {directory}")
+        out = io.StringIO()
+        stats.stream = out
+        stats.files = []  # don't list every sample file in the header
+        stats.print_stats(options["limit"])
+        self.stdout.write(out.getvalue())
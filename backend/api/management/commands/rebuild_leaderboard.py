@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from backend.api import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recompute the current leaderboard periods from all results (e.g. after a backfill)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--window", choices=leaderboard.WINDOWS, action="append",
+            help="Window to rebuild (repeatable). Defaults to all windows.",
+        )
+
+    def handle(self, *args, **options):
+        windows = options["window"] or leaderboard.WINDOWS
+        leaderboard.rebuild(windows)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt leaderboard: {', '.join(windows)}"))
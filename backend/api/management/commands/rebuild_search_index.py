@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from backend.api import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of generated challenges from their artifacts."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        search.create_schema(connection)
+        with transaction.atomic():
+            count = search.rebuild()
+        self.stdout.write(
+            f"Indexed {count} challenges ({connection.vendor}) in {time.perf_counter() - started:.1f}s"
+        )
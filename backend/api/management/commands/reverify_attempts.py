@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from backend.api import reverify
+
+
+class Command(BaseCommand):
+    help = (
+        "Run stored rejected/errored generation candidates through the sandbox again (e.g. after a runner "
+        "image fix) and promote the ones that pass to generated challenges, without LLM calls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only attempts started at or after this date or ISO datetime")
+        parser.add_argument("--vuln-type", action="append", default=[], help="Only these vuln types (repeatable)")
+        parser.add_argument("--outcome", action="append", choices=["rejected", "error", "invalid"],
+                            help="Attempt outcomes to re-verify (repeatable; default: rejected and error)")
+        parser.add_argument("--include-reverified", action="store_true",
+                            help="Also attempts that were re-verified before without passing")
+        parser.add_argument("--limit", type=int, help="Re-verify at most this many attempts")
+        parser.add_argument("--batch-size", type=int, default=50, help="Attempts run through the sandbox at once")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the candidates")
+        parser.add_argument("--enqueue", action="store_true",
+                            help="Run as a reverify_attempts task on the bulk queue instead of in this process")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None and parse_date(options["since"]) is not None:
+                since = parse_datetime(options["since"] + "T00:00:00")
+            if since is None:
+                raise CommandError(f"--since: not a date or datetime: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        if options["enqueue"]:
+            from backend.api.tasks import reverify_attempts
+
+            result = reverify_attempts.delay(
+                since=since.isoformat() if since else None,
+                vuln_types=options["vuln_type"],
+                outcomes=options["outcome"],
+                include_reverified=options["include_reverified"],
+                limit=options["limit"],
+            )
+            self.stdout.write(f"Queued reverify_attempts task {result.id}")
+            return
+
+        started = time.perf_counter()
+        stats = reverify.reverify(
+            since=since,
+            vuln_types=options["vuln_type"],
+            outcomes=options["outcome"] or reverify.REVERIFY_OUTCOMES,
+            include_reverified=options["include_reverified"],
+            limit=options["limit"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"{stats['candidates']} attempts would be re-verified")
+            return
+        self.stdout.write(
+            f"Re-verified {stats['candidates']} attempts in {time.perf_counter() - started:.1f}s: "
+            f"{len(stats['promoted'])} promoted, {stats['rejected']} rejected, {stats['errors']} sandbox errors, "
+            f"{stats['duplicates']} duplicate bundles skipped"
+        )
+        if stats["promoted"]:
+            self.stdout.write("New challenges: " + ", ".join(map(str, stats["promoted"])))
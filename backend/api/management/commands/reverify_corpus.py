@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.api import reverify
+from backend.api.docker_runner import runner_image_digest
+from backend.api.errors import SandboxError
+from backend.api.models import ReverificationRun
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-verify every generated challenge against the current runner image in checkpointed batches; "
+        "challenges that no longer pass are marked stale and stop being served."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--resume", type=int, metavar="RUN_ID", help="Continue an interrupted or failed run")
+        parser.add_argument("--status", action="store_true", help="Show the most recent runs and exit")
+        parser.add_argument("--batch-size", type=int, default=50,
+                            help="Challenges verified at once between checkpoints (SANDBOX_CONCURRENCY bounds the runs)")
+        parser.add_argument("--all", action="store_true",
+                            help="Also re-check challenges this runner image has verified already")
+        parser.add_argument("--enqueue", action="store_true",
+                            help="Run as reverify_corpus tasks on the bulk queue instead of in this process")
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            for run in ReverificationRun.objects.order_by("-id")[:10]:
+                self.stdout.write(self._progress(run) + (f" - {run.error[:200]}" if run.error else ""))
+            return
+
+        if options["resume"] is not None:
+            try:
+                run = reverify.resume_run(options["resume"])
+            except ReverificationRun.DoesNotExist:
+                raise CommandError(f"No unfinished re-verification run {options['resume']}.")
+        else:
+            try:
+                digest = runner_image_digest(max_age=0)
+            except SandboxError as e:
+                raise CommandError(str(e))
+            unfinished = ReverificationRun.objects.filter(status="running", image_digest=digest).first()
+            if unfinished is not None:
+                raise CommandError(
+                    f"Run {unfinished.id} for this runner image is unfinished; continue it with --resume {unfinished.id}."
+                )
+            run = reverify.start_run(options["batch_size"], include_verified=options["all"])
+            self.stdout.write(f"Run {run.id}: {run.total} challenges to verify against {run.image_digest}")
+
+        if options["enqueue"]:
+            from backend.api.tasks import reverify_corpus
+
+            reverify_corpus.delay(run.id)
+            self.stdout.write(f"Queued run {run.id}; follow it with --status")
+            return
+
+        started = time.perf_counter()
+        while reverify.run_batch(run):
+            self.stdout.write(self._progress(run) + f" ({time.perf_counter() - started:.0f}s)")
+        run.refresh_from_db()
+        self.stdout.write(self._progress(run))
+        if run.status == "failed":
+            raise CommandError(f"Run {run.id} failed: {run.error[:500]}. Fix the cause, then --resume {run.id}.")
+        if run.errors:
+            self.stdout.write(f"{run.errors} challenges hit sandbox errors; run again to retry only those.")
+
+    def _progress(self, run):
+        return (
+            f"Run {run.id} [{run.status}] {run.checked + run.errors}/{run.total}: "
+            f"{run.passed} passed, {run.failed} failed ({run.regressed} newly stale), "
+            f"{run.restored} restored, {run.errors} errors"
+        )
@@ -0,0 +1,81 @@
+from collections import defaultdict
+from datetime import timedelta
+import json
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.api.docker_runner import TOOL_KEYS
+from backend.api.models import GenerationAttempt
+from backend.scripts._benchutil import percentile
+
+
+class Command(BaseCommand):
+    help = "Wall time, CPU time and peak memory of each sandbox tool, aggregated from generation attempts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7, help="Only attempts started in the last N days")
+        parser.add_argument("--vuln-type", help="Restrict to one vulnerability type")
+        parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+
+    def handle(self, *args, **options):
+        qs = GenerationAttempt.objects.filter(started_at__gte=timezone.now() - timedelta(days=options["days"]))
+        if options["vuln_type"]:
+            qs = qs.filter(vuln_type=options["vuln_type"])
+
+        wall, cpu, rss = defaultdict(list), defaultdict(list), defaultdict(list)
+        for spans in qs.values_list("spans", flat=True).iterator():
+            for span in spans:
+                stage = span["stage"]
+                if stage in TOOL_KEYS:
+                    wall[stage].append(span["duration_ms"])
+                    if "cpu_user_ms" in span:
+                        cpu[stage].append(span["cpu_user_ms"] + span.get("cpu_sys_ms", 0))
+                    if "max_rss_kb" in span:
+                        rss[stage].append(span["max_rss_kb"])
+                elif stage == "sandbox" and span.get("container"):
+                    # Whole-container figures (cgroup v2), for sizing the container limits
+                    container = span["container"]
+                    wall["container"].append(span["duration_ms"])
+                    if "cpu_user_ms" in container:
+                        cpu["container"].append(container["cpu_user_ms"] + container.get("cpu_sys_ms", 0))
+                    if "memory_peak_kb" in container:
+                        rss["container"].append(container["memory_peak_kb"])
+
+        total_cpu = sum(sum(cpu[t]) for t in TOOL_KEYS) or None
+        rows = []
+        for tool in [*TOOL_KEYS, "container"]:
+            if not wall[tool]:
+                continue
+            rows.append({
+                "tool": tool,
+                "runs": len(wall[tool]),
+                "wall_p50_ms": percentile(wall[tool], 0.50),
+                "wall_p95_ms": percentile(wall[tool], 0.95),
+                "cpu_mean_ms": round(statistics.fmean(cpu[tool]), 1) if cpu[tool] else None,
+                "cpu_total_s": round(sum(cpu[tool]) / 1000, 1) if cpu[tool] else None,
+                # Share of the CPU spent by all tools; shows which analyzer dominates sandbox cost
+                "cpu_share": (
+                    round(sum(cpu[tool]) / total_cpu, 3) if cpu[tool] and total_cpu and tool != "container" else None
+                ),
+                "rss_p95_mb": round(percentile(rss[tool], 0.95) / 1024, 1) if rss[tool] else None,
+                "rss_max_mb": round(max(rss[tool]) / 1024, 1) if rss[tool] else None,
+            })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        def cell(value):
+            return "-" if value is None else value
+
+        self.stdout.write(
+            f"{'TOOL':<10} {'RUNS':>6} {'WALL_P50':>9} {'WALL_P95':>9} {'CPU_MEAN':>9} {'CPU_S':>8} "
+            f"{'SHARE':>6} {'RSS_P95MB':>10} {'RSS_MAXMB':>10}"
+        )
+        for r in rows:
+            self.stdout.write(
+                f"{r['tool']:<10} {r['runs']:>6} {r['wall_p50_ms']:>9} {r['wall_p95_ms']:>9} {cell(r['cpu_mean_ms']):>9} "
+                f"{cell(r['cpu_total_s']):>8} {cell(r['cpu_share']):>6} {cell(r['rss_p95_mb']):>10} {cell(r['rss_max_mb']):>10}"
+            )
@@ -0,0 +1,75 @@
+from collections import defaultdict
+from datetime import timedelta
+import json
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.api.instrumentation import token_cost
+from backend.api.models import GenerationAttempt
+
+DIMENSIONS = ("provider", "model", "vuln_type", "seed_topic")
+
+
+class Command(BaseCommand):
+    help = "LLM tokens (and cost, with LLM_TOKEN_PRICES) per accepted challenge, grouped by provider/model/vuln_type/seed topic."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7, help="Only attempts started in the last N days")
+        parser.add_argument(
+            "--by", default=",".join(DIMENSIONS),
+            help=f"Comma-separated grouping, any of {', '.join(DIMENSIONS)} (default: all)",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+
+    def handle(self, *args, **options):
+        by = [d for d in options["by"].split(",") if d]
+        unknown = set(by) - set(DIMENSIONS)
+        if unknown:
+            self.stderr.write(f"Unknown dimension(s): {', '.join(sorted(unknown))}")
+            return
+
+        qs = GenerationAttempt.objects.filter(started_at__gte=timezone.now() - timedelta(days=options["days"]))
+
+        groups = defaultdict(lambda: {"attempts": 0, "accepted": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": None})
+        fields = ["model", "outcome", "input_tokens", "output_tokens", *by]
+        for row in qs.values(*fields).iterator():
+            g = groups[tuple(row[d] for d in by)]
+            g["attempts"] += 1
+            g["accepted"] += row["outcome"] == "accepted"
+            g["input_tokens"] += row["input_tokens"]
+            g["output_tokens"] += row["output_tokens"]
+            cost = token_cost(row["model"], row["input_tokens"], row["output_tokens"])
+            if cost is not None:
+                g["cost_usd"] = (g["cost_usd"] or 0.0) + cost
+
+        rows = []
+        for key, g in sorted(groups.items()):
+            tokens = g["input_tokens"] + g["output_tokens"]
+            rows.append({
+                **dict(zip(by, key)),
+                **g,
+                "cost_usd": round(g["cost_usd"], 4) if g["cost_usd"] is not None else None,
+                "acceptance_rate": round(g["accepted"] / g["attempts"], 3),
+                "tokens_per_accept": round(tokens / g["accepted"]) if g["accepted"] else None,
+                "cost_per_accept_usd": (
+                    round(g["cost_usd"] / g["accepted"], 4) if g["accepted"] and g["cost_usd"] is not None else None
+                ),
+            })
+        # Least efficient first: groups that never got accepted, then by tokens per accept
+        rows.sort(key=lambda r: (r["tokens_per_accept"] is not None, -(r["tokens_per_accept"] or 0)))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        widths = {"provider": 10, "model": 28, "vuln_type": 16, "seed_topic": 28}
+        header = " ".join(f"{d.upper():<{widths[d]}}" for d in by)
+        self.stdout.write(f"{header} {'N':>5} {'ACC':>5} {'IN_TOK':>10} {'OUT_TOK':>10} {'TOK/ACC':>9} {'USD/ACC':>9}")
+        for r in rows:
+            key = " ".join(f"{str(r[d])[:widths[d]]:<{widths[d]}}" for d in by)
+            self.stdout.write(
+                f"{key} {r['attempts']:>5} {r['accepted']:>5} {r['input_tokens']:>10} {r['output_tokens']:>10} "
+                f"{r['tokens_per_accept'] if r['tokens_per_accept'] is not None else '-':>9} "
+                f"{r['cost_per_accept_usd'] if r['cost_per_accept_usd'] is not None else '-':>9}"
+            )
@@ -0,0 +1,157 @@
+from collections import defaultdict
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _load(paths):
+    """Spans from OTLP/JSON lines files, as flat dicts with times in ms."""
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                for rs in json.loads(line).get("resourceSpans", []):
+                    service = next(
+                        (a["value"].get("stringValue") for a in rs.get("resource", {}).get("attributes", [])
+                         if a["key"] == "service.name"),
+                        "",
+                    )
+                    for ss in rs.get("scopeSpans", []):
+                        for s in ss.get("spans", []):
+                            spans.append({
+                                "trace_id": s["traceId"],
+                                "span_id": s["spanId"],
+                                "parent_id": s.get("parentSpanId", ""),
+                                "name": s["name"],
+                                "service": service,
+                                "start": int(s["startTimeUnixNano"]) / 1e6,
+                                "end": int(s["endTimeUnixNano"]) / 1e6,
+                                "error": s.get("status", {}).get("code") == 2,
+                            })
+    return spans
+
+
+def _critical_path(span, children, depth=0):
+    """
+    The chain of spans that decided when ``span`` finished: walking back from
+    its end, take the child that finished last, then the last one to finish
+    before that child started, and so on, recursing into each. Yields
+    (depth, span, self_ms) in start order, where self_ms is the part of the
+    span not covered by its critical children.
+    """
+    cursor = max([span["end"], *(c["end"] for c in children[span["span_id"]])])
+    chosen = []
+    for child in sorted(children[span["span_id"]], key=lambda c: -c["end"]):
+        if child["end"] <= cursor:
+            chosen.append(child)
+            cursor = child["start"]
+    covered = sum(min(c["end"], span["end"]) - max(c["start"], span["start"]) for c in chosen)
+    yield depth, span, max(span["end"] - span["start"] - max(covered, 0), 0)
+    for child in reversed(chosen):
+        yield from _critical_path(child, children, depth + 1)
+
+
+class Command(BaseCommand):
+    help = "Summarise traces written to TRACE_FILE: slowest generations and their critical path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="*", help="Trace files (default: settings.TRACE_FILE)")
+        parser.add_argument("--trace-id", help="Print the full span tree of one trace")
+        parser.add_argument("--contains", default="generate_challenge",
+                            help="Only traces with a span whose name contains this (default: generate_challenge; '' for all)")
+        parser.add_argument("--min-ms", type=float, default=0, help="Only traces at least this long")
+        parser.add_argument("--limit", type=int, default=10, help="Number of slowest traces to show")
+        parser.add_argument("--json", action="store_true", help="Print JSON instead of text")
+
+    def handle(self, *args, **options):
+        paths = options["files"] or ([settings.TRACE_FILE] if settings.TRACE_FILE else [])
+        if not paths:
+            raise CommandError("No trace file given and TRACE_FILE is not set.")
+
+        traces = defaultdict(list)
+        for s in _load(paths):
+            traces[s["trace_id"]].append(s)
+
+        if options["trace_id"]:
+            if options["trace_id"] not in traces:
+                raise CommandError(f"Trace {options['trace_id']} not found.")
+            self._print_tree(traces[options["trace_id"]])
+            return
+
+        summaries = []
+        for trace_id, spans in traces.items():
+            if options["contains"] and not any(options["contains"] in s["name"] for s in spans):
+                continue
+            t0 = min(s["start"] for s in spans)
+            total_ms = max(s["end"] for s in spans) - t0
+            if total_ms < options["min_ms"]:
+                continue
+
+            ids = {s["span_id"] for s in spans}
+            children = defaultdict(list)
+            for s in spans:
+                children[s["parent_id"] if s["parent_id"] in ids else None].append(s)
+            # Spans whose parent never arrived (e.g. a crashed process) count as roots
+            root = min(children[None], key=lambda s: s["start"])
+            segments = [
+                {
+                    "depth": depth,
+                    "name": s["name"],
+                    "service": s["service"],
+                    "offset_ms": round(s["start"] - t0, 1),
+                    "duration_ms": round(s["end"] - s["start"], 1),
+                    "self_ms": round(self_ms, 1),
+                    "error": s["error"],
+                }
+                for depth, s, self_ms in _critical_path(root, children)
+            ]
+            summaries.append({
+                "trace_id": trace_id,
+                "root": root["name"],
+                "total_ms": round(total_ms, 1),
+                "spans": len(spans),
+                "errors": sum(s["error"] for s in spans),
+                "bottleneck": max(segments, key=lambda seg: seg["self_ms"])["name"],
+                "critical_path": segments,
+            })
+
+        summaries.sort(key=lambda t: -t["total_ms"])
+        summaries = summaries[:options["limit"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(summaries, indent=2))
+            return
+
+        for t in summaries:
+            self.stdout.write(
+                f"{t['trace_id']}  {t['total_ms'] / 1000:.2f}s  {t['spans']} spans  {t['errors']} errors  "
+                f"root: {t['root']}  bottleneck: {t['bottleneck']}"
+            )
+            for seg in t["critical_path"]:
+                flag = " !" if seg["error"] else ""
+                self.stdout.write(
+                    f"    +{seg['offset_ms']:>9.1f}ms {seg['duration_ms']:>9.1f}ms (self {seg['self_ms']:>8.1f}ms)  "
+                    f"{'  ' * seg['depth']}{seg['name']} [{seg['service']}]{flag}"
+                )
+
+    def _print_tree(self, spans):
+        t0 = min(s["start"] for s in spans)
+        ids = {s["span_id"] for s in spans}
+        children = defaultdict(list)
+        for s in spans:
+            children[s["parent_id"] if s["parent_id"] in ids else None].append(s)
+
+        def walk(span, depth):
+            flag = " !" if span["error"] else ""
+            self.stdout.write(
+                f"+{span['start'] - t0:>9.1f}ms {span['end'] - span['start']:>9.1f}ms  "
+                f"{'  ' * depth}{span['name']} [{span['service']}]{flag}"
+            )
+            for child in sorted(children[span["span_id"]], key=lambda c: c["start"]):
+                walk(child, depth + 1)
+
+        for root in sorted(children[None], key=lambda s: s["start"]):
+            walk(root, 0)
@@ -0,0 +1,372 @@
+"""
+Process-safe metrics in the Prometheus text exposition format.
+
+Every process (web workers, Celery prefork children) keeps its own values in
+memory and periodically writes them to ``METRICS_DIR/<pid>-<id>.json``, the
+id being random per process so a reused pid never overwrites the file of
+the process that had it before. The /metrics view merges all files:
+counters and histograms are summed across processes, gauges only across
+processes that are still alive. The counters of exited processes are
+folded into ``exited.json`` and their files removed. Clear METRICS_DIR when
+deploying, as with prometheus_client's multiprocess mode.
+"""
+import atexit
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: _pid_alive keeps every file, nothing is folded
+    fcntl = None
+
+FLUSH_INTERVAL = 1.0  # seconds between snapshot writes per process
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry = {}
+_lock = threading.Lock()
+_last_flush = 0.0
+_instance = uuid.uuid4().hex[:12]
+
+EXITED_FILE = "exited.json"
+
+
+def metrics_dir():
+    path = getattr(settings, "METRICS_DIR", None) or os.path.join(tempfile.gettempdir(), "safecode-metrics")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush()
+
+
+class Gauge(_Metric):
+    """Summed across live processes (e.g. containers in flight per worker)."""
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush(force=True)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+        _maybe_flush(force=True)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            # [bucket counts..., sum, count]; buckets are non-cumulative here
+            slot = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    slot[i] += 1
+                    break
+            slot[-2] += value
+            slot[-1] += 1
+        _maybe_flush()
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: {"kind": m.kind, "values": [[list(k), v] for k, v in m.values.items()]}
+            for name, m in _registry.items()
+            if m.values
+        }
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Write this process's values to its snapshot file (atomic replace)."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    _write(os.path.join(metrics_dir(), f"{os.getpid()}-{_instance}.json"), _snapshot())
+
+
+def _maybe_flush(force=False):
+    if force or time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError:
+            pass  # metrics must never break the request or task
+
+
+def _after_fork():
+    # A forked child (a Celery prefork worker) starts counting from zero under its own file
+    global _instance, _last_flush
+    _instance, _last_flush = uuid.uuid4().hex[:12], 0.0
+    for metric in _registry.values():
+        metric.values = {}
+
+
+atexit.register(lambda: _maybe_flush(force=True))
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _worker_process_shutdown(**kwargs):
+    # Prefork children leave with os._exit, which skips atexit
+    _maybe_flush(force=True)
+
+
+def connect_celery_signals():
+    from celery import signals
+
+    signals.worker_process_shutdown.connect(_worker_process_shutdown, weak=False)
+
+
+def _pid_alive(pid):
+    if os.name != "posix":
+        return True  # no cheap, safe check; keep the gauge
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _snapshot_pid(filename):
+    """The pid of a snapshot file name ("<pid>-<id>.json"), else None."""
+    pid, sep, rest = filename.partition("-")
+    if sep and pid.isdigit() and rest.endswith(".json"):
+        return int(pid)
+    return None
+
+
+def _add(merged, values):
+    """Add the [[labels, value], ...] of one metric to ``merged`` ({labels tuple: value})."""
+    for key, value in values:
+        key = tuple(key)
+        if isinstance(value, list):
+            current = merged.get(key)
+            merged[key] = value if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            merged[key] = merged.get(key, 0) + value
+
+
+def _fold_exited(directory, paths):
+    """
+    Add the counters and histograms of the exited processes' snapshot files
+    ``paths`` to EXITED_FILE and remove them. Returns the folded
+    {name: [[labels, value], ...]}. Locked, so two scrapes don't fold a
+    file twice.
+    """
+    exited_path = os.path.join(directory, EXITED_FILE)
+    if not paths or fcntl is None:
+        return _read(exited_path) or {}
+    with open(os.path.join(directory, "exited.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        totals = {}
+        for name, values in (_read(exited_path) or {}).items():
+            _add(totals.setdefault(name, {}), values)
+        folded = []
+        for path in paths:
+            data = _read(path)
+            if data is None:
+                continue  # folded by another scrape meanwhile
+            for name, entry in data.items():
+                if entry["kind"] != "gauge":
+                    _add(totals.setdefault(name, {}), entry["values"])
+            folded.append(path)
+        exited = {name: [[list(k), v] for k, v in values.items()] for name, values in totals.items()}
+        if folded:
+            _write(exited_path, exited)
+            for path in folded:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+    return exited
+
+
+def collect():
+    """Merge every process's snapshot into {name: {labels: value}}."""
+    flush()
+    merged = {}
+    directory = metrics_dir()
+    exited = []
+    for filename in os.listdir(directory):
+        pid = _snapshot_pid(filename)
+        if pid is None:
+            continue
+        path = os.path.join(directory, filename)
+        if pid == os.getpid():
+            # Another file with this pid was left by the process that had the pid before
+            exited_process = filename != f"{pid}-{_instance}.json"
+        else:
+            exited_process = not _pid_alive(pid)
+        if exited_process:
+            exited.append(path)
+            continue
+        data = _read(path)
+        if data is None:
+            continue
+        for name, entry in data.items():
+            _add(merged.setdefault(name, {}), entry["values"])
+    for name, values in _fold_exited(directory, exited).items():
+        _add(merged.setdefault(name, {}), values)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _fmt(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(extra_gauges=()):
+    """
+    Render all metrics as Prometheus text.
+
+    ``extra_gauges`` are (name, help, labelnames, {labels tuple: value})
+    computed at scrape time, e.g. from the database.
+    """
+    merged = collect()
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        values = merged.get(name, {})
+        if not values and not metric.labelnames and metric.kind != "histogram":
+            values = {(): 0}
+        for key, value in sorted(values.items()):
+            if metric.kind == "histogram":
+                cumulative = 0
+                for upper, count in zip(metric.buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(metric.labelnames, key, [('le', _fmt(upper))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(metric.labelnames, key)} {_fmt(value[-2])}")
+                lines.append(f"{name}_count{_labels(metric.labelnames, key)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_labels(metric.labelnames, key)} {_fmt(value)}")
+    for name, documentation, labelnames, values in extra_gauges:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in sorted(values.items()):
+            lines.append(f"{name}{_labels(labelnames, key)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics used across the app -------------------------------------------
+
+REQUEST_LATENCY = Histogram(
+    "safecode_http_request_duration_seconds",
+    "Latency of API requests by view.",
+    ["view", "method", "status"],
+)
+STAGE_DURATION = Histogram(
+    "safecode_generation_stage_duration_seconds",
+    "Duration of generation pipeline stages.",
+    ["stage", "vuln_type"],
+    buckets=STAGE_BUCKETS,
+)
+GENERATION_ATTEMPTS = Counter(
+    "safecode_generation_attempts_total",
+    "LLM candidates tried, by vuln_type and outcome.",
+    ["vuln_type", "outcome"],
+)
+GENERATION_ACCEPTED = Counter(
+    "safecode_generation_accepted_total",
+    "Challenges that passed verification and were stored.",
+    ["vuln_type"],
+)
+STAGE_RETRIES = Counter(
+    "safecode_generation_stage_retries_total",
+    "Generation stages retried after an infrastructure error, by stage and error class.",
+    ["stage", "error"],
+)
+QUEUE_WAIT = Histogram(
+    "safecode_task_queue_wait_seconds",
+    "Time tasks spent in the broker before a worker started them, by queue.",
+    ["queue"],
+    buckets=STAGE_BUCKETS,
+)
+SANDBOX_IN_FLIGHT = Gauge(
+    "safecode_sandbox_containers_in_flight",
+    "Sandbox containers currently running.",
+)
+SANDBOX_WAITING = Gauge(
+    "safecode_sandbox_runs_waiting",
+    "Sandbox runs waiting for a SANDBOX_CONCURRENCY slot.",
+)
+SANDBOX_KILLED = Counter(
+    "safecode_sandbox_runs_killed_total",
+    "Sandbox runs killed before finishing, by reason (timeout, cancelled).",
+    ["reason"],
+)
+SANDBOX_TOOL_CPU = Counter(
+    "safecode_sandbox_tool_cpu_seconds_total",
+    "User + system CPU time of analysis tools inside the sandbox.",
+    ["tool"],
+)
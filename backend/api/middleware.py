@@ -0,0 +1,214 @@
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics, profiling, tracing
+
+
+class MetricsMiddleware:
+    """Observe the latency of every request, labelled by the resolved view name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, start)
+        return response
+
+    @staticmethod
+    def _observe(request, response, start):
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else "") or "unmatched"
+        metrics.REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            view=view,
+            method=request.method,
+            status=response.status_code,
+        )
+
+
+# Per-request query counter. A list so that the ORM's sync_to_async threads,
+# which run with a copy of the request context, update the same object.
+_query_count = contextvars.ContextVar("query_count", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class QueryCountMiddleware:
+    """
+    Report the number of SQL queries a request ran in an ``X-DB-Queries``
+    response header. Off unless settings.DB_QUERY_COUNT_HEADER is set; meant
+    for load tests (backend/scripts/loadgen.py), not for production.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DB_QUERY_COUNT_HEADER:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(_install_query_counter)
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = [0]
+        token = _query_count.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_count.reset(token)
+        response["X-DB-Queries"] = str(counter[0])
+        return response
+
+    async def __acall__(self, request):
+        counter = [0]
+        token = _query_count.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_count.reset(token)
+        response["X-DB-Queries"] = str(counter[0])
+        return response
+
+
+class TracingMiddleware:
+    """
+    Open a server span per request, continuing the caller's trace when a
+    ``traceparent`` header is sent, and return the span's own traceparent.
+    Off unless settings.TRACE_FILE is set.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not tracing.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        span = self._begin(request)
+        try:
+            response = self.get_response(request)
+        except BaseException as exc:
+            tracing.end(span, exc)
+            raise
+        return self._end(span, request, response)
+
+    async def __acall__(self, request):
+        span = self._begin(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException as exc:
+            tracing.end(span, exc)
+            raise
+        return self._end(span, request, response)
+
+    @staticmethod
+    def _begin(request):
+        return tracing.begin(
+            f"{request.method} {request.path}", tracing.KIND_SERVER, request.headers.get("traceparent"),
+            **{"http.request.method": request.method, "url.path": request.path},
+        )
+
+    @staticmethod
+    def _end(span, request, response):
+        match = getattr(request, "resolver_match", None)
+        if match and match.route:
+            span.name = f"{request.method} /{match.route}"
+        span.set(**{"http.response.status_code": response.status_code})
+        response["traceparent"] = span.traceparent
+        tracing.end(span, f"HTTP {response.status_code}" if response.status_code >= 500 else None)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    cProfile a sample of requests (settings.PROFILE_SAMPLE_RATE) and any
+    request sending ``X-Profile: <settings.PROFILE_HEADER_TOKEN>``. Samples
+    land in the profile directory; see backend/api/profiling.py.
+
+    Only requests served synchronously by sync views are sampled: under ASGI,
+    and for async views, the profile would run on an event loop thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.PROFILE_SAMPLE_RATE <= 0 and not settings.PROFILE_HEADER_TOKEN:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.get_response(request)
+        request._profiler = profiling.start() if self._wanted(request) else None
+        try:
+            return self.get_response(request)
+        finally:
+            if request._profiler is not None:
+                self._stop(request._profiler, request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(request, "_profiler", None) is not None and iscoroutinefunction(view_func):
+            profiling.discard(request._profiler)
+            request._profiler = None
+
+    @staticmethod
+    def _wanted(request):
+        token = settings.PROFILE_HEADER_TOKEN
+        if token and request.headers.get("X-Profile") == token:
+            return True
+        return profiling.sampled(settings.PROFILE_SAMPLE_RATE)
+
+    @staticmethod
+    def _stop(profiler, request):
+        match = getattr(request, "resolver_match", None)
+        profiling.stop(profiler, "view", (match.view_name if match else "") or "unmatched")
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_result_generated_challenge_alter_result_challenge'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedchallenge',
+            index=models.Index(fields=['vuln_type', '-id'], name='genchal_vuln_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedchallenge',
+            index=models.Index(fields=['difficulty', '-id'], name='genchal_diff_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedchallenge',
+            index=models.Index(fields=['vuln_type', 'difficulty', '-id'], name='genchal_vuln_diff_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedchallenge',
+            index=models.Index(fields=['created_at'], name='genchal_created_idx'),
+        ),
+    ]
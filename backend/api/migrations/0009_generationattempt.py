@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('vuln_type', models.CharField(max_length=64)),
+                ('seed_topic', models.CharField(blank=True, default='', max_length=128)),
+                ('outcome', models.CharField(choices=[('accepted', 'Accepted'), ('rejected', 'Rejected'), ('invalid', 'Invalid'), ('error', 'Error')], max_length=16)),
+                ('detail', models.TextField(blank=True, default='')),
+                ('started_at', models.DateTimeField()),
+                ('duration_ms', models.FloatField(default=0)),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('spans', models.JSONField(blank=True, default=list)),
+                ('generation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to='api.generationrequest')),
+            ],
+            options={
+                'ordering': ['generation_id', 'number'],
+                'indexes': [models.Index(fields=['vuln_type', 'outcome'], name='genattempt_vuln_outcome_idx')],
+                'constraints': [models.UniqueConstraint(fields=('generation', 'number'), name='uniq_generation_attempt_number')],
+            },
+        ),
+    ]
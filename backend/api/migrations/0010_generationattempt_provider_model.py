@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_generationattempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationattempt',
+            name='model',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.AddField(
+            model_name='generationattempt',
+            name='provider',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_generationattempt_provider_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationrequest',
+            name='enqueued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generationrequest',
+            name='priority',
+            field=models.CharField(choices=[('interactive', 'Interactive'), ('bulk', 'Bulk')], default='interactive', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='generationrequest',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fail_extra_pending(apps, schema_editor):
+    """Keep only each user's newest in-flight interactive request, so the new constraint holds."""
+    GenerationRequest = apps.get_model("api", "GenerationRequest")
+    pending = GenerationRequest.objects.filter(
+        status__in=["queued", "running"], priority="interactive", created_by__isnull=False,
+    ).order_by("created_by_id", "-id")
+    seen, stale = set(), []
+    for gr_id, user_id in pending.values_list("id", "created_by_id"):
+        if user_id in seen:
+            stale.append(gr_id)
+        seen.add(user_id)
+    GenerationRequest.objects.filter(id__in=stale).update(
+        status="failed", error="Superseded by a newer request of the same user",
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_generationrequest_priority'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationrequest',
+            name='coalesced_into',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='followers', to='api.generationrequest'),
+        ),
+        migrations.AddField(
+            model_name='generationrequest',
+            name='difficulty',
+            field=models.CharField(default='easy', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='generationrequest',
+            name='idempotency_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='generationrequest',
+            name='vuln_type',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='generationrequest',
+            index=models.Index(fields=['status', 'vuln_type', 'difficulty'], name='genreq_pending_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='generationrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key', ''), _negated=True), fields=('created_by', 'idempotency_key'), name='genreq_user_idempotency_key_uniq'),
+        ),
+        migrations.RunPython(fail_extra_pending, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='generationrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('priority', 'interactive'), ('status__in', ['queued', 'running'])), fields=('created_by',), name='genreq_one_pending_per_user'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_generationrequest_coalescing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationrequest',
+            name='candidate',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generationrequest',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generationrequest',
+            name='runs',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='generationrequest',
+            name='task_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
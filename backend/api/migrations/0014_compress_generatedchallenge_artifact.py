@@ -0,0 +1,69 @@
+from django.db import migrations, models
+
+import backend.api.fields
+
+BATCH = 200
+
+
+def compress_artifacts(apps, schema_editor):
+    GeneratedChallenge = apps.get_model("api", "GeneratedChallenge")
+    rows = GeneratedChallenge.objects.only("id", "artifact").order_by("id")
+    batch = []
+    for ch in rows.iterator(chunk_size=BATCH):
+        ch.artifact_z = ch.artifact
+        batch.append(ch)
+        if len(batch) == BATCH:
+            GeneratedChallenge.objects.bulk_update(batch, ["artifact_z"])
+            batch = []
+    if batch:
+        GeneratedChallenge.objects.bulk_update(batch, ["artifact_z"])
+
+
+def decompress_artifacts(apps, schema_editor):
+    GeneratedChallenge = apps.get_model("api", "GeneratedChallenge")
+    rows = GeneratedChallenge.objects.only("id", "artifact_z").order_by("id")
+    batch = []
+    for ch in rows.iterator(chunk_size=BATCH):
+        ch.artifact = ch.artifact_z
+        batch.append(ch)
+        if len(batch) == BATCH:
+            GeneratedChallenge.objects.bulk_update(batch, ["artifact"])
+            batch = []
+    if batch:
+        GeneratedChallenge.objects.bulk_update(batch, ["artifact"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_generationrequest_heartbeat'),
+    ]
+
+    operations = [
+        # Nullable first, so the migration can be reversed on a populated table
+        migrations.AlterField(
+            model_name='generatedchallenge',
+            name='artifact',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='generatedchallenge',
+            name='artifact_z',
+            field=backend.api.fields.CompressedJSONField(null=True),
+        ),
+        migrations.RunPython(compress_artifacts, decompress_artifacts),
+        migrations.RemoveField(
+            model_name='generatedchallenge',
+            name='artifact',
+        ),
+        migrations.RenameField(
+            model_name='generatedchallenge',
+            old_name='artifact_z',
+            new_name='artifact',
+        ),
+        migrations.AlterField(
+            model_name='generatedchallenge',
+            name='artifact',
+            field=backend.api.fields.CompressedJSONField(),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_compress_generatedchallenge_artifact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedchallenge',
+            name='verification_archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# The schema and document of api_challenge_search as of this migration, frozen
+# here: later changes to backend/api/search.py must not change what it does.
+TABLE = "api_challenge_search"
+BATCH = 200
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+        insecure_code, explanation, seed_topic, tokenize = 'porter unicode61'
+    )""",
+]
+POSTGRES_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+        challenge_id bigint PRIMARY KEY REFERENCES api_generatedchallenge (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        insecure_code text NOT NULL,
+        explanation text NOT NULL,
+        seed_topic text NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING gin (document)",
+]
+
+SQLITE_INSERT = f"INSERT INTO {TABLE} (rowid, insecure_code, explanation, seed_topic) VALUES (%s, %s, %s, %s)"
+POSTGRES_INSERT = f"""INSERT INTO {TABLE} (challenge_id, insecure_code, explanation, seed_topic, document)
+    VALUES (%s, %s, %s, %s,
+            setweight(to_tsvector('english', %s), 'A') ||
+            setweight(to_tsvector('english', %s), 'B') ||
+            setweight(to_tsvector('simple', %s), 'C'))"""
+
+
+def document(artifact):
+    explanation = artifact.get("explanation") or ""
+    if isinstance(explanation, dict):
+        explanation = "\n".join(str(v) for v in explanation.values() if v)
+    return artifact.get("insecure_code") or "", str(explanation), artifact.get("seed_topic") or ""
+
+
+def create_index(apps, schema_editor):
+    postgres = schema_editor.connection.vendor == "postgresql"
+    GeneratedChallenge = apps.get_model("api", "GeneratedChallenge")
+    rows = GeneratedChallenge.objects.only("id", "artifact").order_by("id")
+    with schema_editor.connection.cursor() as cursor:
+        for statement in POSTGRES_SCHEMA if postgres else SQLITE_SCHEMA:
+            cursor.execute(statement)
+        for ch in rows.iterator(chunk_size=BATCH):
+            code, explanation, topic = document(ch.artifact)
+            if postgres:
+                cursor.execute(POSTGRES_INSERT, [ch.id, code, explanation, topic, topic, explanation, code])
+            else:
+                cursor.execute(SQLITE_INSERT, [ch.id, code, explanation, topic])
+
+
+def drop_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_generatedchallenge_verification_archived_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:10
+
+import backend.api.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_challenge_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationattempt',
+            name='bundle',
+            field=backend.api.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='generationattempt',
+            name='bundle_sha',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='generationattempt',
+            name='promoted_to',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='source_attempt', to='api.generatedchallenge'),
+        ),
+        migrations.AddField(
+            model_name='generationattempt',
+            name='results',
+            field=backend.api.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='generationattempt',
+            name='reverified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='generationattempt',
+            index=models.Index(fields=['bundle_sha'], name='genattempt_bundle_sha_idx'),
+        ),
+    ]
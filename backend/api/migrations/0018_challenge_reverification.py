@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:14
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_verified_at(apps, schema_editor):
+    # Existing challenges were verified when they were created; by which image is unknown ("")
+    GeneratedChallenge = apps.get_model("api", "GeneratedChallenge")
+    GeneratedChallenge.objects.filter(verified_at=None).update(verified_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_generationattempt_bundle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReverificationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_digest', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='running', max_length=16)),
+                ('batch_size', models.PositiveIntegerField(default=50)),
+                ('include_verified', models.BooleanField(default=False)),
+                ('last_id', models.PositiveBigIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('checked', models.PositiveIntegerField(default=0)),
+                ('passed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('regressed', models.PositiveIntegerField(default=0)),
+                ('restored', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('checkpoint_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='generatedchallenge',
+            name='is_stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='generatedchallenge',
+            name='stale_reason',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='generatedchallenge',
+            name='verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generatedchallenge',
+            name='verified_image',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(backfill_verified_at, migrations.RunPython.noop),
+    ]
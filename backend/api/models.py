@@ -3,8 +3,11 @@ from django.db import models
 # Create your models here.
 from django.db import models
 from django.contrib.auth.models import User
+import hashlib
 import uuid
 
+from .fields import CompressedJSONField
+
 class Challenge(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -32,6 +35,10 @@ class Result(models.Model):
     score = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Optional client-generated key (e.g. a UUID per answer) so that retried
+    # submissions are recorded only once per user.
+    client_key = models.CharField(max_length=64, null=True, blank=True)
+
     def __str__(self):
         if self.challenge:
             return f"{self.user.username} - {self.challenge.title}: {self.score}"
@@ -43,8 +50,13 @@ class Result(models.Model):
     # remove this if you want to allow multiple attempts!
     # unique_together = ('user', 'challenge')
     class Meta:
-
-        pass
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "client_key"],
+                condition=models.Q(client_key__isnull=False),
+                name="uniq_result_user_client_key",
+            ),
+        ]
 
 
 class Certificate(models.Model):
@@ -85,16 +97,215 @@ class GenerationRequest(models.Model):
         ("failed", "Failed"),
         ("done", "Done"),
     ]
+    PRIORITY_CHOICES = [
+        ("interactive", "Interactive"),  # a player is waiting for it
+        ("bulk", "Bulk"),                # background work; served after interactive requests
+    ]
+    PENDING_STATUSES = ("queued", "running")
+
     created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued")
+    priority = models.CharField(max_length=16, choices=PRIORITY_CHOICES, default="interactive")
+    # What was asked for; "" vuln_type lets each attempt pick one at random
+    vuln_type = models.CharField(max_length=64, blank=True, default="")
+    difficulty = models.CharField(max_length=16, default="easy")
+    # Client-supplied Idempotency-Key header; a repeated key returns this request
+    idempotency_key = models.CharField(max_length=64, blank=True, default="")
+    # Set when this request waits on another user's identical in-flight request
+    # instead of running its own generation; it finishes with that request.
+    coalesced_into = models.ForeignKey(
+        "self", null=True, blank=True, on_delete=models.SET_NULL, related_name="followers",
+    )
     error = models.TextField(blank=True, default="")
     logs = models.TextField(blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
+    enqueued_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Liveness of the current run (see heartbeats.py)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    task_id = models.CharField(max_length=64, blank=True, default="")  # Celery task that owns the run
+    runs = models.PositiveIntegerField(default=0)
+    # The LLM bundle being verified, kept so a run that dies can be resumed without a new LLM call
+    candidate = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["created_by", "idempotency_key"],
+                condition=~models.Q(idempotency_key=""),
+                name="genreq_user_idempotency_key_uniq",
+            ),
+            # A player has at most one interactive generation in flight
+            models.UniqueConstraint(
+                fields=["created_by"],
+                condition=models.Q(status__in=["queued", "running"], priority="interactive"),
+                name="genreq_one_pending_per_user",
+            ),
+        ]
+        indexes = [
+            # Leader lookup for coalescing
+            models.Index(fields=["status", "vuln_type", "difficulty"], name="genreq_pending_idx"),
+        ]
+
+    @property
+    def queue_wait_ms(self):
+        if self.enqueued_at and self.started_at:
+            return round((self.started_at - self.enqueued_at).total_seconds() * 1000, 1)
+        return None
+
+class GenerationAttempt(models.Model):
+    """
+    One LLM candidate tried while serving a GenerationRequest.
+
+    ``spans`` holds the timed pipeline stages of the attempt, e.g.
+    {"stage": "llm", "start_ms": 0.0, "duration_ms": 31250.4,
+     "input_tokens": 2210, "output_tokens": 804, "outcome": "ok"}.
+
+    ``bundle`` is the LLM candidate and ``results`` the sandbox results of
+    its secure and insecure runs, whatever the outcome, so candidates that
+    were rejected because the runner itself was broken can be verified
+    again later without a new LLM call (reverify.py).
+    """
+    OUTCOME_CHOICES = [
+        ("accepted", "Accepted"),
+        ("rejected", "Rejected"),   # ran in the sandbox but failed the secure-pass/insecure-fail check
+        ("invalid", "Invalid"),     # failed the static checks (e.g. code length) before the sandbox
+        ("error", "Error"),         # an exception ended the attempt
+    ]
+    generation = models.ForeignKey(GenerationRequest, on_delete=models.CASCADE, related_name="attempts")
+    number = models.PositiveIntegerField()
+    vuln_type = models.CharField(max_length=64)
+    seed_topic = models.CharField(max_length=128, blank=True, default="")
+    provider = models.CharField(max_length=32, blank=True, default="")
+    model = models.CharField(max_length=128, blank=True, default="")
+    outcome = models.CharField(max_length=16, choices=OUTCOME_CHOICES)
+    detail = models.TextField(blank=True, default="")
+
+    started_at = models.DateTimeField()
+    duration_ms = models.FloatField(default=0)
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    spans = models.JSONField(default=list, blank=True)
+    bundle = CompressedJSONField(null=True)
+    bundle_sha = models.CharField(max_length=64, blank=True, default="")  # see bundle_digest()
+    results = CompressedJSONField(null=True)  # {"secure": {...}, "insecure": {...}}
+    # Bulk re-verification (reverify.py): when it last ran, and the challenge it produced
+    reverified_at = models.DateTimeField(null=True, blank=True)
+    promoted_to = models.OneToOneField(
+        "GeneratedChallenge", null=True, blank=True, on_delete=models.SET_NULL, related_name="source_attempt",
+    )
+
+    class Meta:
+        ordering = ["generation_id", "number"]
+        constraints = [
+            models.UniqueConstraint(fields=["generation", "number"], name="uniq_generation_attempt_number"),
+        ]
+        indexes = [
+            models.Index(fields=["vuln_type", "outcome"], name="genattempt_vuln_outcome_idx"),
+            models.Index(fields=["bundle_sha"], name="genattempt_bundle_sha_idx"),
+        ]
+
+    @staticmethod
+    def bundle_digest(bundle):
+        """Identity of a candidate: its code and tests. The same bundle may be tried by several runs."""
+        if not bundle:
+            return ""
+        text = "\0".join(str(bundle.get(k, "")) for k in ("secure_code", "insecure_code", "tests"))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def __str__(self):
+        return f"Generation #{self.generation_id} attempt {self.number} ({self.vuln_type}): {self.outcome}"
+
 
 class GeneratedChallenge(models.Model):
     generation = models.OneToOneField(GenerationRequest, on_delete=models.CASCADE, related_name="challenge")
     language = models.CharField(max_length=32, default="python")
     vuln_type = models.CharField(max_length=64, default="sqli")
     difficulty = models.CharField(max_length=16, default="easy")
-    artifact = models.JSONField()  # full challenge JSON
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    artifact = CompressedJSONField()  # full challenge JSON
+    # Set once artifact["verification"] has been moved to the archive files (archive.py)
+    verification_archived_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # The runner (docker_runner.runner_image_digest) that last verified the challenge, and when
+    verified_image = models.CharField(max_length=100, blank=True, default="")
+    verified_at = models.DateTimeField(null=True, blank=True)
+    # Set when a runner no longer passes the secure code / fails the insecure code; stale
+    # challenges are not served (see reverify.py)
+    is_stale = models.BooleanField(default=False)
+    stale_reason = models.CharField(max_length=255, blank=True, default="")
+
+    class Meta:
+        # Back the filtered, id-ordered cursor pages of GeneratedChallengeListView
+        indexes = [
+            models.Index(fields=["vuln_type", "-id"], name="genchal_vuln_id_idx"),
+            models.Index(fields=["difficulty", "-id"], name="genchal_diff_id_idx"),
+            models.Index(fields=["vuln_type", "difficulty", "-id"], name="genchal_vuln_diff_id_idx"),
+            models.Index(fields=["created_at"], name="genchal_created_idx"),
+        ]
+
+
+class ReverificationRun(models.Model):
+    """
+    One pass of the generated challenge corpus through a runner image
+    (reverify.run_batch). Progress is checkpointed after every batch:
+    every challenge up to ``last_id`` is done, so an interrupted run is
+    resumed from there.
+    """
+    STATUS_CHOICES = [
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    image_digest = models.CharField(max_length=100)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="running")
+    batch_size = models.PositiveIntegerField(default=50)
+    # Also check challenges this image has verified already
+    include_verified = models.BooleanField(default=False)
+    last_id = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)  # challenges to check when the run started
+
+    checked = models.PositiveIntegerField(default=0)
+    passed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    regressed = models.PositiveIntegerField(default=0)  # failed and were not stale before
+    restored = models.PositiveIntegerField(default=0)   # passed and were stale before
+    errors = models.PositiveIntegerField(default=0)     # sandbox errors; left for a later run
+    error = models.TextField(blank=True, default="")
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    checkpoint_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Re-verification #{self.id} ({self.image_digest[:19]}): {self.status}, {self.checked}/{self.total}"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Materialised totals of a user's results for one leaderboard scope.
+
+    A scope is a vuln_type ("" for all types) and a period: "all", an ISO
+    week ("w2026-07") or a month ("m2026-02"). Rows are incremented as
+    results are recorded (see leaderboard.record_results) and periodically
+    rebuilt from Result by the reconcile_leaderboard task.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="leaderboard_entries")
+    vuln_type = models.CharField(max_length=64, blank=True, default="")
+    period = models.CharField(max_length=10, default="all")
+
+    score = models.IntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "vuln_type", "period"], name="uniq_leaderboard_scope"),
+        ]
+        indexes = [
+            # Top-N reads and "users ahead of me" counts are range scans on this index
+            models.Index(fields=["vuln_type", "period", "-score", "-correct"], name="leaderboard_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} [{self.vuln_type or 'all'}/{self.period}]: {self.score}"
@@ -0,0 +1,105 @@
+"""
+Answer options for a generated challenge: the vulnerable lines plus
+distractors, shuffled.
+
+Distractors are drawn from statement spans computed once from the AST of
+the insecure code, so they always point at real code (a whole statement or
+a compound statement's header line) rather than blank lines, braces or the
+inside of a string. Drawing is bounded: there is a fixed candidate list,
+and if it cannot supply enough distractors ``OptionBuildError`` is raised
+instead of retrying.
+"""
+import ast
+import random
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Span = Tuple[int, ...]
+
+# Lines that carry no code of their own when the source doesn't parse
+_TRIVIAL_LINES = {"", "{", "}", "(", ")", "[", "]", '"""', "'''", "''", '""'}
+
+
+class OptionBuildError(ValueError):
+    """The code does not offer enough non-vulnerable statements for distractors."""
+
+
+def statement_spans(code: str) -> List[Tuple[int, int]]:
+    """
+    (first_line, last_line) of every statement, in source order. Compound
+    statements (def, if, for, with, ...) contribute their header lines only;
+    their bodies contribute their own statements. Docstrings are skipped.
+    Falls back to one span per non-trivial line if the code doesn't parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return [
+            (n, n) for n, line in enumerate(code.splitlines(), start=1)
+            if line.strip() not in _TRIVIAL_LINES and not line.strip().startswith("#")
+        ]
+
+    spans = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.stmt):
+            continue
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            continue  # docstring / bare string
+        body = getattr(node, "body", None)
+        if isinstance(body, list) and body:
+            # Header: from the first decorator (if any) to the line before the body
+            start = min([node.lineno, *(d.lineno for d in getattr(node, "decorator_list", []))])
+            spans.add((start, max(start, body[0].lineno - 1)))
+        else:
+            spans.add((node.lineno, node.end_lineno or node.lineno))
+    return sorted(spans)
+
+
+def _candidates(spans: List[Tuple[int, int]], vulnerable: Sequence[int], use_ranges: bool, max_lines: int) -> List[Span]:
+    vuln = set(vulnerable)
+    found = set()
+    for i, (start, end) in enumerate(spans):
+        lines = tuple(range(start, min(end, start + max_lines - 1) + 1))
+        if use_ranges and len(lines) == 1 and i + 1 < len(spans) and spans[i + 1][0] == end + 1:
+            # A one-line statement followed directly by another: offer the pair as a range
+            nxt_start, nxt_end = spans[i + 1]
+            lines = tuple(range(start, min(nxt_end, start + max_lines - 1) + 1))
+        elif not use_ranges:
+            lines = lines[:1]
+        if not vuln.intersection(lines):
+            found.add(lines)
+    return sorted(found)
+
+
+def build_options(
+    code: str,
+    vulnerable_lines: Sequence[int],
+    rng: Optional[random.Random] = None,
+    distractors: int = 3,
+    max_lines: int = 3,
+) -> List[Dict[str, object]]:
+    """
+    The correct option (``vulnerable_lines``) plus ``distractors`` others,
+    shuffled, as [{"lines": [...], "label": ""}, ...].
+
+    Distractors are spread over the file (one from each of ``distractors``
+    consecutive slices of the candidates), never overlap the vulnerable
+    lines and are ranges when the answer is a range. The same ``rng`` seed
+    gives the same options.
+    """
+    rng = rng or random.Random()
+    spans = statement_spans(code)
+    candidates = _candidates(spans, vulnerable_lines, len(vulnerable_lines) > 1, max_lines)
+    if len(candidates) < distractors:
+        raise OptionBuildError(
+            f"Only {len(candidates)} distractor candidates outside lines {list(vulnerable_lines)} "
+            f"({len(spans)} statements); need {distractors}"
+        )
+
+    chosen = []
+    for k in range(distractors):
+        bucket = candidates[k * len(candidates) // distractors:(k + 1) * len(candidates) // distractors]
+        chosen.append(rng.choice(bucket))
+
+    options = [list(vulnerable_lines)] + [list(lines) for lines in chosen]
+    rng.shuffle(options)
+    return [{"lines": lines, "label": ""} for lines in options]
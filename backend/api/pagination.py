@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ChallengeCursorPagination(CursorPagination):
+    """Keyset pagination over the static challenge table (oldest first)."""
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = "id"
+
+
+class GeneratedChallengeCursorPagination(CursorPagination):
+    """
+    Keyset pagination over generated challenges (newest first).
+
+    Ordering on the primary key keeps every page a bounded index range scan,
+    however many rows have been generated.
+    """
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = "-id"
@@ -0,0 +1,106 @@
+"""
+Opt-in cProfile sampling for API requests and Celery tasks.
+
+Requests are profiled by ProfilingMiddleware when picked by
+PROFILE_SAMPLE_RATE or when they carry ``X-Profile: <PROFILE_HEADER_TOKEN>``;
+tasks are profiled through Celery's prerun/postrun signals with
+PROFILE_TASK_SAMPLE_RATE. Each sample is a pstats file in PROFILE_DIR named
+``<kind>-<name>-<time>-<pid>.prof``; the directory keeps the newest
+PROFILE_MAX_FILES samples. ``manage.py profile_top`` aggregates them.
+
+cProfile only sees the thread it runs in. Async views are not sampled: their
+profile would run on the event loop thread and be charged with the CPU time
+of every other coroutine on it. Only one profile runs per process at a time
+(Python 3.12+ refuses a second active profiler); a request or task picked
+while one runs is simply not sampled.
+"""
+import cProfile
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+_active = threading.Lock()  # held while a profile runs in this process
+_rotate_lock = threading.Lock()
+
+
+def profile_dir():
+    return Path(settings.PROFILE_DIR or os.path.join(tempfile.gettempdir(), "safecode-profiles"))
+
+
+def sampled(rate):
+    return rate > 0 and random.random() < rate
+
+
+def start():
+    """Start a profile in this thread; None if one is already running in this process."""
+    if not _active.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler outside this module is active (a debugger, a profiling tool)
+        _active.release()
+        return None
+    return profiler
+
+
+def discard(profiler):
+    """Stop ``profiler`` without writing a sample."""
+    profiler.disable()
+    _active.release()
+
+
+def stop(profiler, kind, name):
+    """Stop ``profiler`` and write it as a sample; returns the file path."""
+    discard(profiler)
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    safe_name = re.sub(r"[^A-Za-z0-9_.]+", "_", name).strip("_") or "unnamed"
+    path = directory / f"{kind}-{safe_name}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{random.randrange(1 << 16):04x}.prof"
+    profiler.dump_stats(path)
+    _rotate(directory)
+    return path
+
+
+def _rotate(directory):
+    with _rotate_lock:
+        files = []
+        for path in directory.glob("*.prof"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                pass  # removed by another process since the glob
+        files.sort()
+        for _, old in files[:max(len(files) - settings.PROFILE_MAX_FILES, 0)]:
+            try:
+                old.unlink()
+            except FileNotFoundError:
+                pass  # removed by another process
+
+
+# --- Celery hooks -----------------------------------------------------------
+
+def _task_prerun(task=None, **kwargs):
+    if sampled(settings.PROFILE_TASK_SAMPLE_RATE):
+        task.request.profiler = start()
+
+
+def _task_postrun(task=None, **kwargs):
+    profiler = getattr(task.request, "profiler", None)
+    if profiler is not None:
+        task.request.profiler = None
+        stop(profiler, "task", task.name)
+
+
+def connect_celery_signals():
+    from celery import signals
+
+    signals.task_prerun.connect(_task_prerun, weak=False)
+    signals.task_postrun.connect(_task_postrun, weak=False)
@@ -0,0 +1,133 @@
+"""
+Celery queues by priority class.
+
+Work a player is waiting for goes to the ``interactive`` queue; batch jobs
+(re-verification, pool refills, leaderboard reconciliation) go to ``bulk``.
+Workers are started per queue (see README), so bulk work can never take the
+capacity reserved for interactive requests. Tasks without an explicit route
+land on ``bulk``.
+
+Generate clicks are admitted through ``submit_generation``, which
+deduplicates them: per user by Idempotency-Key and by allowing one
+interactive request in flight, and across users by letting identical
+requests follow one generation run (``coalesced_into``).
+
+Every published task carries its enqueue time in an ``enqueued_at`` message
+header; when a worker starts it, the wait is recorded in
+``safecode_task_queue_wait_seconds{queue=...}``.
+"""
+import time
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import GenerationRequest
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+DIFFICULTIES = ("easy", "medium")
+
+PENDING = GenerationRequest.PENDING_STATUSES
+
+
+def _existing(user, priority, idempotency_key):
+    """The request a new click of ``user`` should get instead of a new one, if any."""
+    if idempotency_key:
+        gr = GenerationRequest.objects.filter(created_by=user, idempotency_key=idempotency_key).first()
+        if gr is not None:
+            return gr
+    if priority == INTERACTIVE:
+        return GenerationRequest.objects.filter(created_by=user, priority=INTERACTIVE, status__in=PENDING).first()
+    return None
+
+
+def submit_generation(user, priority=INTERACTIVE, vuln_type="", difficulty="easy", idempotency_key=""):
+    """
+    Admit a generate click; returns (request, created).
+
+    A repeated ``idempotency_key``, or a second interactive click while the
+    user still has one in flight, returns the existing request. Otherwise
+    a new request is created: if another user's request for the same
+    (priority, vuln_type, difficulty) is in flight, the new one follows it
+    and finishes with it, and no task is queued; if not, it is queued.
+    """
+    existing = _existing(user, priority, idempotency_key)
+    if existing is not None:
+        return existing, False
+
+    leader = (
+        GenerationRequest.objects
+        .filter(status__in=PENDING, priority=priority, vuln_type=vuln_type, difficulty=difficulty,
+                coalesced_into=None)
+        .exclude(created_by=user)
+        .order_by("id")
+        .first()
+    )
+    try:
+        with transaction.atomic():
+            gr = GenerationRequest.objects.create(
+                created_by=user, status="queued", priority=priority, vuln_type=vuln_type,
+                difficulty=difficulty, idempotency_key=idempotency_key, coalesced_into=leader,
+            )
+    except IntegrityError:
+        # A concurrent click of the same user (double click, second tab) won the race
+        existing = _existing(user, priority, idempotency_key)
+        if existing is None:
+            raise
+        return existing, False
+
+    if leader is not None:
+        # The leader settles its followers after committing its own final
+        # status, so if it still looks pending now, it will see this row.
+        leader.refresh_from_db(fields=["status", "error"])
+        if leader.status == "done":
+            gr.status = "done"
+            gr.save(update_fields=["status"])
+            return gr, True
+        if leader.status not in PENDING:
+            gr.coalesced_into = None
+            gr.save(update_fields=["coalesced_into"])
+            leader = None
+    if leader is None:
+        enqueue_generation(gr)
+    return gr, True
+
+
+def settle_followers(gr):
+    """Finish the requests coalesced into ``gr`` with its (final) status; call after it is committed."""
+    return gr.followers.filter(status__in=PENDING).update(status=gr.status, error=gr.error)
+
+
+def enqueue_generation(gr, countdown=None):
+    """Queue generate_challenge for ``gr`` on the queue of its priority, optionally ``countdown`` seconds from now."""
+    from .tasks import generate_challenge
+
+    gr.enqueued_at = timezone.now()
+    gr.save(update_fields=["enqueued_at"])
+    if countdown:
+        return generate_challenge.apply_async((gr.id,), queue=gr.priority, countdown=countdown)
+    return generate_challenge.apply_async((gr.id,), queue=gr.priority)
+
+
+# --- Celery hooks -----------------------------------------------------------
+
+def _before_task_publish(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("enqueued_at", time.time())
+
+
+def _task_prerun(task=None, **kwargs):
+    enqueued_at = getattr(task.request, "enqueued_at", None)
+    if enqueued_at is None:
+        return  # eager call, or published by a process without these hooks
+    queue = (task.request.delivery_info or {}).get("routing_key") or "default"
+    metrics.QUEUE_WAIT.observe(max(time.time() - float(enqueued_at), 0.0), queue=queue)
+
+
+def connect_celery_signals():
+    from celery import signals
+
+    signals.before_task_publish.connect(_before_task_publish, weak=False)
+    signals.task_prerun.connect(_task_prerun, weak=False)
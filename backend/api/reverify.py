@@ -0,0 +1,320 @@
+"""
+Verification of stored candidates.
+
+Every candidate generate_challenge tries is kept on its GenerationAttempt
+(bundle and sandbox results). When the runner image was broken for a while
+(semgrep crashing, pytest missing), the candidates of that period were
+rejected for the runner's faults, not their own. ``reverify`` runs such
+attempts through the sandbox again, many at once (bounded by
+SANDBOX_CONCURRENCY), and promotes the ones that now pass to a
+GeneratedChallenge of a new bulk GenerationRequest, without any LLM call.
+
+A bundle is identified by ``GenerationAttempt.bundle_digest``; bundles that
+were accepted or promoted already, and repeats of one bundle (a candidate
+resumed by a later run is stored again), are verified only once.
+
+``run_batch`` re-verifies the accepted corpus instead, after the runner
+image changed (a new Python, pytest or tool version may break challenges
+that used to pass). A ReverificationRun walks GeneratedChallenge in id
+order, one batch at a time, checkpointing after each; challenges that no
+longer pass are marked stale and no longer served, ones that pass again
+are restored, and every checked row records the image digest and time of
+its verification. Rows this image has verified already are skipped, so
+a run can be resumed, or repeated, cheaply. Sandbox errors leave the row
+as it was, for the next run.
+
+The acceptance rule itself (``sandbox_verdict``, ``build_artifact``) is
+shared with generate_challenge.
+"""
+import asyncio
+import logging
+import random
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .docker_runner import TOOL_KEYS, run_many_async, runner_image_digest
+from .errors import CandidateError, SandboxError
+from .models import GeneratedChallenge, GenerationAttempt, GenerationRequest, ReverificationRun
+from .options import OptionBuildError, build_options
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_LABELS = ["secure", "insecure"]
+# Outcomes worth another look: "invalid" candidates failed static checks, which won't change
+REVERIFY_OUTCOMES = ("rejected", "error")
+
+
+def sandbox_jobs(bundle):
+    """The secure and insecure runs of ``bundle``; run them with labels=SANDBOX_LABELS."""
+    return [
+        {"code": bundle["secure_code"], "tests": bundle["tests"]},
+        {"code": bundle["insecure_code"], "tests": bundle["tests"]},
+    ]
+
+
+def sandbox_verdict(secure_results, insecure_results):
+    """
+    (secure tests passed, insecure tests failed). A bundle is accepted when
+    both hold: its tests pass on the secure code and catch the insecure one.
+    """
+    # ok: the runner completed; returncode 0: all tests passed
+    secure_ok = bool(secure_results.get("ok", False))
+    insecure_ok = bool(insecure_results.get("ok", False))
+    secure_tests_passed = secure_ok and secure_results.get("tests", {}).get("returncode") == 0
+    # Tests that hang have not caught anything
+    insecure_tests_failed = (
+        insecure_ok
+        and insecure_results.get("tests", {}).get("returncode") != 0
+        and not insecure_results.get("tests", {}).get("timeout")
+    )
+    return secure_tests_passed, insecure_tests_failed
+
+
+def check_tool_timeouts(secure_results, insecure_results):
+    """
+    Raise CandidateError if a tool timed out in either run: the runner
+    reports it, and the candidate (a test that sleeps, code that loops)
+    would hang again however often the sandbox ran it.
+    """
+    for label, results in zip(SANDBOX_LABELS, (secure_results, insecure_results)):
+        timed_out = [key for key in TOOL_KEYS if (results.get(key) or {}).get("timeout")]
+        if timed_out:
+            raise CandidateError(f"{', '.join(timed_out)} timed out on the {label} code")
+
+
+def build_artifact(bundle, seed_topic, options, secure_results, insecure_results, attempt, **verification):
+    """The GeneratedChallenge artifact of an accepted bundle."""
+    return {
+        **bundle,
+        "seed_topic": seed_topic,
+        "options": options,
+        "verification": {
+            "secure": secure_results,
+            "insecure": insecure_results,
+            "attempt": attempt,
+            **verification,
+        },
+    }
+
+
+def verified_by():
+    """Digest of the runner a challenge accepted now was verified by; "" if it can't be read."""
+    try:
+        return runner_image_digest()
+    except SandboxError:
+        return ""
+
+
+def candidates(since=None, vuln_types=(), outcomes=REVERIFY_OUTCOMES, include_reverified=False):
+    """Attempts to verify again, oldest first."""
+    settled = (
+        GenerationAttempt.objects
+        .filter(Q(outcome="accepted") | Q(promoted_to__isnull=False))
+        .exclude(bundle_sha="")
+        .values("bundle_sha")
+    )
+    qs = (
+        GenerationAttempt.objects
+        .filter(outcome__in=outcomes, promoted_to=None)
+        .exclude(bundle_sha="")
+        .exclude(bundle_sha__in=settled)
+    )
+    if since is not None:
+        qs = qs.filter(started_at__gte=since)
+    if vuln_types:
+        qs = qs.filter(vuln_type__in=vuln_types)
+    if not include_reverified:
+        qs = qs.filter(reverified_at=None)
+    return qs.order_by("id")
+
+
+def _run_sandbox(bundles):
+    """Sandbox results (secure, insecure) of each bundle, or the exception that ended its runs."""
+    async def main():
+        return await asyncio.gather(
+            *(run_many_async(sandbox_jobs(b), labels=SANDBOX_LABELS) for b in bundles),
+            return_exceptions=True,
+        )
+    return asyncio.run(main())
+
+
+def promote(attempt, options, secure_results, insecure_results):
+    """Store the bundle of ``attempt`` as a challenge of a new bulk request; returns the challenge."""
+    bundle = attempt.bundle
+    with transaction.atomic():
+        gr = GenerationRequest.objects.create(
+            status="done", priority="bulk", vuln_type=bundle["vuln_type"], difficulty=bundle["difficulty"],
+            logs=f"Promoted from attempt {attempt.number} of generation {attempt.generation_id} on re-verification\n",
+        )
+        challenge = GeneratedChallenge.objects.create(
+            generation=gr,
+            language=bundle["language"],
+            vuln_type=bundle["vuln_type"],
+            difficulty=bundle["difficulty"],
+            artifact=build_artifact(
+                bundle, attempt.seed_topic, options, secure_results, insecure_results, attempt.number,
+                reverified_from=attempt.id,
+            ),
+            verified_image=verified_by(),
+            verified_at=timezone.now(),
+        )
+        attempt.promoted_to = challenge
+        attempt.save(update_fields=["reverified_at", "promoted_to"])
+    metrics.GENERATION_ACCEPTED.inc(vuln_type=challenge.vuln_type)
+    return challenge
+
+
+def reverify(since=None, vuln_types=(), outcomes=REVERIFY_OUTCOMES, include_reverified=False,
+             limit=None, batch_size=50, dry_run=False):
+    """
+    Verify stored candidates again and promote those that pass. Returns
+    {"candidates": n, "promoted": [challenge ids], "rejected": n, "errors": n, "duplicates": n}.
+    """
+    qs = candidates(since, vuln_types, outcomes, include_reverified).values_list("id", flat=True)
+    ids = list(qs[:limit] if limit else qs)
+    stats = {"candidates": len(ids), "promoted": [], "rejected": 0, "errors": 0, "duplicates": 0}
+    if dry_run:
+        return stats
+
+    seen = set()
+    for start in range(0, len(ids), batch_size):
+        batch, duplicates = [], []
+        for attempt in GenerationAttempt.objects.filter(id__in=ids[start:start + batch_size]).order_by("id"):
+            if attempt.bundle_sha in seen:
+                duplicates.append(attempt.id)
+                continue
+            seen.add(attempt.bundle_sha)
+            batch.append(attempt)
+
+        verified = _run_sandbox([a.bundle for a in batch])
+        now = timezone.now()
+        stats["duplicates"] += GenerationAttempt.objects.filter(id__in=duplicates).update(reverified_at=now)
+        for attempt, outcome in zip(batch, verified):
+            attempt.reverified_at = now
+            if isinstance(outcome, BaseException):
+                # The sandbox is still failing; the attempt stays a candidate for --include-reverified
+                logger.warning("Re-verifying attempt %s failed: %.200s", attempt.id, outcome)
+                stats["errors"] += 1
+                attempt.save(update_fields=["reverified_at"])
+                continue
+
+            secure_results, insecure_results = outcome
+            if all(sandbox_verdict(secure_results, insecure_results)):
+                try:
+                    # Same seed as generate_challenge uses for this attempt
+                    options = build_options(
+                        attempt.bundle["insecure_code"], attempt.bundle["vulnerable_lines"],
+                        random.Random(f"{attempt.generation_id}:{attempt.number}"),
+                    )
+                except OptionBuildError:
+                    pass
+                else:
+                    stats["promoted"].append(promote(attempt, options, secure_results, insecure_results).id)
+                    continue
+            stats["rejected"] += 1
+            attempt.save(update_fields=["reverified_at"])
+    return stats
+
+
+# --- Corpus re-verification ---------------------------------------------------
+
+def _corpus(run):
+    qs = GeneratedChallenge.objects.filter(id__gt=run.last_id)
+    if not run.include_verified:
+        qs = qs.exclude(verified_image=run.image_digest)
+    return qs.order_by("id")
+
+
+def start_run(batch_size=50, include_verified=False):
+    """A new ReverificationRun of the corpus against the current runner image."""
+    run = ReverificationRun(
+        image_digest=runner_image_digest(max_age=0), batch_size=batch_size, include_verified=include_verified,
+    )
+    run.total = _corpus(run).count()
+    run.save()
+    return run
+
+
+def resume_run(run_id):
+    """The unfinished or failed run ``run_id``, set running again; DoesNotExist if it finished."""
+    run = ReverificationRun.objects.get(id=run_id, status__in=["running", "failed"])
+    run.status, run.error, run.finished_at = "running", "", None
+    run.save(update_fields=["status", "error", "finished_at"])
+    return run
+
+
+def _finish(run, status, error=""):
+    run.status, run.error, run.finished_at = status, error, timezone.now()
+    ReverificationRun.objects.filter(id=run.id, status="running").update(
+        status=status, error=error, finished_at=run.finished_at,
+    )
+
+
+def run_batch(run):
+    """
+    Re-verify the next batch of ``run`` and checkpoint it. Returns False once
+    the run is over: finished, failed, or taken over by another process.
+    """
+    if run.status != "running":
+        return False
+    try:
+        digest = runner_image_digest(max_age=0)
+    except SandboxError as e:
+        _finish(run, "failed", str(e))
+        return False
+    if digest != run.image_digest:
+        # Verdicts of two images would be mixed under one digest
+        _finish(run, "failed", f"Runner image changed to {digest} during the run; start a new one")
+        return False
+
+    batch = list(_corpus(run).only("id", "artifact", "is_stale")[:run.batch_size])
+    if not batch:
+        _finish(run, "done")
+        return False
+
+    verified = _run_sandbox([ch.artifact for ch in batch])
+    if all(isinstance(outcome, BaseException) for outcome in verified):
+        # The sandbox is down rather than these challenges; don't skip past them
+        _finish(run, "failed", f"Every sandbox run of the batch failed: {verified[0]}"[:4000])
+        return False
+    now = timezone.now()
+    counts = dict.fromkeys(["checked", "passed", "failed", "regressed", "restored", "errors"], 0)
+    checked = []
+    for ch, outcome in zip(batch, verified):
+        if isinstance(outcome, BaseException):
+            logger.warning("Re-verifying challenge %s failed: %.200s", ch.id, outcome)
+            counts["errors"] += 1
+            continue
+        secure_tests_passed, insecure_tests_failed = sandbox_verdict(*outcome)
+        counts["checked"] += 1
+        if secure_tests_passed and insecure_tests_failed:
+            counts["passed"] += 1
+            counts["restored"] += ch.is_stale
+            ch.is_stale, ch.stale_reason = False, ""
+        else:
+            counts["failed"] += 1
+            counts["regressed"] += not ch.is_stale
+            ch.is_stale = True
+            ch.stale_reason = (
+                f"Runner {digest[:19]}: secure tests passed: {secure_tests_passed}, "
+                f"insecure tests failed: {insecure_tests_failed}"
+            )
+        ch.verified_image, ch.verified_at = digest, now
+        checked.append(ch)
+
+    with transaction.atomic():
+        # Fenced on the checkpoint, so two processes resuming one run can't both advance it;
+        # the one that lost writes none of its verdicts either
+        advanced = ReverificationRun.objects.filter(id=run.id, status="running", last_id=run.last_id).update(
+            last_id=batch[-1].id, checkpoint_at=now, **{k: F(k) + v for k, v in counts.items()},
+        )
+        if not advanced:
+            return False
+        GeneratedChallenge.objects.bulk_update(checked, ["is_stale", "stale_reason", "verified_image", "verified_at"])
+    run.last_id, run.checkpoint_at = batch[-1].id, now
+    for k, v in counts.items():
+        setattr(run, k, getattr(run, k) + v)
+    return True
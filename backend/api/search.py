@@ -0,0 +1,173 @@
+"""
+Full-text search over generated challenges.
+
+The searchable text (insecure code, explanation and seed topic) lives in
+``api_challenge_search``, kept next to api_generatedchallenge rather than
+inside the compressed artifact:
+
+- SQLite: an FTS5 virtual table whose rowid is the challenge id.
+- Postgres: a table with a weighted ``tsvector`` column and a GIN index.
+
+Rows are written by the GeneratedChallenge post_save/post_delete signals
+(signals.py); ``manage.py rebuild_search_index`` rebuilds the whole table.
+vuln_type / difficulty filters use the indexed columns of
+api_generatedchallenge through a join; stale challenges are left out
+unless asked for.
+"""
+from django.db import connection
+
+TABLE = "api_challenge_search"
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+        insecure_code, explanation, seed_topic, tokenize = 'porter unicode61'
+    )""",
+]
+POSTGRES_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+        challenge_id bigint PRIMARY KEY REFERENCES api_generatedchallenge (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        insecure_code text NOT NULL,
+        explanation text NOT NULL,
+        seed_topic text NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING gin (document)",
+]
+
+# Postgres weights: topic and explanation rank above code matches
+_PG_DOCUMENT = (
+    "setweight(to_tsvector('english', %s), 'A') || "
+    "setweight(to_tsvector('english', %s), 'B') || "
+    "setweight(to_tsvector('simple', %s), 'C')"
+)
+
+
+def create_schema(conn):
+    with conn.cursor() as cursor:
+        for statement in POSTGRES_SCHEMA if conn.vendor == "postgresql" else SQLITE_SCHEMA:
+            cursor.execute(statement)
+
+
+def drop_schema(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def document(artifact):
+    """(insecure_code, explanation, seed_topic) text of an artifact."""
+    explanation = artifact.get("explanation") or ""
+    if isinstance(explanation, dict):
+        explanation = "\n".join(str(v) for v in explanation.values() if v)
+    # Both tokenizers split identifiers at underscores; "find_order" then matches as a phrase
+    return artifact.get("insecure_code") or "", str(explanation), artifact.get("seed_topic") or ""
+
+
+def index_challenge(challenge_id, artifact, conn=None):
+    conn = conn or connection
+    code, explanation, topic = document(artifact)
+    with conn.cursor() as cursor:
+        if conn.vendor == "postgresql":
+            cursor.execute(
+                f"""INSERT INTO {TABLE} (challenge_id, insecure_code, explanation, seed_topic, document)
+                    VALUES (%s, %s, %s, %s, {_PG_DOCUMENT})
+                    ON CONFLICT (challenge_id) DO UPDATE SET
+                        insecure_code = EXCLUDED.insecure_code, explanation = EXCLUDED.explanation,
+                        seed_topic = EXCLUDED.seed_topic, document = EXCLUDED.document""",
+                [challenge_id, code, explanation, topic, topic, explanation, code],
+            )
+        else:
+            # FTS5 has no upsert
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [challenge_id])
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, insecure_code, explanation, seed_topic) VALUES (%s, %s, %s, %s)",
+                [challenge_id, code, explanation, topic],
+            )
+
+
+def unindex_challenge(challenge_id, conn=None):
+    conn = conn or connection
+    column = "challenge_id" if conn.vendor == "postgresql" else "rowid"
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE {column} = %s", [challenge_id])
+
+
+def rebuild(batch_size=200):
+    """Re-index every challenge; returns the number indexed."""
+    from .models import GeneratedChallenge
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    count = 0
+    for ch in GeneratedChallenge.objects.only("id", "artifact").iterator(chunk_size=batch_size):
+        index_challenge(ch.id, ch.artifact)
+        count += 1
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return count
+
+
+def fts5_query(text):
+    """
+    A safe FTS5 query from user input: every word must match, as a quoted
+    string (so operators and punctuation are literal), ``word*`` is a prefix.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " AND ".join(terms)
+
+
+def search(text, vuln_types=(), difficulties=(), limit=20, include_stale=False):
+    """
+    Challenges matching ``text``, best first: a list of
+    {"id", "vuln_type", "difficulty", "seed_topic", "snippet", "rank"}.
+    """
+    where, params = [] if include_stale else ["NOT c.is_stale"], []
+    if vuln_types:
+        where.append(f"c.vuln_type IN ({', '.join(['%s'] * len(vuln_types))})")
+        params.extend(vuln_types)
+    if difficulties:
+        where.append(f"c.difficulty IN ({', '.join(['%s'] * len(difficulties))})")
+        params.extend(difficulties)
+    filters = "".join(f" AND {w}" for w in where)
+
+    if connection.vendor == "postgresql":
+        sql = f"""
+            SELECT c.id, c.vuln_type, c.difficulty, s.seed_topic,
+                   ts_headline('english', s.explanation || ' ' || s.insecure_code, q,
+                               'MaxFragments=2, MaxWords=12, MinWords=4, StartSel=[, StopSel=]'),
+                   ts_rank(s.document, q) AS rank
+            FROM {TABLE} s
+            JOIN api_generatedchallenge c ON c.id = s.challenge_id,
+                 websearch_to_tsquery('english', %s) q
+            WHERE s.document @@ q{filters}
+            ORDER BY rank DESC, c.id DESC
+            LIMIT %s"""
+        params = [text, *params, limit]
+    else:
+        query = fts5_query(text)
+        if not query:
+            return []
+        # bm25 is lower-is-better; weights favour the topic and explanation columns
+        sql = f"""
+            SELECT c.id, c.vuln_type, c.difficulty, s.seed_topic,
+                   snippet({TABLE}, -1, '[', ']', '…', 12),
+                   -bm25({TABLE}, 1.0, 2.0, 4.0) AS rank
+            FROM {TABLE} s
+            JOIN api_generatedchallenge c ON c.id = s.rowid
+            WHERE {TABLE} MATCH %s{filters}
+            ORDER BY rank DESC, c.id DESC
+            LIMIT %s"""
+        params = [query, *params, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [
+        {"id": r[0], "vuln_type": r[1], "difficulty": r[2], "seed_topic": r[3], "snippet": r[4], "rank": round(r[5], 4)}
+        for r in rows
+    ]
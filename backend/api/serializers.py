@@ -1,7 +1,9 @@
 from rest_framework import serializers
-from .models import Challenge, Result
+from .models import Challenge, Result, GeneratedChallenge
 from django.contrib.auth.models import User
 
+MAX_BULK_RESULTS = 200
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -30,10 +32,75 @@ class ChallengeSerializer(serializers.ModelSerializer):
 class ResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = Result
-        fields = ["id", "challenge", "generated_challenge", "is_correct", "score", "created_at"]
+        fields = ["id", "challenge", "generated_challenge", "is_correct", "score", "client_key", "created_at"]
         read_only_fields = ["id", "created_at"]
+        # Uniqueness of client_key is handled by the views (a duplicate is a retry, not an error)
+        validators = []
+        extra_kwargs = {"client_key": {"required": False, "allow_null": True}}
 
     def create(self, validated_data):
         # Attach the logged-in user automatically
         user = self.context["request"].user
-        return Result.objects.create(user=user, **validated_data)
\ No newline at end of file
+        return Result.objects.create(user=user, **validated_data)
+
+class SparseFieldsMixin:
+    """
+    Lets clients trim a response with ``?fields=id,vuln_type``.
+
+    Unknown field names are ignored; if nothing valid is left the full
+    representation is returned.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.requested_fields(self.context.get("request"), self.Meta.fields)
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @staticmethod
+    def requested_fields(request, allowed):
+        if request is None:
+            return set()
+        raw = request.query_params.get("fields", "")
+        names = {name.strip() for name in raw.split(",") if name.strip()}
+        return names & set(allowed)
+
+
+class GeneratedChallengeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    artifact = serializers.JSONField(read_only=True)
+
+    class Meta:
+        model = GeneratedChallenge
+        fields = ["id", "language", "vuln_type", "difficulty", "created_at", "artifact"]
+
+
+class BulkResultItemSerializer(serializers.Serializer):
+    """
+    One answer inside a bulk submission.
+
+    Foreign keys are plain integers here; BulkResultSerializer checks them
+    with one query per table instead of one query per item.
+    """
+    challenge = serializers.IntegerField(required=False, allow_null=True)
+    generated_challenge = serializers.IntegerField(required=False, allow_null=True)
+    is_correct = serializers.BooleanField(default=False)
+    score = serializers.IntegerField()
+    client_key = serializers.CharField(max_length=64, required=False, allow_null=True)
+
+
+class BulkResultSerializer(serializers.Serializer):
+    results = BulkResultItemSerializer(many=True, allow_empty=False, max_length=MAX_BULK_RESULTS)
+
+    def validate_results(self, items):
+        for field, model in (("challenge", Challenge), ("generated_challenge", GeneratedChallenge)):
+            ids = {item[field] for item in items if item.get(field) is not None}
+            if not ids:
+                continue
+            found = set(model.objects.filter(id__in=ids).values_list("id", flat=True))
+            missing = sorted(ids - found)
+            if missing:
+                raise serializers.ValidationError(
+                    {field: f"Invalid pk(s) {missing} - object does not exist."}
+                )
+        return items
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import leaderboard, search
+from .models import GeneratedChallenge, Result
+
+
+@receiver(post_save, sender=Result)
+def add_result_to_leaderboard(sender, instance, created, **kwargs):
+    # bulk_create does not send post_save; BulkResultCreateView calls record_results itself
+    if created:
+        leaderboard.record_results([instance])
+
+
+@receiver(post_save, sender=GeneratedChallenge)
+def index_generated_challenge(sender, instance, update_fields=None, **kwargs):
+    # Saves that only touch other columns (e.g. archiving) leave the indexed text alone
+    if update_fields is None or "artifact" in update_fields:
+        search.index_challenge(instance.id, instance.artifact)
+
+
+@receiver(post_delete, sender=GeneratedChallenge)
+def unindex_generated_challenge(sender, instance, **kwargs):
+    search.unindex_challenge(instance.id)
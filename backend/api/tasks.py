@@ -1,10 +1,19 @@
 # backend/app/tasks.py
 import random
 from celery import shared_task
+from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
 from .models import GenerationRequest, GeneratedChallenge
-from .docker_runner import run_in_container
-from .llm_generator import generate_challenge_bundle
+from . import heartbeats, leaderboard
+from .docker_runner import run_many
+from .errors import CandidateError, InfrastructureError, retry_stage
+from .instrumentation import TokenBudget, add_span, record_attempt, span
+from .options import OptionBuildError, build_options
+from .queues import enqueue_generation, settle_followers
+from .reverify import (
+    SANDBOX_LABELS, build_artifact, check_tool_timeouts, sandbox_jobs, sandbox_verdict, verified_by,
+)
 
 MAX_LLM_ATTEMPTS = 5
 
@@ -97,202 +106,257 @@ SEED_TOPICS_BY_VULN = {
     ],
 }
 
-@shared_task
-def generate_challenge(generation_id: int):
+@shared_task(
+    bind=True,
+    soft_time_limit=settings.GENERATION_SOFT_TIME_LIMIT,
+    time_limit=settings.GENERATION_TIME_LIMIT,
+)
+def generate_challenge(self, generation_id: int):
+    # Imported here so the web tier, which only enqueues this task, never loads the LLM code
+    from .llm_generator import generate_challenge_bundle
+
+    if not heartbeats.claim(generation_id, self.request.id):
+        return  # already finished, or a duplicate delivery while another run is alive
     gr = GenerationRequest.objects.get(id=generation_id)
-    gr.status = "running"
-    gr.save(update_fields=["status"])
+    if gr.runs > settings.GENERATION_MAX_RUNS:
+        # Redelivered after the worker was lost again (e.g. killed by the hard time limit)
+        gr.error = f"Gave up after {gr.runs - 1} runs that did not finish"
+        if heartbeats.owned(gr).update(status="failed", error=gr.error):
+            gr.status = "failed"
+            settle_followers(gr)
+        return
+
+    def keep_alive(retry, exc):
+        heartbeats.beat(gr)
 
     try:
         last_err = None
+        # Earlier runs of this request (reaped, redelivered or requeued) keep their attempt
+        # numbers and count against MAX_LLM_ATTEMPTS and the budget
+        attempts_before = gr.attempts.count()
+        budget = TokenBudget()
+        budget.charge_attempts(gr.attempts.all())
+
+        for attempt in range(1, MAX_LLM_ATTEMPTS - attempts_before + 1):
+            exhausted = budget.exhausted()
+            if exhausted:
+                raise RuntimeError(f"{exhausted} after {attempts_before + attempt - 1} attempts: {last_err}")
+
+            # A candidate left by a run that died is verified again instead of asking the LLM
+            saved = gr.candidate
+            if saved:
+                vuln_type, seed_topic = saved["vuln_type"], saved["seed_topic"]
+            else:
+                # The requested vulnerability type, or a random one
+                vuln_type = gr.vuln_type or random.choice(VULNERABILITY_TYPES)
+
+                # Pick a seed topic appropriate for this vulnerability type
+                seed_topics = SEED_TOPICS_BY_VULN.get(vuln_type, ["generic application"])
+                seed_topic = random.choice(seed_topics)
+
+            number = attempts_before + attempt
+            with record_attempt(gr, number, vuln_type, seed_topic, budget=budget) as rec, \
+                    heartbeats.attempt_scope(gr):
+                if saved:
+                    bundle = saved["bundle"]
+                    add_span("llm", 0.0, reused=True)
+                else:
+                    # Generate the challenge bundle; timeouts and rate limits are retried
+                    # here, only an unusable bundle spends the attempt
+                    try:
+                        with heartbeats.beating(gr):
+                            bundle = retry_stage("llm", lambda: generate_challenge_bundle(
+                                vuln_type=vuln_type,
+                                seed_topic=seed_topic,
+                                difficulty=gr.difficulty,
+                            ), on_retry=keep_alive)
+                    except CandidateError as e:
+                        last_err = {"attempt": attempt, "error": "Candidate", "message": str(e)[:4000]}
+                        rec.outcome = "invalid"
+                        rec.detail = str(e)[:4000]
+                        continue  # Try again
+                    heartbeats.beat(gr, candidate={"bundle": bundle, "vuln_type": vuln_type, "seed_topic": seed_topic})
+                # Stored with the attempt whatever happens next, for later re-verification
+                rec.bundle = bundle
+
+                secure_code = bundle["secure_code"]
+                insecure_code = bundle["insecure_code"]
+                vuln_lines = bundle["vulnerable_lines"]
+
+                # Validate code length before testing (must be 20-35 lines)
+                secure_line_count = len(secure_code.strip().splitlines())
+                insecure_line_count = len(insecure_code.strip().splitlines())
+
+                if secure_line_count < 20 or insecure_line_count < 20:
+                    last_err = {
+                        "attempt": attempt,
+                        "error": "Code too short",
+                        "secure_lines": secure_line_count,
+                        "insecure_lines": insecure_line_count,
+                        "message": "Generated code must be at least 20 lines"
+                    }
+                    rec.outcome = "invalid"
+                    rec.detail = f"Code too short ({secure_line_count}/{insecure_line_count} lines)"
+                    continue  # Try again
+
+                if secure_line_count > 35 or insecure_line_count > 35:
+                    last_err = {
+                        "attempt": attempt,
+                        "error": "Code too long",
+                        "secure_lines": secure_line_count,
+                        "insecure_lines": insecure_line_count,
+                        "message": "Generated code must be at most 35 lines"
+                    }
+                    rec.outcome = "invalid"
+                    rec.detail = f"Code too long ({secure_line_count}/{insecure_line_count} lines)"
+                    continue  # Try again
+
+                # Both sandbox runs at once; they are independent. A failed run (not
+                # failed tests) is the sandbox's fault: run both again with the same bundle.
+                with heartbeats.beating(gr):
+                    secure_results, insecure_results = retry_stage(
+                        "sandbox", lambda: run_many(sandbox_jobs(bundle), labels=SANDBOX_LABELS), on_retry=keep_alive,
+                    )
+                heartbeats.beat(gr)
+                rec.results = {"secure": secure_results, "insecure": insecure_results}
+                try:
+                    check_tool_timeouts(secure_results, insecure_results)
+                except CandidateError as e:
+                    last_err = {"attempt": attempt, "error": "Candidate", "message": str(e)}
+                    rec.outcome = "invalid"
+                    rec.detail = str(e)
+                    continue  # Try again
+
+                # Your acceptance criteria:
+                # secure code tests must pass, insecure code tests must fail
+                secure_tests_passed, insecure_tests_failed = sandbox_verdict(secure_results, insecure_results)
+                if secure_tests_passed and insecure_tests_failed:
+                    try:
+                        with span("options"):
+                            # Seeded per attempt so a generation's options can be rebuilt exactly
+                            shuffled_options = build_options(
+                                insecure_code, vuln_lines, random.Random(f"{gr.id}:{number}")
+                            )
+                    except OptionBuildError as e:
+                        last_err = {"attempt": attempt, "error": "Options", "message": str(e)}
+                        rec.outcome = "invalid"
+                        rec.detail = str(e)
+                        continue  # Try again
+
+                    # Build final options list: correct answer + distractors
+                    artifact = build_artifact(
+                        bundle, seed_topic, shuffled_options, secure_results, insecure_results, number,
+                    )
 
-        for attempt in range(1, MAX_LLM_ATTEMPTS + 1):
-            # Pick a random vulnerability type
-            vuln_type = random.choice(VULNERABILITY_TYPES)
+                    rec.outcome = "accepted"
+                    verified_image = verified_by()
+                    with transaction.atomic():
+                        if not heartbeats.owned(gr).update(status="done", candidate=None):
+                            raise heartbeats.LostOwnership(f"Generation {gr.id} was handed to another run")
+                        gr.status = "done"
+                        challenge = GeneratedChallenge.objects.create(
+                            generation=gr,
+                            language=bundle["language"],
+                            vuln_type=bundle["vuln_type"],
+                            difficulty=bundle["difficulty"],
+                            artifact=artifact,
+                            verified_image=verified_image,
+                            verified_at=timezone.now(),
+                        )
+                    # Stored with the attempt row when this block exits
+                    rec.promoted_to = challenge
+                    settle_followers(gr)
+
+                    return  # success
+
+                rec.detail = (
+                    f"secure tests passed: {secure_tests_passed}, "
+                    f"insecure tests failed: {insecure_tests_failed}"
+                )
+                # The sandbox results are on the attempt row
+                last_err = {
+                    "attempt": attempt,
+                    "secure_tests_passed": secure_tests_passed,
+                    "insecure_tests_failed": insecure_tests_failed,
+                }
 
-            # Pick a seed topic appropriate for this vulnerability type
-            seed_topics = SEED_TOPICS_BY_VULN.get(vuln_type, ["generic application"])
-            seed_topic = random.choice(seed_topics)
+        # If we get here, all attempts failed acceptance criteria
+        raise RuntimeError(
+            f"LLM bundle failed verification after {max(attempts_before, MAX_LLM_ATTEMPTS)} attempts: {last_err}"
+        )
+
+    except heartbeats.LostOwnership:
+        raise  # the run that took over reports the outcome
+    except InfrastructureError as e:
+        # Still failing after the stage retries: queue the request again, keeping the
+        # candidate (attempt_scope leaves it), unless it has used up its runs
+        if gr.runs < settings.GENERATION_MAX_RUNS and heartbeats.owned(gr).update(status="queued", task_id=""):
+            gr.status, gr.task_id = "queued", ""
+            enqueue_generation(gr, countdown=settings.GENERATION_RETRY_MAX_DELAY)
+            return
+        _fail_generation(gr, e)
+        raise
+    except Exception as e:
+        # SoftTimeLimitExceeded lands here too
+        _fail_generation(gr, e)
+        raise
 
-            # Generate the challenge bundle
-            bundle = generate_challenge_bundle(
-                vuln_type=vuln_type,
-                seed_topic=seed_topic,
-                difficulty="easy"
-            )
 
-            secure_code = bundle["secure_code"]
-            insecure_code = bundle["insecure_code"]
-            tests = bundle["tests"]
-            vuln_lines = bundle["vulnerable_lines"]
+def _fail_generation(gr, exc):
+    gr.error = str(exc)
+    if heartbeats.owned(gr).update(status="failed", error=gr.error, candidate=None):
+        gr.status = "failed"
+        settle_followers(gr)
 
-            # Validate code length before testing (must be 20-35 lines)
-            secure_line_count = len(secure_code.strip().splitlines())
-            insecure_line_count = len(insecure_code.strip().splitlines())
 
-            if secure_line_count < 20 or insecure_line_count < 20:
-                last_err = {
-                    "attempt": attempt,
-                    "error": "Code too short",
-                    "secure_lines": secure_line_count,
-                    "insecure_lines": insecure_line_count,
-                    "message": "Generated code must be at least 20 lines"
-                }
-                continue  # Try again
+@shared_task
+def reconcile_leaderboard():
+    """Rebuild the current leaderboard periods from Result (scheduled by Celery beat)."""
+    leaderboard.rebuild()
 
-            if secure_line_count > 35 or insecure_line_count > 35:
-                last_err = {
-                    "attempt": attempt,
-                    "error": "Code too long",
-                    "secure_lines": secure_line_count,
-                    "insecure_lines": insecure_line_count,
-                    "message": "Generated code must be at most 35 lines"
-                }
-                continue  # Try again
-
-            secure_results = run_in_container({"code": secure_code, "tests": tests})
-            insecure_results = run_in_container({"code": insecure_code, "tests": tests})
-
-            # Check if docker runner completed successfully
-            secure_ok = bool(secure_results.get("ok", False))
-            insecure_ok = bool(insecure_results.get("ok", False))
-
-            # Check if tests passed (returncode 0 = all tests passed)
-            secure_tests_passed = secure_ok and secure_results.get("tests", {}).get("returncode") == 0
-            insecure_tests_failed = insecure_ok and insecure_results.get("tests", {}).get("returncode") != 0
-
-            # Your acceptance criteria:
-            # secure code tests must pass, insecure code tests must fail
-            if secure_tests_passed and insecure_tests_failed:
-                # Generate intelligent distractor options based on the code structure
-                code_lines = insecure_code.splitlines()
-                total_lines = len(code_lines)
-
-                # Collect all unique line numbers that aren't the vulnerability
-                all_line_numbers = set(range(1, total_lines + 1))
-                vuln_line_set = set(vuln_lines)
-                available_lines = sorted(all_line_numbers - vuln_line_set)
-
-                # Don't use labels - they give away too much
-                # Just provide line numbers and let users analyze the code
-                vuln_label = ""  # No label for correct answer
-
-                # Determine if we should use line ranges or single lines
-                # If the vulnerable lines are a range, make distractors ranges too
-                use_ranges = len(vuln_lines) > 1
-
-                # Generate distractor options from different parts of the code
-                distractors = []
-
-                # Select lines that have actual code on them (not blank or just braces)
-                candidate_lines = []
-                for line_num in available_lines:
-                    line_content = code_lines[line_num - 1].strip() if line_num <= total_lines else ""
-                    # Only include lines with meaningful content
-                    if line_content and not line_content in ['{', '}', '(', ')', '"""', "'''", "''", '""']:
-                        candidate_lines.append(line_num)
-
-                # Create 3 distractor options
-                if len(candidate_lines) >= 3:
-                    # Spread distractors across beginning, middle, and end
-                    anchor_lines = [
-                        candidate_lines[0],  # Beginning
-                        candidate_lines[len(candidate_lines) // 2],  # Middle
-                        candidate_lines[-1] if len(candidate_lines) > 1 else candidate_lines[0],  # End
-                    ]
-
-                    for anchor_line in anchor_lines:
-                        if use_ranges:
-                            # Create a range of 2-3 lines around the anchor
-                            range_size = random.choice([2, 3])
-                            start_line = max(1, anchor_line - random.randint(0, 1))
-                            end_line = min(total_lines, start_line + range_size - 1)
-
-                            # Make sure it doesn't overlap with vulnerable lines
-                            line_range = list(range(start_line, end_line + 1))
-                            if not any(line in vuln_lines for line in line_range):
-                                distractors.append({"lines": line_range, "label": ""})
-                        else:
-                            # Use single lines, but sometimes group 2-3 adjacent lines
-                            if random.random() < 0.5 and anchor_line < total_lines - 1:
-                                # Group 2-3 lines
-                                range_size = random.choice([2, 3])
-                                line_range = [anchor_line + i for i in range(min(range_size, total_lines - anchor_line + 1))]
-                                if not any(line in vuln_lines for line in line_range):
-                                    distractors.append({"lines": line_range, "label": ""})
-                            else:
-                                # Single line
-                                distractors.append({"lines": [anchor_line], "label": ""})
-
-                # If we don't have enough distractors, add more
-                while len(distractors) < 3:
-                    if candidate_lines:
-                        anchor_line = random.choice(candidate_lines)
-                        if random.random() < 0.6:  # 60% chance of range
-                            range_size = random.choice([2, 3])
-                            start_line = max(1, anchor_line - random.randint(0, 1))
-                            end_line = min(total_lines, start_line + range_size - 1)
-                            line_range = list(range(start_line, end_line + 1))
-                            if not any(line in vuln_lines for line in line_range):
-                                new_distractor = {"lines": line_range, "label": ""}
-                                if new_distractor not in distractors:
-                                    distractors.append(new_distractor)
-                        else:
-                            new_distractor = {"lines": [anchor_line], "label": ""}
-                            if new_distractor not in distractors:
-                                distractors.append(new_distractor)
-                    else:
-                        distractors.append({"lines": [1], "label": ""})
-                        break
-
-                # Build options list with correct answer and distractors
-                all_options = [
-                    {"lines": vuln_lines, "label": vuln_label, "correct": True},
-                ] + [{"lines": d["lines"], "label": d["label"], "correct": False} for d in distractors]
-
-                # Shuffle the options so correct answer isn't always first
-                random.shuffle(all_options)
-
-                # Remove the "correct" flag before sending to frontend
-                shuffled_options = [{"lines": opt["lines"], "label": opt["label"]} for opt in all_options]
-
-                # Build final options list: correct answer + distractors
-                artifact = {
-                    **bundle,
-                    "options": shuffled_options,
-                    "verification": {
-                        "secure": secure_results,
-                        "insecure": insecure_results,
-                        "attempt": attempt,
-                    },
-                }
 
-                with transaction.atomic():
-                    GeneratedChallenge.objects.create(
-                        generation=gr,
-                        language=bundle["language"],
-                        vuln_type=bundle["vuln_type"],
-                        difficulty=bundle["difficulty"],
-                        artifact=artifact,
-                    )
-                    gr.status = "done"
-                    gr.save(update_fields=["status"])
+@shared_task
+def reap_stale_generations():
+    """Queue again or fail generations whose worker went away (scheduled by Celery beat)."""
+    return heartbeats.reap()
 
-                return  # success
 
-            last_err = {
-                "attempt": attempt,
-                "secure_tests_passed": secure_tests_passed,
-                "insecure_tests_failed": insecure_tests_failed,
-                "secure_results": secure_results,
-                "insecure_results": insecure_results,
-            }
+@shared_task
+def archive_verification_logs():
+    """Move sandbox output past ARTIFACT_RETENTION_DAYS to the archive files (scheduled by Celery beat)."""
+    from . import archive
 
-        # If we get here, all attempts failed acceptance criteria
-        raise RuntimeError(f"LLM bundle failed verification after {MAX_LLM_ATTEMPTS} attempts: {last_err}")
+    stats = archive.archive_old()
+    return {**stats, "files": sorted(stats["files"])}
 
-    except Exception as e:
-        gr.status = "failed"
-        gr.error = str(e)
-        gr.save(update_fields=["status", "error"])
-        raise
+
+@shared_task
+def reverify_attempts(since=None, vuln_types=(), outcomes=None, include_reverified=False, limit=None):
+    """Verify stored candidates again after a runner fix and promote those that pass (see reverify.py)."""
+    from django.utils.dateparse import parse_datetime
+
+    from . import reverify
+
+    return reverify.reverify(
+        since=parse_datetime(since) if since else None,
+        vuln_types=vuln_types,
+        outcomes=outcomes or reverify.REVERIFY_OUTCOMES,
+        include_reverified=include_reverified,
+        limit=limit,
+    )
+
+
+@shared_task
+def reverify_corpus(run_id):
+    """
+    Re-verify one batch of a ReverificationRun, then queue the next batch
+    (bulk queue), so each task is short and a lost one is resumed from the
+    last checkpoint by `manage.py reverify_corpus --resume`.
+    """
+    from . import reverify
+    from .models import ReverificationRun
+
+    run = ReverificationRun.objects.get(id=run_id)
+    if reverify.run_batch(run):
+        reverify_corpus.apply_async((run_id,))
+    return {"run": run_id, "status": run.status, "last_id": run.last_id, "checked": run.checked}
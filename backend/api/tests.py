@@ -1,3 +1,1563 @@
-from django.test import TestCase
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from urllib.parse import urlencode
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import Count, Q, QuerySet, Sum
+from django.test import SimpleTestCase, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from challenge_runner import runner
+
+from . import (
+    archive, docker_runner, errors, heartbeats, leaderboard, metrics, profiling, queues, reverify, tracing, views,
+)
+from .docker_runner import run_in_container, run_many
+from .instrumentation import span
+from .llm_generator import DEFAULT_REPLAY_CORPUS, PROVIDERS, generate_challenge_bundle
+from .models import (
+    Challenge,
+    GeneratedChallenge,
+    GenerationAttempt,
+    GenerationRequest,
+    LeaderboardEntry,
+    Result,
+    ReverificationRun,
+)
+from .options import OptionBuildError, build_options, statement_spans
+from .serializers import MAX_BULK_RESULTS
+
+VULN_TYPES = ["sqli", "xss", "path_traversal", "cmdi", "ssrf"]
+
+
+def make_artifact(i, vuln_type):
+    """An artifact shaped like the ones generate_challenge stores (~3 KB)."""
+    code = "\n".join(f"line_{n} = {i} + {n}" for n in range(25))
+    return {
+        "language": "python",
+        "vuln_type": vuln_type,
+        "difficulty": "easy",
+        "insecure_code": code,
+        "secure_code": code,
+        "tests": "def test_ok():\n    assert True\n",
+        "vulnerable_lines": [12],
+        "explanation": {"short": "Untrusted input reaches a sink.", "fix": "Validate it."},
+        "options": [{"lines": [12], "label": ""}, {"lines": [3], "label": ""}, {"lines": [20, 21], "label": ""}],
+        "verification": {"secure": {"ok": True}, "insecure": {"ok": True}, "attempt": 1},
+    }
+
+
+def seed_dataset(users, challenges, generated, results_per_user):
+    """
+    Bulk-create a dataset shaped like production: players with answer
+    histories spread over generated challenges, finished generations with
+    their attempts, and a rebuilt leaderboard.
+    """
+    now = timezone.now()
+    players = User.objects.bulk_create([User(username=f"player{i}") for i in range(users)])
+    Challenge.objects.bulk_create([Challenge(title=f"Challenge {i}") for i in range(challenges)])
+
+    requests = GenerationRequest.objects.bulk_create(
+        [GenerationRequest(created_by=players[i % users], status="done") for i in range(generated)]
+    )
+    GenerationAttempt.objects.bulk_create([
+        GenerationAttempt(
+            generation=gr, number=1, vuln_type=VULN_TYPES[i % len(VULN_TYPES)], outcome="accepted",
+            started_at=now, duration_ms=1200.0, input_tokens=900, output_tokens=1400,
+            spans=[{"stage": "llm", "start_ms": 0.0, "duration_ms": 900.0}],
+        )
+        for i, gr in enumerate(requests)
+    ])
+    chals = GeneratedChallenge.objects.bulk_create([
+        GeneratedChallenge(
+            generation=gr, vuln_type=VULN_TYPES[i % len(VULN_TYPES)],
+            artifact=make_artifact(i, VULN_TYPES[i % len(VULN_TYPES)]),
+        )
+        for i, gr in enumerate(requests)
+    ])
+
+    Result.objects.bulk_create([
+        Result(
+            user=player, generated_challenge=chals[(u * results_per_user + n) % len(chals)],
+            is_correct=n % 3 != 0, score=10 if n % 3 else 0,
+        )
+        for u, player in enumerate(players)
+        for n in range(results_per_user)
+    ])
+    leaderboard.rebuild()
+    return players, requests, chals
+
+
+class APITestMixin:
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return client
+
+
+class QueryCountTests(APITestMixin, TestCase):
+    """
+    Pin the number of SQL queries per endpoint. A failure here means a view
+    started doing more database work per request (an N+1, an extra COUNT,
+    a lost select_related); update the number only if that is intended.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.players, cls.requests, cls.challenges = seed_dataset(
+            users=5, challenges=30, generated=40, results_per_user=12
+        )
+        cls.user = cls.players[0]
+        cls.generation = cls.requests[0]
+        cls.pending = GenerationRequest.objects.create(created_by=cls.user, status="queued")
+
+    def setUp(self):
+        self.client = self.client_for(self.user)
+
+    def assert_queries(self, num, method, path, expected_status=200, **kwargs):
+        with self.assertNumQueries(num):
+            response = getattr(self.client, method)(path, **kwargs)
+        self.assertEqual(response.status_code, expected_status, response.content[:300])
+        return response
+
+    def test_register(self):
+        # username uniqueness check, then the insert
+        self.client = APIClient()
+        self.assert_queries(2, "post", "/api/auth/register/", 201, data={
+            "username": "newplayer", "email": "new@example.com", "password": "a-long-password-1",
+        }, format="json")
+
+    def test_login(self):
+        self.user.set_password("a-long-password-1")
+        self.user.save()
+        self.client = APIClient()
+        # user lookup, last_login update
+        self.assert_queries(2, "post", "/api/auth/login/", data={
+            "username": self.user.username, "password": "a-long-password-1",
+        }, format="json")
+
+    def test_current_user(self):
+        self.assert_queries(1, "get", "/api/auth/me/")
+
+    def test_user_stats(self):
+        # user, stats aggregate, certificate exists
+        self.assert_queries(3, "get", "/api/stats/")
+
+    def test_challenge_list_does_not_scale_with_rows(self):
+        # user (the bearer token is authenticated even on AllowAny views), page
+        self.assert_queries(2, "get", "/api/challenges/")
+        Challenge.objects.bulk_create([Challenge(title=f"Extra {i}") for i in range(50)])
+        self.assert_queries(2, "get", "/api/challenges/")
+
+    def test_challenge_detail(self):
+        challenge = Challenge.objects.first()
+        self.assert_queries(2, "get", f"/api/challenges/{challenge.id}/")
+
+    def test_result_create(self):
+        # user, client_key lookup, FK validation, savepoint pair, insert, leaderboard
+        # (vuln_type + upsert), certificate rule stats, response stats
+        self.assert_queries(10, "post", "/api/results/", 201, data={
+            "generated_challenge": self.challenges[0].id, "is_correct": True, "score": 10,
+            "client_key": "k-1",
+        }, format="json")
+
+    def test_result_create_retry(self):
+        payload = {"generated_challenge": self.challenges[0].id, "is_correct": True, "score": 10, "client_key": "k-2"}
+        self.client.post("/api/results/", payload, format="json")
+        # user, FK validation, client_key lookup, response stats
+        self.assert_queries(4, "post", "/api/results/", 200, data=payload, format="json")
+
+    def test_bulk_result_create_does_not_scale_with_batch(self):
+        def batch(prefix, size):
+            return {"results": [
+                {"generated_challenge": self.challenges[n].id, "is_correct": n % 2 == 0, "score": 10,
+                 "client_key": f"{prefix}-{n}"}
+                for n in range(size)
+            ]}
+
+        # user, FK validation, savepoint pair, user lock, client_key lookup, insert, inserted keys,
+        # leaderboard (vuln_type + upsert), certificate rule stats, response stats
+        self.assert_queries(12, "post", "/api/results/bulk/", 201, data=batch("a", 2), format="json")
+        self.assert_queries(12, "post", "/api/results/bulk/", 201, data=batch("b", 30), format="json")
+
+    def test_generate(self):
+        with mock.patch("backend.api.tasks.generate_challenge.apply_async") as apply_async:
+            # user, in-flight lookup: self.pending is returned
+            response = self.assert_queries(2, "post", "/api/generator/generate/")
+            self.assertEqual((response.data["generation_id"], response.data["created"]), (self.pending.id, False))
+
+            # user, in-flight lookup, leader lookup, savepoint, insert, release, enqueued_at
+            # (medium, so it doesn't coalesce into self.pending)
+            self.client = self.client_for(self.players[1])
+            self.assert_queries(7, "post", "/api/generator/generate/", data={"difficulty": "medium"}, format="json")
+        apply_async.assert_called_once()
+
+    def test_generation_status(self):
+        # user, request + challenge (select_related), attempts
+        self.assert_queries(3, "get", f"/api/generator/generation/{self.generation.id}/")
+
+    def test_generation_status_pending(self):
+        self.assert_queries(3, "get", f"/api/generator/generation/{self.pending.id}/")
+
+    def test_generated_challenge(self):
+        self.assert_queries(2, "get", f"/api/generator/challenge/{self.challenges[0].id}/")
+
+    def test_latest_challenge(self):
+        self.assert_queries(2, "get", "/api/generator/latest/")
+
+    def test_generated_challenge_list_does_not_scale_with_rows(self):
+        self.assert_queries(2, "get", "/api/generator/challenges/")
+        self.assert_queries(2, "get", "/api/generator/challenges/?vuln_type=sqli,xss&fields=id,vuln_type")
+
+    def test_leaderboard(self):
+        # user, top entries + users, own entry, own rank
+        self.assert_queries(4, "get", "/api/leaderboard/")
+        self.assert_queries(4, "get", "/api/leaderboard/?window=week&vuln_type=sqli&limit=50")
+
+    @override_settings(METRICS_TOKEN="scrape-token")
+    def test_metrics(self):
+        self.client = APIClient(HTTP_AUTHORIZATION="Bearer scrape-token")
+        self.assert_queries(1, "get", "/metrics")
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        overridden = override_settings(METRICS_DIR=self.directory)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def in_child_process(self, fn):
+        """Run ``fn`` in a forked process that leaves like a prefork worker (os._exit, no atexit)."""
+        pid = os.fork()
+        if pid == 0:
+            try:
+                fn()
+                metrics.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+    def test_counters_of_exited_processes_are_kept(self):
+        counter, gauge = metrics.GENERATION_ATTEMPTS, metrics.SANDBOX_IN_FLIGHT
+        labels = {"vuln_type": "sqli", "outcome": "accepted"}
+        before = metrics.collect().get(counter.name, {}).get(("sqli", "accepted"), 0)
+
+        def work():
+            counter.inc(2, **labels)
+            gauge.inc()
+
+        self.in_child_process(work)
+        self.in_child_process(work)
+        merged = metrics.collect()
+        self.assertEqual(merged[counter.name][("sqli", "accepted")], before + 4)
+        # Gauges of exited processes are dropped, their counters folded into exited.json
+        self.assertEqual(merged.get(gauge.name, {}).get((), 0), gauge.values.get((), 0))
+        own = f"{os.getpid()}-{metrics._instance}.json"
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(["exited.json", "exited.lock", own]))
+
+        self.in_child_process(work)
+        self.assertEqual(metrics.collect()[counter.name][("sqli", "accepted")], before + 6)
+
+    def test_access(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.client.force_login(User.objects.create_user("player"))
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.client.force_login(User.objects.create_user("admin", is_staff=True))
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        self.client.logout()
+        with override_settings(METRICS_TOKEN="scrape-token"):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-token").status_code, 200)
+
+
+@tag("perf")
+class LatencyBudgetTests(APITestMixin, TestCase):
+    """
+    Latency budgets on a seeded large database (500 players, 40k results,
+    3k generated challenges). Each endpoint is warmed up, then the median of
+    several requests must stay within budget.
+
+    Budgets are generous for a developer laptop; scale them on slow CI with
+    LATENCY_BUDGET_SCALE=2, or skip with ``manage.py test --exclude-tag perf``.
+    """
+
+    RUNS = 7
+    SCALE = float(os.getenv("LATENCY_BUDGET_SCALE", "1"))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.players, cls.requests, cls.challenges = seed_dataset(
+            users=500, challenges=200, generated=3000, results_per_user=80
+        )
+        cls.user = cls.players[0]
+
+    def setUp(self):
+        self.client = self.client_for(self.user)
+
+    def assert_budget(self, budget_ms, method, path, **kwargs):
+        call = getattr(self.client, method)
+        call(path, **kwargs)  # warm up
+        timings = []
+        for _ in range(self.RUNS):
+            start = time.perf_counter()
+            response = call(path, **kwargs)
+            timings.append((time.perf_counter() - start) * 1000)
+            self.assertLess(response.status_code, 400, response.content[:300])
+        median = statistics.median(timings)
+        self.assertLess(
+            median, budget_ms * self.SCALE,
+            f"{method.upper()} {path}: median {median:.1f}ms over budget {budget_ms * self.SCALE:.0f}ms",
+        )
+
+    def test_user_stats(self):
+        self.assert_budget(50, "get", "/api/stats/")
+
+    def test_latest_challenge(self):
+        self.assert_budget(50, "get", "/api/generator/latest/")
+
+    def test_generation_status(self):
+        self.assert_budget(50, "get", f"/api/generator/generation/{self.requests[-1].id}/")
+
+    def test_generated_challenge_list(self):
+        self.assert_budget(100, "get", "/api/generator/challenges/?vuln_type=sqli")
+        self.assert_budget(50, "get", "/api/generator/challenges/?vuln_type=sqli&fields=id,vuln_type,difficulty")
+
+    def test_leaderboard(self):
+        self.assert_budget(100, "get", "/api/leaderboard/")
+        self.assert_budget(100, "get", "/api/leaderboard/?window=month&vuln_type=xss&limit=100")
+
+    def test_result_create(self):
+        self.assert_budget(80, "post", "/api/results/", data={
+            "generated_challenge": self.challenges[0].id, "is_correct": True, "score": 10,
+        }, format="json")
+        self.assertGreater(Result.objects.filter(user=self.user).count(), 80)
+
+    def test_bulk_result_create(self):
+        self.assert_budget(150, "post", "/api/results/bulk/", data={"results": [
+            {"generated_challenge": c.id, "is_correct": True, "score": 10} for c in self.challenges[:50]
+        ]}, format="json")
+
+
+class ChallengeListTests(APITestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        players, _, cls.challenges = seed_dataset(users=1, challenges=25, generated=45, results_per_user=0)
+        cls.user = players[0]
+
+    def setUp(self):
+        self.client = self.client_for(self.user)
+
+    def walk(self, url):
+        """Ids of every page reached by following ``next`` from ``url``, and the pages."""
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content[:300])
+            pages.append(response.data)
+            ids += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+        return ids, pages
+
+    def test_cursor_pages_cover_every_row_once(self):
+        ids, pages = self.walk("/api/generator/challenges/?page_size=20&fields=id")
+        self.assertEqual([len(p["results"]) for p in pages], [20, 20, 5])
+        self.assertEqual(ids, sorted((c.id for c in self.challenges), reverse=True))
+
+        # Rows added meanwhile don't shift the later pages
+        second = self.client.get(pages[0]["next"]).data
+        GeneratedChallenge.objects.create(generation=GenerationRequest.objects.create(status="done"),
+                                          vuln_type="sqli", artifact={})
+        self.assertEqual(self.client.get(pages[0]["next"]).data["results"], second["results"])
+        self.assertEqual(self.client.get(second["previous"]).data["results"], pages[0]["results"])
+
+        ids, pages = self.walk("/api/challenges/?page_size=10")
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(ids, sorted(Challenge.objects.values_list("id", flat=True)))
+
+    def test_filters(self):
+        ids, _ = self.walk("/api/generator/challenges/?vuln_type=sqli,xss&fields=id,vuln_type")
+        expected = [c.id for c in self.challenges if c.vuln_type in ("sqli", "xss")]
+        self.assertEqual(sorted(ids), sorted(expected))
+
+        hard = self.challenges[:3]
+        GeneratedChallenge.objects.filter(id__in=[c.id for c in hard]).update(difficulty="medium")
+        ids, _ = self.walk("/api/generator/challenges/?difficulty=medium")
+        self.assertEqual(sorted(ids), sorted(c.id for c in hard))
+
+        old = self.challenges[3:8]
+        cutoff = timezone.now() - timedelta(days=1)
+        GeneratedChallenge.objects.filter(id__in=[c.id for c in old]).update(created_at=cutoff - timedelta(days=1))
+        query = urlencode({"created_before": cutoff.isoformat(), "fields": "id"})
+        ids, _ = self.walk(f"/api/generator/challenges/?{query}")
+        self.assertEqual(sorted(ids), sorted(c.id for c in old))
+        query = urlencode({"created_after": cutoff.isoformat(), "fields": "id"})
+        ids, _ = self.walk(f"/api/generator/challenges/?{query}")
+        self.assertEqual(len(ids), 45 - len(old))
+
+        response = self.client.get("/api/generator/challenges/?created_after=yesterday")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("created_after", response.data)
+
+    def test_sparse_fields(self):
+        response = self.client.get("/api/generator/challenges/?fields=id,vuln_type,nonsense")
+        self.assertEqual(set(response.data["results"][0]), {"id", "vuln_type"})
+        response = self.client.get("/api/generator/challenges/?fields=nonsense")
+        self.assertIn("artifact", response.data["results"][0])  # nothing valid requested: full rows
+
+
+@skipUnless(getattr(settings, "SQLITE_TUNING", False), "SQLite tuning is off")
+class SQLiteTuningTests(SimpleTestCase):
+    """The connection options settings.py applies to the SQLite database, on a file of their own."""
+
+    def test_pragmas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseWrapper({**connection.settings_dict, "NAME": os.path.join(tmp, "db.sqlite3")}, alias="tuning")
+            with db.cursor() as cursor:
+                pragmas = {}
+                for name in ("journal_mode", "busy_timeout", "synchronous"):
+                    cursor.execute(f"PRAGMA {name}")
+                    pragmas[name] = cursor.fetchone()[0]
+            db.close()
+        self.assertEqual(pragmas, {"journal_mode": "wal", "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+                                   "synchronous": 1})  # 1 = NORMAL
+        # Write transactions take the lock at BEGIN
+        self.assertEqual(db.transaction_mode, "IMMEDIATE")
+
+
+class AsyncViewTests(APITestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("player")
+        cls.gr = GenerationRequest.objects.create(created_by=cls.user, status="running")
+
+    def get_stats(self, authorization=None):
+        client = APIClient()
+        if authorization is not None:
+            client.credentials(HTTP_AUTHORIZATION=authorization)
+        return client.get("/api/stats/")
+
+    def test_authentication(self):
+        self.assertEqual(self.get_stats(f"Bearer {AccessToken.for_user(self.user)}").status_code, 200)
+
+        response = self.get_stats()
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("Bearer", response["WWW-Authenticate"])
+
+        response = self.get_stats("Bearer not-a-token")
+        self.assertEqual((response.status_code, response.json()["code"]), (401, "token_not_valid"))
+
+        expired = AccessToken.for_user(self.user)
+        expired.set_exp(from_time=timezone.now() - timedelta(days=1))
+        response = self.get_stats(f"Bearer {expired}")
+        self.assertEqual((response.status_code, response.json()["code"]), (401, "token_not_valid"))
+
+        gone = User.objects.create_user("gone")
+        token = AccessToken.for_user(gone)
+        gone.delete()
+        response = self.get_stats(f"Bearer {token}")
+        self.assertEqual((response.status_code, response.json()["code"]), (401, "user_not_found"))
+
+        deactivated = User.objects.create_user("deactivated")
+        token = AccessToken.for_user(deactivated)
+        deactivated.is_active = False
+        deactivated.save(update_fields=["is_active"])
+        response = self.get_stats(f"Bearer {token}")
+        self.assertEqual((response.status_code, response.json()["code"]), (401, "user_inactive"))
+
+    def test_wait_returns_when_the_generation_finishes(self):
+        polls = []
+
+        async def finish_while_waiting(delay):
+            polls.append(delay)
+            await GenerationRequest.objects.filter(id=self.gr.id).aupdate(status="done")
+
+        start = time.monotonic()
+        with mock.patch("backend.api.views.asyncio.sleep", side_effect=finish_while_waiting):
+            response = self.client_for(self.user).get(f"/api/generator/generation/{self.gr.id}/?wait=30")
+        self.assertEqual(response.json()["status"], "done")
+        self.assertEqual(len(polls), 1)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_wait_returns_at_the_deadline(self):
+        start = time.monotonic()
+        with mock.patch("backend.api.views.GeneratorStatusView.POLL_INTERVAL", 0.05):
+            response = self.client_for(self.user).get(f"/api/generator/generation/{self.gr.id}/?wait=0.3")
+        elapsed = time.monotonic() - start
+        self.assertEqual(response.json()["status"], "running")
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(elapsed, 3)
+
+        response = self.client_for(self.user).get(f"/api/generator/generation/{self.gr.id}/?wait=soon")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DB_QUERY_COUNT_HEADER=True)
+class QueryCountHeaderTests(APITestMixin, TestCase):
+    """X-DB-Queries, which backend/scripts/loadgen.py reports per endpoint."""
+
+    @classmethod
+    def setUpTestData(cls):
+        players, _, cls.challenges = seed_dataset(users=1, challenges=0, generated=2, results_per_user=3)
+        cls.user = players[0]
+
+    def assert_header_counts_queries(self, method, path, **kwargs):
+        client = self.client_for(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path, **kwargs)
+        self.assertLess(response.status_code, 400, response.content[:300])
+        self.assertEqual(int(response["X-DB-Queries"]), len(queries))
+        return response
+
+    def test_sync_view(self):
+        self.assert_header_counts_queries("post", "/api/results/", data={
+            "generated_challenge": self.challenges[0].id, "is_correct": True, "score": 10,
+        }, format="json")
+
+    def test_async_view(self):
+        # Counted although the async ORM runs the queries in another thread
+        response = self.assert_header_counts_queries("get", "/api/stats/")
+        self.assertEqual(response["X-DB-Queries"], "3")
+
+
+class ResultSubmissionTests(APITestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        players, _, cls.challenges = seed_dataset(users=1, challenges=0, generated=3, results_per_user=0)
+        cls.user = players[0]
+
+    def setUp(self):
+        self.client = self.client_for(self.user)
+
+    def answer(self, n, client_key=None, score=10):
+        return {"generated_challenge": self.challenges[n].id, "is_correct": True, "score": score,
+                "client_key": client_key}
+
+    def test_duplicate_client_key_returns_the_recorded_result(self):
+        first = self.client.post("/api/results/", self.answer(0, "k-1"), format="json")
+        retry = self.client.post("/api/results/", self.answer(0, "k-1"), format="json")
+        self.assertEqual((first.status_code, retry.status_code), (201, 200))
+        self.assertEqual(retry.data["result"]["id"], first.data["result"]["id"])
+        self.assertEqual(Result.objects.filter(user=self.user).count(), 1)
+
+    def test_concurrent_duplicate_is_not_an_error(self):
+        stored = Result.objects.create(user=self.user, generated_challenge=self.challenges[0],
+                                       is_correct=True, score=10, client_key="k-1")
+        # The other request inserts between our client_key lookup and our insert
+        with mock.patch("django.db.models.QuerySet.first", return_value=None):
+            response = self.client.post("/api/results/", self.answer(0, "k-1"), format="json")
+        self.assertEqual(response.status_code, 200, response.content[:300])
+        self.assertEqual(response.data["result"]["id"], stored.id)
+        self.assertEqual(Result.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_skips_repeats_and_recorded_keys(self):
+        batch = {"results": [self.answer(0, "a"), self.answer(1, "a"), self.answer(1, "b"), self.answer(2)]}
+        response = self.client.post("/api/results/bulk/", batch, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["created"], response.data["duplicates"]), (3, 1))
+
+        # Resent after a dropped connection: only the answer without a client_key is new
+        response = self.client.post("/api/results/bulk/", batch, format="json")
+        self.assertEqual((response.data["created"], response.data["duplicates"]), (1, 3))
+        self.assertEqual(Result.objects.filter(user=self.user).count(), 4)
+
+    def test_bulk_reports_rows_a_concurrent_request_inserted_first(self):
+        lock_results_of = views._lock_results_of
+
+        def racing_lock(user):
+            # The competing request commits while this one waits for the lock
+            Result.objects.create(user=self.user, generated_challenge=self.challenges[1],
+                                  is_correct=False, score=0, client_key="b")
+            lock_results_of(user)
+
+        batch = {"results": [self.answer(0, "a"), self.answer(1, "b"), self.answer(2, "c")]}
+        with mock.patch("backend.api.views._lock_results_of", racing_lock):
+            response = self.client.post("/api/results/bulk/", batch, format="json")
+        self.assertEqual((response.data["created"], response.data["duplicates"]), (2, 1))
+        self.assertEqual(Result.objects.get(user=self.user, client_key="b").score, 0)
+        # The skipped row is not counted on the leaderboard a second time
+        entry = LeaderboardEntry.objects.get(user=self.user, vuln_type="", period="all")
+        self.assertEqual((entry.total, entry.score), (3, 20))
+
+    def test_bulk_counts_rows_created_in_the_same_clock_tick(self):
+        batch = {"results": [self.answer(0, "a"), self.answer(1, "b")]}
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now()):
+            first = self.client.post("/api/results/bulk/", {"results": batch["results"][:1]}, format="json")
+            second = self.client.post("/api/results/bulk/", batch, format="json")
+        self.assertEqual((first.data["created"], first.data["duplicates"]), (1, 0))
+        self.assertEqual((second.data["created"], second.data["duplicates"]), (1, 1))
+
+    def test_bulk_size_limit(self):
+        def batch(size):
+            return {"results": [self.answer(n % 3, f"k-{n}") for n in range(size)]}
+
+        response = self.client.post("/api/results/bulk/", batch(MAX_BULK_RESULTS + 1), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Result.objects.exists())
+        response = self.client.post("/api/results/bulk/", batch(MAX_BULK_RESULTS), format="json")
+        self.assertEqual(response.data["created"], MAX_BULK_RESULTS)
+
+
+class LeaderboardTests(APITestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.players, _, cls.challenges = seed_dataset(users=4, challenges=0, generated=5, results_per_user=0)
+
+    def answer(self, player, challenge, score):
+        return Result(user=player, generated_challenge=challenge, is_correct=score > 0, score=score)
+
+    def expected(self, vuln_type=""):
+        qs = Result.objects.all()
+        if vuln_type:
+            qs = qs.filter(generated_challenge__vuln_type=vuln_type)
+        return {
+            row["user_id"]: (row["score"], row["correct"], row["total"])
+            for row in qs.values("user_id").annotate(
+                score=Sum("score"), correct=Count("id", filter=Q(is_correct=True)), total=Count("id"),
+            )
+        }
+
+    def stored(self, vuln_type="", period="all"):
+        return {
+            e.user_id: (e.score, e.correct, e.total)
+            for e in LeaderboardEntry.objects.filter(vuln_type=vuln_type, period=period)
+        }
+
+    def test_rebuild_matches_results(self):
+        a, b, c, _ = self.players
+        Result.objects.bulk_create(  # no post_save: the incremental path never saw these
+            [self.answer(a, ch, 10) for ch in self.challenges]
+            + [self.answer(b, self.challenges[0], 0), self.answer(c, self.challenges[1], 10)]
+        )
+        self.assertEqual(self.stored(), {})
+
+        leaderboard.rebuild()
+        self.assertEqual(self.stored(), self.expected())
+        self.assertEqual(self.stored(period=leaderboard.period_key("week")), self.expected())
+        vuln_type = self.challenges[0].vuln_type
+        self.assertEqual(self.stored(vuln_type), self.expected(vuln_type))
+
+        # Increments after a rebuild add to the rebuilt totals
+        self.client_for(b).post("/api/results/", {"generated_challenge": self.challenges[2].id,
+                                                  "is_correct": True, "score": 10}, format="json")
+        Result.objects.filter(user=c).delete()
+        self.assertEqual(self.stored()[b.id], (10, 1, 2))
+        leaderboard.rebuild()
+        self.assertEqual(self.stored(), self.expected())
+
+    def test_ranks(self):
+        a, b, c, d = self.players
+        Result.objects.bulk_create([
+            self.answer(a, self.challenges[0], 30),
+            self.answer(b, self.challenges[0], 20), self.answer(b, self.challenges[1], 0),
+            self.answer(c, self.challenges[0], 20),
+            self.answer(d, self.challenges[0], 10),
+        ])
+        leaderboard.rebuild()
+
+        response = self.client_for(d).get("/api/leaderboard/")
+        ranks = [(e["rank"], e["username"], e["total"]) for e in response.data["entries"]]
+        # b and c tie on score and correct answers and share a rank; the next rank is skipped
+        self.assertEqual(ranks, [(1, a.username, 1), (2, c.username, 1), (2, b.username, 2), (4, d.username, 1)])
+        self.assertEqual(response.data["me"]["rank"], 4)
+
+
+@mock.patch.dict(os.environ, {"LLM_PROVIDER": "replay"})
+@mock.patch("backend.api.tasks.run_many", return_value=[{"ok": True, "tests": {"returncode": 0}}] * 2)
+class GenerationBudgetTests(TestCase):
+    """generate_challenge against the replay corpus, with every candidate rejected."""
+
+    def setUp(self):
+        self.gr = GenerationRequest.objects.create(status="queued")
+
+    def run_generation(self):
+        from .tasks import generate_challenge
+        with self.assertRaises(RuntimeError) as ctx:
+            generate_challenge(self.gr.id)
+        self.gr.refresh_from_db()
+        return str(ctx.exception)
+
+    @override_settings(GENERATION_TOKEN_BUDGET=1)
+    def test_token_budget_stops_attempts(self, run_many):
+        error = self.run_generation()
+        self.assertTrue(error.startswith("Token budget exhausted"), error)
+        self.assertEqual(self.gr.status, "failed")
+        attempt = self.gr.attempts.get()
+        self.assertEqual((attempt.provider, attempt.outcome), ("replay", "rejected"))
+        self.assertGreater(attempt.input_tokens, 0)
+
+    @override_settings(GENERATION_COST_BUDGET_USD=0.01, LLM_TOKEN_PRICES={
+        "claude-3-5-sonnet-20241022": {"input": 3, "output": 15}, "gpt-4o-2024-08-06": {"input": 2.5, "output": 10},
+    })
+    def test_cost_budget_stops_attempts(self, run_many):
+        error = self.run_generation()
+        self.assertTrue(error.startswith("Cost budget exhausted"), error)
+        self.assertLess(self.gr.attempts.count(), 5)
+
+    def record_earlier_run(self, attempts, tokens):
+        GenerationAttempt.objects.bulk_create([
+            GenerationAttempt(generation=self.gr, number=n, vuln_type="sqli", outcome="rejected",
+                              started_at=timezone.now(), input_tokens=tokens, output_tokens=0)
+            for n in range(1, attempts + 1)
+        ])
+
+    def test_requeued_run_continues_the_attempt_count(self, run_many):
+        self.record_earlier_run(attempts=3, tokens=100)
+        error = self.run_generation()
+        self.assertIn("after 5 attempts", error)
+        self.assertEqual(list(self.gr.attempts.values_list("number", flat=True)), [1, 2, 3, 4, 5])
+
+    @override_settings(GENERATION_TOKEN_BUDGET=1000)
+    def test_requeued_run_keeps_the_spent_budget(self, run_many):
+        self.record_earlier_run(attempts=2, tokens=600)
+        error = self.run_generation()
+        self.assertTrue(error.startswith("Token budget exhausted (1200/1000 tokens) after 2 attempts"), error)
+        self.assertEqual(self.gr.attempts.count(), 2)
+
+    def test_accepted_attempt_links_its_challenge(self, run_many):
+        from .tasks import generate_challenge
+
+        run_many.return_value = [{"ok": True, "tests": {"returncode": 0}}, {"ok": True, "tests": {"returncode": 1}}]
+        generate_challenge(self.gr.id)
+        attempt = self.gr.attempts.get()
+        self.assertEqual(attempt.outcome, "accepted")
+        self.assertEqual(attempt.promoted_to, GeneratedChallenge.objects.get(generation=self.gr))
+
+    def test_unlimited_budget_uses_all_attempts(self, run_many):
+        self.run_generation()
+        self.assertEqual(self.gr.attempts.count(), 5)
+        self.assertFalse(self.gr.attempts.filter(promoted_to__isnull=False).exists())
+
+        out = StringIO()
+        call_command("token_report", "--by", "provider,vuln_type", "--json", stdout=out)
+        rows = json.loads(out.getvalue())
+        self.assertEqual({r["provider"] for r in rows}, {"replay"})
+        self.assertEqual(sum(r["attempts"] for r in rows), 5)
+        self.assertTrue(all(r["tokens_per_accept"] is None for r in rows))
+
+
+class TracingTests(APITestMixin, TestCase):
+    TRACEPARENT = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+
+    def setUp(self):
+        self.trace_file = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "trace.jsonl")
+        self.enterContext(override_settings(TRACE_FILE=self.trace_file))
+        self.client = self.client_for(User.objects.create(username="tracer"))
+
+    def exported_spans(self):
+        with open(self.trace_file) as f:
+            return [
+                span
+                for line in f
+                for rs in json.loads(line)["resourceSpans"]
+                for ss in rs["scopeSpans"]
+                for span in ss["spans"]
+            ]
+
+    def test_trace_continues_from_request_into_task_headers(self):
+        headers = {}
+        with mock.patch(
+            "backend.api.tasks.generate_challenge.apply_async",
+            side_effect=lambda *args, **kwargs: tracing._before_task_publish(headers=headers),
+        ):
+            response = self.client.post("/api/generator/generate/", HTTP_TRACEPARENT=self.TRACEPARENT)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["traceparent"].startswith("00-" + "a" * 32))
+        self.assertEqual(headers["traceparent"], response["traceparent"])
+
+        (server,) = self.exported_spans()
+        self.assertEqual((server["traceId"], server["parentSpanId"]), ("a" * 32, "b" * 16))
+        self.assertEqual(server["name"], "POST /api/generator/generate/")
+
+    def test_instrumentation_spans_nest_under_current_span(self):
+        with tracing.start_span("outer"):
+            with span("llm", provider="replay") as record:
+                record["input_tokens"] = 10
+
+        inner, outer = self.exported_spans()
+        self.assertEqual(inner["parentSpanId"], outer["spanId"])
+        self.assertIn({"key": "input_tokens", "value": {"intValue": "10"}}, inner["attributes"])
+
+
+class ProfilingTests(APITestMixin, TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = Path(tmp.name)
+        overridden = override_settings(PROFILE_DIR=tmp.name, PROFILE_HEADER_TOKEN="profile-me")
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def samples(self):
+        return sorted(p.name.split("-")[1] for p in self.directory.glob("*.prof"))
+
+    def test_one_profile_per_process(self):
+        profiler = profiling.start()
+        try:
+            started = []
+            thread = threading.Thread(target=lambda: started.append(profiling.start()))
+            thread.start()
+            thread.join()
+            self.assertEqual(started, [None])
+        finally:
+            profiling.discard(profiler)
+        profiler = profiling.start()
+        self.assertIsNotNone(profiler)
+        profiling.discard(profiler)
+
+    def test_profiler_refused_by_python_skips_the_sample(self):
+        with mock.patch("cProfile.Profile.enable", side_effect=ValueError("Another profiling tool is already active")):
+            self.assertIsNone(profiling.start())
+        profiler = profiling.start()  # the refusal didn't leave the lock held
+        self.assertIsNotNone(profiler)
+        profiling.discard(profiler)
+
+    @override_settings(PROFILE_MAX_FILES=2)
+    def test_rotation_skips_files_removed_by_another_process(self):
+        for n in range(3):
+            (self.directory / f"task-old{n}-0.prof").touch()
+            os.utime(self.directory / f"task-old{n}-0.prof", (n, n))
+        glob = Path.glob
+
+        def racing_glob(path, pattern):
+            paths = list(glob(path, pattern))
+            (self.directory / "task-old1-0.prof").unlink()  # between the glob and the stat
+            return paths
+
+        with mock.patch.object(Path, "glob", racing_glob):
+            profiling.stop(profiling.start(), "task", "new")
+        self.assertEqual(self.samples(), ["new", "old2"])
+
+    def test_requests(self):
+        client = self.client_for(User.objects.create_user("player"))
+        self.assertEqual(client.get("/api/leaderboard/", HTTP_X_PROFILE="profile-me").status_code, 200)
+        self.assertEqual(self.samples(), ["leaderboard"])
+
+        # Async view: not sampled
+        self.assertEqual(client.get("/api/stats/", HTTP_X_PROFILE="profile-me").status_code, 200)
+        self.assertEqual(self.samples(), ["leaderboard"])
+
+        # Picked while another profile runs: served, not sampled
+        profiler = profiling.start()
+        try:
+            self.assertEqual(client.get("/api/leaderboard/", HTTP_X_PROFILE="profile-me").status_code, 200)
+        finally:
+            profiling.discard(profiler)
+        self.assertEqual(self.samples(), ["leaderboard"])
+
+
+class OptionBuilderTests(SimpleTestCase):
+    CODE = "\n".join([
+        '"""Lookup."""',
+        "import sqlite3",
+        "",
+        "",
+        "@cached",
+        "def find(conn, name):",
+        '    """Find a user."""',
+        "    query = (",
+        "        f\"SELECT * FROM users WHERE name = '{name}'\"",
+        "    )",
+        "    cur = conn.execute(query)",
+        "    row = cur.fetchone()",
+        "    if row is None:",
+        "        return None",
+        "    return row",
+    ])
+
+    def test_distractors_are_statements_outside_the_answer(self):
+        self.assertEqual(
+            statement_spans(self.CODE),
+            [(2, 2), (5, 6), (8, 10), (11, 11), (12, 12), (13, 13), (14, 14), (15, 15)],
+        )
+        for seed in range(50):
+            options = build_options(self.CODE, [11], random.Random(seed))
+            lines = [o["lines"] for o in options]
+            self.assertEqual(len(lines), 4)
+            self.assertIn([11], lines)
+            self.assertEqual(len({tuple(l) for l in lines}), 4)
+            self.assertTrue(all(l == [11] or 11 not in l for l in lines))
+
+    def test_same_seed_same_options(self):
+        self.assertEqual(
+            build_options(self.CODE, [8, 9, 10], random.Random("42:1")),
+            build_options(self.CODE, [8, 9, 10], random.Random("42:1")),
+        )
+
+    def test_too_few_candidates_fails_instead_of_spinning(self):
+        code = "x = 1\ny = 2\nz = x + y\n"
+        with self.assertRaises(OptionBuildError):
+            build_options(code, [1, 2], random.Random(0))
+
+    def test_every_recorded_bundle_builds(self):
+        with open(DEFAULT_REPLAY_CORPUS, encoding="utf-8") as f:
+            bundles = [json.loads(line) for line in f if line.strip()]
+        for bundle in bundles:
+            options = build_options(bundle["insecure_code"], bundle["vulnerable_lines"], random.Random(0))
+            self.assertIn(bundle["vulnerable_lines"], [o["lines"] for o in options])
+
+
+SLEEPY_RUNNER = [
+    sys.executable, "-c",
+    "import json, sys, time; job = json.load(sys.stdin); time.sleep(job['sleep']); print(json.dumps({'ok': True, 'n': job['n']}))",
+]
+
+
+@mock.patch.dict(os.environ, {"SANDBOX_BACKEND": "local"})
+@mock.patch("backend.api.docker_runner.LOCAL_BACKEND_ALLOWED", True)
+@mock.patch("backend.api.docker_runner.runner_command", return_value=SLEEPY_RUNNER)
+class SandboxDriverTests(SimpleTestCase):
+    def timed_run_many(self, jobs, **kwargs):
+        start = time.perf_counter()
+        results = run_many(jobs, **kwargs)
+        return results, time.perf_counter() - start
+
+    def test_runs_are_concurrent_and_ordered(self, runner_command):
+        results, elapsed = self.timed_run_many([{"sleep": 0.5, "n": n} for n in range(10)])
+        self.assertEqual([r["n"] for r in results], list(range(10)))
+        self.assertLess(elapsed, 3.0)  # 5s if run one after another
+
+    @mock.patch.dict(os.environ, {"SANDBOX_CONCURRENCY": "2"})
+    def test_concurrency_limit(self, runner_command):
+        _, elapsed = self.timed_run_many([{"sleep": 0.3, "n": n} for n in range(4)])
+        self.assertGreaterEqual(elapsed, 0.6)
+
+    def test_timeout_kills_the_run(self, runner_command):
+        start = time.perf_counter()
+        with self.assertRaisesRegex(RuntimeError, "timed out after 1s"):
+            run_in_container({"sleep": 30, "n": 0}, timeout=1)
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_one_failure_raises_after_the_others_finish(self, runner_command):
+        with self.assertRaises(RuntimeError):
+            run_many([{"sleep": 0.1, "n": 0}, {"n": 1}])  # second job has no "sleep": runner exits 1
+
+    def test_local_backend_needs_the_benchmark_switch(self, runner_command):
+        with mock.patch("backend.api.docker_runner.LOCAL_BACKEND_ALLOWED", False):
+            with self.assertRaises(ImproperlyConfigured):
+                run_in_container({"sleep": 0, "n": 0})
+        runner_command.assert_not_called()
+
+
+class RunnerTests(SimpleTestCase):
+    """challenge_runner/runner.py, run on the host."""
+
+    def run_tool(self, code, timeout=60):
+        with tempfile.TemporaryDirectory() as cwd:
+            return runner.run([sys.executable, "-c", code], cwd=cwd, timeout=timeout)
+
+    def test_resource_usage(self):
+        out = self.run_tool("data = bytearray(64 * 1024 * 1024); sum(range(3_000_000))")
+        self.assertEqual((out["returncode"], out["timeout"]), (0, False))
+        self.assertGreater(out["cpu_user_ms"], 0)
+        self.assertGreater(out["max_rss_kb"], 64 * 1024)
+
+    def test_timeout(self):
+        out = self.run_tool("import time; time.sleep(30)", timeout=1)
+        self.assertEqual((out["returncode"], out["timeout"]), (124, True))
+        self.assertLess(out["duration_ms"], 10_000)
+
+    def test_timeout_after_exit_signals_nothing(self):
+        timers = []
+
+        class ManualTimer:
+            def __init__(self, interval, fn):
+                timers.append(fn)
+
+            def start(self):
+                pass
+
+            def cancel(self):
+                pass
+
+        wait4 = os.wait4
+
+        def late_timer_wait4(pid, options):
+            timers[0]()  # the timeout fires after the exit was seen, before the reap
+            return wait4(pid, options)
+
+        with mock.patch.object(runner.threading, "Timer", ManualTimer), \
+                mock.patch.object(runner.os, "wait4", late_timer_wait4), \
+                mock.patch("subprocess.Popen.send_signal") as send_signal:
+            out = self.run_tool("pass")
+        send_signal.assert_not_called()
+        self.assertEqual((out["returncode"], out["timeout"]), (0, False))
+
+    def test_sandbox_outlasts_the_tool_timeouts(self):
+        # The runner reports a hanging tool itself, before the sandbox gives up on the run
+        self.assertGreater(docker_runner.RUN_TIMEOUT, sum(timeout for _, _, timeout in runner.TOOLS) + 30)
+
+    def test_cgroup_stats(self):
+        with tempfile.TemporaryDirectory() as root:
+            self.assertIsNone(runner.cgroup_stats(root))
+            Path(root, "cpu.stat").write_text("usage_usec 5000\nuser_usec 3500\nsystem_usec 1500\n")
+            self.assertEqual(runner.cgroup_stats(root), {"cpu_user_ms": 3.5, "cpu_sys_ms": 1.5})
+            Path(root, "memory.peak").write_text("10485760\n")
+            self.assertEqual(runner.cgroup_stats(root)["memory_peak_kb"], 10240)
+            Path(root, "cpu.stat").write_text("usage_usec 5000\n")  # no user/system split
+            self.assertEqual(runner.cgroup_stats(root), {"memory_peak_kb": 10240})
+
+
+class QueueTests(APITestMixin, TestCase):
+    def setUp(self):
+        self.client = self.client_for(User.objects.create(username="queued"))
+
+    @mock.patch("backend.api.tasks.generate_challenge.apply_async")
+    def test_caller_picks_the_queue(self, apply_async):
+        response = self.client.post("/api/generator/generate/", {"priority": "bulk"}, format="json")
+        self.assertEqual(response.data["priority"], "bulk")
+        gr = GenerationRequest.objects.get(id=response.data["generation_id"])
+        self.assertIsNotNone(gr.enqueued_at)
+        apply_async.assert_called_once_with((gr.id,), queue="bulk")
+
+        self.client.post("/api/generator/generate/")
+        self.assertEqual(apply_async.call_args.kwargs["queue"], "interactive")
+
+        response = self.client.post("/api/generator/generate/", {"priority": "urgent"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_queue_wait_is_observed_per_queue(self):
+        headers = {}
+        queues._before_task_publish(headers=headers)
+        task = mock.Mock()
+        task.request.enqueued_at = headers["enqueued_at"] - 2
+        task.request.delivery_info = {"routing_key": "interactive"}
+        count, total = (metrics.QUEUE_WAIT.values.get(("interactive",)) or [0.0, 0])[-1:-3:-1]
+        queues._task_prerun(task=task)
+        slot = metrics.QUEUE_WAIT.values[("interactive",)]
+        self.assertEqual(slot[-1], count + 1)
+        self.assertGreaterEqual(slot[-2] - total, 2.0)
+
+
+@mock.patch("backend.api.tasks.generate_challenge.apply_async")
+class CoalescingTests(APITestMixin, TestCase):
+    def setUp(self):
+        self.alice, self.bob = User.objects.create(username="alice"), User.objects.create(username="bob")
+
+    def generate(self, user, key=None, **data):
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        return self.client_for(user).post("/api/generator/generate/", data, format="json", **headers).data
+
+    def test_idempotency_key_and_one_pending_per_user(self, apply_async):
+        first = self.generate(self.alice, key="click-1")
+        self.assertTrue(first["created"])
+        self.assertEqual(self.generate(self.alice, key="click-1")["generation_id"], first["generation_id"])
+        self.assertEqual(self.generate(self.alice)["generation_id"], first["generation_id"])
+
+        GenerationRequest.objects.filter(id=first["generation_id"]).update(status="done")
+        # The key still maps to the finished request; a new click starts a new one
+        self.assertEqual(self.generate(self.alice, key="click-1")["generation_id"], first["generation_id"])
+        self.assertTrue(self.generate(self.alice, key="click-2")["created"])
+        self.assertEqual(apply_async.call_count, 2)
+
+    def test_identical_requests_share_one_run(self, apply_async):
+        from .tasks import generate_challenge
+
+        leader = self.generate(self.alice, vuln_type="sqli")
+        follower = self.generate(self.bob, vuln_type="sqli")
+        other = self.generate(User.objects.create(username="carol"), vuln_type="xss")
+        self.assertEqual(follower["coalesced_into"], leader["generation_id"])
+        self.assertIsNone(other["coalesced_into"])
+        self.assertEqual(apply_async.call_count, 2)
+
+        with mock.patch.dict(os.environ, {"LLM_PROVIDER": "replay"}), \
+                mock.patch("backend.api.tasks.run_many", return_value=[
+                    {"ok": True, "tests": {"returncode": 0}}, {"ok": True, "tests": {"returncode": 1}},
+                ]):
+            generate_challenge(leader["generation_id"])
+
+        status = self.client_for(self.bob).get(f"/api/generator/generation/{follower['generation_id']}/").json()
+        challenge = GeneratedChallenge.objects.get(generation_id=leader["generation_id"])
+        self.assertEqual((status["status"], status["challenge_id"]), ("done", challenge.id))
+        self.assertEqual(challenge.vuln_type, "sqli")
+        self.assertEqual(GenerationRequest.objects.get(id=follower["generation_id"]).status, "done")
+
+    def test_follower_of_a_run_that_failed_meanwhile_queues_its_own(self, apply_async):
+        leader = self.generate(self.alice)
+
+        def finished(gr, fields=None):
+            gr.status = "failed"  # the leader's task ended between lookup and insert
+
+        with mock.patch.object(GenerationRequest, "refresh_from_db", autospec=True, side_effect=finished):
+            gr, created = queues.submit_generation(self.bob)
+        self.assertTrue(created)
+        self.assertIsNone(GenerationRequest.objects.get(id=gr.id).coalesced_into_id)
+        self.assertNotEqual(gr.id, leader["generation_id"])
+        self.assertEqual(apply_async.call_count, 2)
+
+
+@mock.patch("backend.api.tasks.generate_challenge.apply_async")
+class ReaperTests(TestCase):
+    def setUp(self):
+        self.bundle = json.loads(open(DEFAULT_REPLAY_CORPUS, encoding="utf-8").readline())
+        self.gr = GenerationRequest.objects.create(status="queued")
+
+    def die_mid_run(self, task_id="task-1"):
+        """Claim like a worker, save a candidate, then go quiet for longer than GENERATION_STALE_AFTER."""
+        self.assertTrue(heartbeats.claim(self.gr.id, task_id))
+        self.gr.refresh_from_db()
+        heartbeats.beat(self.gr, candidate={"bundle": self.bundle, "vuln_type": "sqli", "seed_topic": "orders"})
+        GenerationRequest.objects.filter(id=self.gr.id).update(
+            heartbeat_at=timezone.now() - timedelta(seconds=settings.GENERATION_STALE_AFTER + 1),
+        )
+
+    def reap(self):
+        with self.assertLogs("backend.api.heartbeats", "WARNING"):
+            return heartbeats.reap()
+
+    def test_claim_is_exclusive_except_for_redelivery(self, apply_async):
+        self.assertTrue(heartbeats.claim(self.gr.id, "task-1"))
+        self.assertFalse(heartbeats.claim(self.gr.id, "task-2"))
+        self.assertTrue(heartbeats.claim(self.gr.id, "task-1"))  # acks_late redelivery
+        self.assertEqual(GenerationRequest.objects.get(id=self.gr.id).runs, 2)
+
+    def test_stale_run_is_requeued_and_resumes_its_candidate(self, apply_async):
+        from .tasks import generate_challenge
+
+        self.die_mid_run()
+        self.assertEqual(self.reap(), {"requeued": [self.gr.id], "failed": []})
+        apply_async.assert_called_once_with((self.gr.id,), queue="interactive")
+
+        with mock.patch("backend.api.llm_generator.generate_challenge_bundle") as llm, \
+                mock.patch("backend.api.tasks.run_many", return_value=[
+                    {"ok": True, "tests": {"returncode": 0}}, {"ok": True, "tests": {"returncode": 1}},
+                ]):
+            generate_challenge(self.gr.id)
+        llm.assert_not_called()
+
+        self.gr.refresh_from_db()
+        self.assertEqual((self.gr.status, self.gr.runs, self.gr.candidate), ("done", 2, None))
+        attempt = self.gr.attempts.get()
+        self.assertEqual(attempt.spans[0], {"stage": "llm", "outcome": "ok", "reused": True, "duration_ms": 0.0})
+
+    def test_gives_up_after_max_runs(self, apply_async):
+        follower = GenerationRequest.objects.create(status="queued", coalesced_into=self.gr)
+        GenerationRequest.objects.filter(id=self.gr.id).update(runs=settings.GENERATION_MAX_RUNS - 1)
+        self.die_mid_run()
+        self.assertEqual(self.reap(), {"requeued": [], "failed": [self.gr.id]})
+        apply_async.assert_not_called()
+        follower.refresh_from_db()
+        self.assertEqual(follower.status, "failed")
+        self.assertIn("Gave up after 3 runs", follower.error)
+
+    def test_never_claimed_request_fails_after_max_requeues(self, apply_async):
+        queued_long_ago = timezone.now() - timedelta(seconds=settings.GENERATION_QUEUED_TIMEOUT + 1)
+        for _ in range(settings.GENERATION_MAX_RUNS):
+            GenerationRequest.objects.filter(id=self.gr.id).update(enqueued_at=queued_long_ago)
+            self.assertEqual(self.reap(), {"requeued": [self.gr.id], "failed": []})
+        GenerationRequest.objects.filter(id=self.gr.id).update(enqueued_at=queued_long_ago)
+        self.assertEqual(self.reap(), {"requeued": [], "failed": [self.gr.id]})
+        self.assertEqual(apply_async.call_count, settings.GENERATION_MAX_RUNS)
+
+    @override_settings(GENERATION_HEARTBEAT_INTERVAL=0.01)
+    def test_beating_keeps_a_long_stage_alive(self, apply_async):
+        self.assertTrue(heartbeats.claim(self.gr.id, "task-1"))
+        self.gr.refresh_from_db()
+        with mock.patch("backend.api.heartbeats.beat") as beat:
+            with heartbeats.beating(self.gr):
+                time.sleep(0.1)
+            beats = beat.call_count
+            time.sleep(0.05)
+        self.assertGreater(beats, 1)
+        self.assertEqual(beat.call_count, beats)  # stops with the block
+
+    @override_settings(GENERATION_HEARTBEAT_INTERVAL=0.01)
+    def test_beating_reports_lost_ownership(self, apply_async):
+        lost = heartbeats.LostOwnership("handed to another run")
+        with mock.patch("backend.api.heartbeats.beat", side_effect=lost), \
+                self.assertRaises(heartbeats.LostOwnership):
+            with heartbeats.beating(self.gr):
+                time.sleep(0.05)
+
+    def test_heartbeat_interval_is_below_the_stale_timeout(self, apply_async):
+        self.assertLess(settings.GENERATION_HEARTBEAT_INTERVAL * 2, settings.GENERATION_STALE_AFTER)
+
+    def test_superseded_run_cannot_finish(self, apply_async):
+        self.die_mid_run("task-1")
+        stale = GenerationRequest.objects.get(id=self.gr.id)
+        self.reap()
+        self.assertTrue(heartbeats.claim(self.gr.id, "task-2"))
+        with self.assertRaises(heartbeats.LostOwnership):
+            heartbeats.beat(stale)
+
+
+class RateLimitError(Exception):
+    """Stands in for openai.RateLimitError / anthropic.RateLimitError."""
+
+
+@override_settings(GENERATION_RETRY_BASE_DELAY=0, GENERATION_RETRY_MAX_DELAY=30)
+@mock.patch.dict(os.environ, {"LLM_PROVIDER": "replay"})
+@mock.patch("backend.api.tasks.generate_challenge.apply_async")
+class StageRetryTests(TestCase):
+    PASS = [{"ok": True, "tests": {"returncode": 0}}, {"ok": True, "tests": {"returncode": 1}}]
+
+    def setUp(self):
+        self.gr = GenerationRequest.objects.create(status="queued")
+
+    def generate(self):
+        from .tasks import generate_challenge
+
+        with self.assertLogs("backend.api.errors", "WARNING"):
+            generate_challenge(self.gr.id)
+        self.gr.refresh_from_db()
+
+    def test_backoff_is_exponential_capped_and_jittered(self, apply_async):
+        delays = [errors.backoff_delay(n, base=1, cap=5) for n in range(1, 8) for _ in range(50)]
+        self.assertTrue(all(0 <= d <= 5 for d in delays))
+        self.assertLessEqual(max(errors.backoff_delay(1, base=1, cap=5) for _ in range(50)), 1)
+        self.assertGreater(len(set(delays)), 300)
+
+    def test_llm_classification(self, apply_async):
+        def flaky(vuln_type, seed_topic, difficulty):
+            raise next(failures)
+
+        failures = iter([
+            RateLimitError("slow down"), json.JSONDecodeError("Expecting value", "{", 1),
+            ValueError("Unknown model name"), KeyError("tests"),
+        ])
+        with mock.patch.dict(PROVIDERS, {"flaky": flaky}), mock.patch.dict(os.environ, {"LLM_PROVIDER": "flaky"}):
+            with self.assertRaises(errors.LLMTransientError):
+                generate_challenge_bundle("sqli", "orders")
+            with self.assertRaises(errors.CandidateError):
+                generate_challenge_bundle("sqli", "orders")
+            with self.assertRaisesMessage(ValueError, "Unknown model name") as ctx:  # configuration: not a candidate
+                generate_challenge_bundle("sqli", "orders")
+            self.assertNotIsInstance(ctx.exception, errors.CandidateError)
+            with self.assertRaises(KeyError):  # a bug, not the LLM's fault: not classified
+                generate_challenge_bundle("sqli", "orders")
+        with mock.patch.dict(PROVIDERS, {"flaky": lambda *a: {"language": "python"}}), \
+                mock.patch.dict(os.environ, {"LLM_PROVIDER": "flaky"}):
+            with self.assertRaisesMessage(errors.CandidateError, "missing vuln_type"):
+                generate_challenge_bundle("sqli", "orders")
+
+    def test_sandbox_hiccup_is_retried_with_the_same_bundle(self, apply_async):
+        with mock.patch("backend.api.llm_generator.generate_challenge_bundle",
+                        wraps=generate_challenge_bundle) as llm, \
+                mock.patch("backend.api.tasks.run_many", side_effect=[
+                    errors.SandboxError("Docker run failed (rc=125)"), self.PASS,
+                ]) as sandbox:
+            self.generate()
+        self.assertEqual((self.gr.status, llm.call_count, sandbox.call_count), ("done", 1, 2))
+        attempt = self.gr.attempts.get()
+        self.assertEqual(attempt.outcome, "accepted")
+
+    def test_rate_limit_is_retried_and_bad_bundle_spends_an_attempt(self, apply_async):
+        bundle = json.loads(open(DEFAULT_REPLAY_CORPUS, encoding="utf-8").readline())
+        bundle.pop("recording")
+        with mock.patch("backend.api.llm_generator.generate_challenge_bundle", side_effect=[
+            errors.LLMTransientError("anthropic: RateLimitError"), errors.CandidateError("no JSON"), bundle,
+        ]), mock.patch("backend.api.tasks.run_many", return_value=self.PASS):
+            self.generate()
+        self.assertEqual(self.gr.status, "done")
+        self.assertEqual(list(self.gr.attempts.order_by("id").values_list("outcome", flat=True)),
+                         ["invalid", "accepted"])
+
+    def test_hanging_tests_spend_an_attempt(self, apply_async):
+        from .tasks import generate_challenge
+
+        hanging = {"ok": True, "tests": {"returncode": 124, "timeout": True}}
+        with mock.patch("backend.api.tasks.run_many", side_effect=[[self.PASS[0], hanging], self.PASS]) as sandbox:
+            generate_challenge(self.gr.id)
+        self.gr.refresh_from_db()
+        self.assertEqual((self.gr.status, sandbox.call_count), ("done", 2))
+        apply_async.assert_not_called()
+        first, second = self.gr.attempts.order_by("number")
+        self.assertEqual((first.outcome, first.detail), ("invalid", "tests timed out on the insecure code"))
+        self.assertEqual(second.outcome, "accepted")
+        # Not a verdict on its own either: hanging tests have not caught the vulnerability
+        self.assertEqual(reverify.sandbox_verdict(self.PASS[0], hanging), (True, False))
+
+    @override_settings(GENERATION_STAGE_RETRIES=2)
+    def test_persistent_sandbox_failure_requeues_and_keeps_the_candidate(self, apply_async):
+        with mock.patch("backend.api.tasks.run_many", side_effect=errors.SandboxError("daemon down")) as sandbox:
+            self.generate()
+        self.assertEqual(sandbox.call_count, 3)
+        self.gr.refresh_from_db()
+        self.assertEqual((self.gr.status, self.gr.runs), ("queued", 1))
+        self.assertEqual(self.gr.candidate["vuln_type"], self.gr.attempts.get().vuln_type)
+        self.assertEqual(self.gr.attempts.get().outcome, "error")
+        apply_async.assert_called_once_with((self.gr.id,), queue="interactive", countdown=30)
+
+        GenerationRequest.objects.filter(id=self.gr.id).update(runs=settings.GENERATION_MAX_RUNS - 1)
+        with mock.patch("backend.api.tasks.run_many", side_effect=errors.SandboxError("daemon down")), \
+                self.assertRaises(errors.SandboxError):
+            self.generate()
+        self.gr.refresh_from_db()
+        self.assertEqual((self.gr.status, self.gr.candidate), ("failed", None))
+        self.assertEqual(list(self.gr.attempts.values_list("number", flat=True)), [1, 2])  # numbering continues
+
+
+class ReverifyTests(TestCase):
+    PASS = [{"ok": True, "tests": {"returncode": 0}}, {"ok": True, "tests": {"returncode": 1}}]
+    # pytest missing from the runner image: every secure run "fails"
+    BROKEN = [{"ok": True, "tests": {"returncode": 127}}, {"ok": True, "tests": {"returncode": 127}}]
+
+    def setUp(self):
+        from .tasks import generate_challenge
+
+        # The replay corpus has two sqli bundles, so five attempts try two distinct candidates
+        self.gr = GenerationRequest.objects.create(status="queued", vuln_type="sqli")
+        with mock.patch.dict(os.environ, {"LLM_PROVIDER": "replay"}), \
+                mock.patch("backend.api.tasks.run_many", return_value=self.BROKEN), self.assertRaises(RuntimeError):
+            generate_challenge(self.gr.id)
+
+    def reverify(self, *results, **kwargs):
+        from . import reverify
+
+        with mock.patch("backend.api.reverify.run_many_async", new=mock.AsyncMock(side_effect=results)) as sandbox, \
+                mock.patch("backend.api.llm_generator.generate_challenge_bundle") as llm:
+            stats = reverify.reverify(**kwargs)
+        llm.assert_not_called()
+        return stats, sandbox
+
+    def test_attempts_keep_their_candidate_and_results(self):
+        attempts = list(self.gr.attempts.all())
+        self.assertEqual([a.outcome for a in attempts], ["rejected"] * 5)
+        self.assertEqual(len({a.bundle_sha for a in attempts}), 2)
+        attempt = attempts[0]
+        self.assertEqual(attempt.bundle["vuln_type"], "sqli")
+        self.assertEqual(attempt.results, {"secure": self.BROKEN[0], "insecure": self.BROKEN[1]})
+        self.assertEqual(GenerationAttempt.bundle_digest(attempt.bundle), attempt.bundle_sha)
+
+    def test_passing_candidates_are_promoted_once(self):
+        stats, sandbox = self.reverify(self.PASS, self.PASS)
+        self.assertEqual(sandbox.await_count, 2)  # one run pair per distinct bundle
+        self.assertEqual((stats["candidates"], len(stats["promoted"]), stats["duplicates"]), (5, 2, 3))
+
+        challenge = GeneratedChallenge.objects.get(id=stats["promoted"][0])
+        source = challenge.source_attempt
+        self.assertEqual((challenge.generation.priority, challenge.generation.status), ("bulk", "done"))
+        self.assertEqual(challenge.artifact["verification"]["reverified_from"], source.id)
+        self.assertEqual(challenge.artifact["secure_code"], source.bundle["secure_code"])
+        self.assertEqual(len(challenge.artifact["options"]), 4)
+        self.assertEqual(GenerationRequest.objects.get(id=self.gr.id).status, "failed")  # history unchanged
+
+        self.assertEqual(self.reverify()[0]["candidates"], 0)
+        self.assertEqual(self.reverify(include_reverified=True)[0]["candidates"], 0)  # settled bundles stay settled
+
+    def test_still_failing_candidates_can_be_retried(self):
+        with self.assertLogs("backend.api.reverify", "WARNING"):
+            stats, _ = self.reverify(errors.SandboxError("daemon down"), self.BROKEN)
+        self.assertEqual((len(stats["promoted"]), stats["rejected"], stats["errors"]), (0, 1, 1))
+        self.assertEqual(self.reverify()[0]["candidates"], 0)
+
+        stats, _ = self.reverify(self.PASS, self.PASS, include_reverified=True)
+        self.assertEqual(len(stats["promoted"]), 2)
+
+    def test_command_dry_run(self):
+        out = StringIO()
+        call_command("reverify_attempts", "--dry-run", "--vuln-type", "sqli", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "5 attempts would be re-verified")
+
+
+@mock.patch("backend.api.reverify.runner_image_digest", return_value="sha256:new")
+class CorpusReverifyTests(APITestMixin, TestCase):
+    PASS = [{"ok": True, "tests": {"returncode": 0}}, {"ok": True, "tests": {"returncode": 1}}]
+
+    def setUp(self):
+        self.challenges = [
+            GeneratedChallenge.objects.create(
+                generation=GenerationRequest.objects.create(status="done"), vuln_type="sqli", artifact=make_artifact(i, "sqli"),
+            )
+            for i in range(5)
+        ]
+        self.regressing = self.challenges[-1]
+        self.broken_code = self.regressing.artifact["insecure_code"]
+        self.sandbox = mock.AsyncMock(side_effect=self.verify)
+
+    async def verify(self, jobs, labels=None):
+        # The new image breaks the tests of one challenge: they pass on its insecure code too
+        if jobs[1]["code"] == self.broken_code:
+            return [self.PASS[0], self.PASS[0]]
+        return self.PASS
+
+    def reverify_corpus(self, *args):
+        out = StringIO()
+        with mock.patch("backend.api.reverify.run_many_async", new=self.sandbox), \
+                mock.patch("backend.api.management.commands.reverify_corpus.runner_image_digest",
+                           return_value="sha256:new"):
+            call_command("reverify_corpus", "--batch-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_regressed_challenges_are_marked_stale_and_not_served(self, digest):
+        out = self.reverify_corpus()
+        self.assertIn("5/5: 4 passed, 1 failed (1 newly stale)", out)
+        run = ReverificationRun.objects.get()
+        self.assertEqual((run.status, run.last_id), ("done", self.challenges[-1].id))
+
+        self.regressing.refresh_from_db()
+        self.assertTrue(self.regressing.is_stale)
+        self.assertIn("insecure tests failed: False", self.regressing.stale_reason)
+        self.assertEqual(set(GeneratedChallenge.objects.values_list("verified_image", flat=True)), {"sha256:new"})
+
+        client = self.client_for(User.objects.create(username="player"))
+        listed = [c["id"] for c in client.get("/api/generator/challenges/?fields=id").json()["results"]]
+        self.assertEqual(len(listed), 4)
+        self.assertNotIn(self.regressing.id, listed)
+        self.assertEqual(client.get("/api/generator/latest/").json()["id"], self.challenges[-2].id)
+        self.assertEqual(client.get(f"/api/generator/challenge/{self.regressing.id}/").status_code, 410)
+        self.assertEqual(client.get(f"/api/generator/challenge/{self.challenges[0].id}/").status_code, 200)
+
+        # Verified by this image already: nothing left to do, unless asked to re-check
+        self.assertIn("Run 2 [done] 0/0", self.reverify_corpus())
+        self.regressing.artifact = make_artifact(99, "sqli")  # e.g. its tests were fixed
+        self.regressing.save()
+        self.reverify_corpus("--all")
+        self.regressing.refresh_from_db()
+        self.assertFalse(self.regressing.is_stale)
+        self.assertEqual(ReverificationRun.objects.order_by("id").last().restored, 1)
+
+    def test_interrupted_run_resumes_from_its_checkpoint(self, digest):
+        run = reverify.start_run(batch_size=2)
+        with mock.patch("backend.api.reverify.run_many_async", new=self.sandbox):
+            self.assertTrue(reverify.run_batch(run))
+        self.assertEqual((run.last_id, run.checked), (self.challenges[1].id, 2))
+        # The process dies here; another one picks the run up
+        with self.assertRaises(CommandError):
+            self.reverify_corpus()
+        out = self.reverify_corpus("--resume", str(run.id))
+        self.assertIn(f"Run {run.id} [done] 5/5", out)
+        self.assertEqual(self.sandbox.await_count, 5)  # no challenge verified twice
+
+    def test_process_that_lost_the_checkpoint_writes_no_verdicts(self, digest):
+        run = reverify.start_run(batch_size=2)
+        # Another process resumed the run and checkpointed this batch while we verified it
+        ReverificationRun.objects.filter(id=run.id).update(last_id=self.challenges[1].id)
+        with mock.patch("backend.api.reverify.run_many_async", new=self.sandbox):
+            self.assertFalse(reverify.run_batch(run))
+        self.assertFalse(GeneratedChallenge.objects.exclude(verified_image="").exists())
+        run.refresh_from_db()
+        self.assertEqual((run.last_id, run.checked), (self.challenges[1].id, 0))
+
+    def test_image_change_or_sandbox_outage_stops_the_run_without_skipping(self, digest):
+        run = reverify.start_run(batch_size=2)
+        self.sandbox.side_effect = errors.SandboxError("daemon down")
+        with mock.patch("backend.api.reverify.run_many_async", new=self.sandbox):
+            self.assertFalse(reverify.run_batch(run))
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.last_id), ("failed", 0))
+        self.assertIn("daemon down", run.error)
+
+        run = reverify.resume_run(run.id)
+        digest.return_value = "sha256:newer"
+        self.assertFalse(reverify.run_batch(run))
+        run.refresh_from_db()
+        self.assertIn("Runner image changed", run.error)
+        self.assertFalse(GeneratedChallenge.objects.exclude(verified_image="").exists())
+
+
+class ArtifactStorageTests(TestCase):
+    def setUp(self):
+        self.archive_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(ARTIFACT_ARCHIVE_DIR=self.archive_dir))
+        gr = GenerationRequest.objects.create(status="done")
+        self.artifact = {**make_artifact(1, "sqli"), "verification": {"secure": {"tests": {"stdout": "." * 4000}}, "attempt": 2}}
+        self.challenge = GeneratedChallenge.objects.create(generation=gr, artifact=self.artifact)
+
+    def test_artifact_is_stored_compressed(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT artifact FROM api_generatedchallenge WHERE id = %s", [self.challenge.id])
+            blob = bytes(cursor.fetchone()[0])
+        self.assertEqual(blob[:1], b"z")
+        self.assertLess(len(blob), len(json.dumps(self.artifact)) / 3)
+        self.assertEqual(GeneratedChallenge.objects.get(id=self.challenge.id).artifact, self.artifact)
+
+    def test_old_verification_is_archived_and_rehydrated(self):
+        GeneratedChallenge.objects.filter(id=self.challenge.id).update(created_at=timezone.now() - timedelta(days=40))
+        fresh = GeneratedChallenge.objects.create(
+            generation=GenerationRequest.objects.create(status="done"), artifact=self.artifact,
+        )
+
+        stats = archive.archive_old(older_than_days=30)
+        self.assertEqual(stats["challenges"], 1)
+
+        ch = GeneratedChallenge.objects.get(id=self.challenge.id)
+        self.assertEqual(ch.artifact["verification"]["attempt"], 2)
+        self.assertIn("archived", ch.artifact["verification"])
+        self.assertEqual(ch.artifact["insecure_code"], self.artifact["insecure_code"])
+        self.assertEqual(archive.load_verification(ch), self.artifact["verification"])
+        self.assertEqual(GeneratedChallenge.objects.get(id=fresh.id).artifact, self.artifact)
+        self.assertEqual(archive.archive_old(older_than_days=30)["challenges"], 0)
+
+        call_command("archive_verification", "--rehydrate", str(ch.id), stdout=StringIO())
+        ch.refresh_from_db()
+        self.assertEqual((ch.artifact, ch.verification_archived_at), (self.artifact, None))
+
+
+class SearchTests(APITestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="instructor", is_staff=True)
+        cls.challenges = []
+        for i, (vuln_type, topic, code) in enumerate([
+            ("sqli", "customer order lookup", "def find_order(conn, ref):\n    return conn.execute(f'SELECT {ref}')"),
+            ("sqli", "user login", "def check_password(conn, user):\n    pass"),
+            ("xss", "comment rendering", "def render_comment(body):\n    return f'<p>{body}</p>'"),
+        ]):
+            gr = GenerationRequest.objects.create(status="done")
+            cls.challenges.append(GeneratedChallenge.objects.create(
+                generation=gr, vuln_type=vuln_type,
+                artifact={**make_artifact(i, vuln_type), "insecure_code": code, "seed_topic": topic,
+                          "explanation": {"short": f"Unsafe {vuln_type} in {topic}"}},
+            ))
+
+    def search(self, expected_status=200, **params):
+        response = self.client_for(self.staff).get("/api/generator/challenges/search/", params)
+        self.assertEqual(response.status_code, expected_status, response.content[:300])
+        return response.data
+
+    def ids(self, **params):
+        return [r["id"] for r in self.search(**params)["results"]]
+
+    def test_finds_code_topic_and_explanation(self):
+        order, login, comment = (c.id for c in self.challenges)
+        self.assertEqual(self.ids(q="find_order"), [order])
+        self.assertEqual(self.ids(q="login"), [login])
+        self.assertEqual(self.ids(q="render*"), [comment])
+        self.assertEqual(set(self.ids(q="unsafe", vuln_type="sqli")), {order, login})
+        self.assertEqual(self.ids(q='"; DROP TABLE x; --'), [])
+        self.assertIn("[", self.search(q="comment")["results"][0]["snippet"])
+
+    def test_index_follows_saves_and_deletes(self):
+        ch = self.challenges[2]
+        ch.artifact["insecure_code"] = "def escape_html(text):\n    pass"
+        ch.save()
+        self.assertEqual(self.ids(q="escape_html"), [ch.id])
+        ch.delete()
+        self.assertEqual(self.ids(q="escape_html"), [])
+
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(len(self.ids(q="def")), 2)
+
+    def test_stale_challenges_only_on_request(self):
+        order = self.challenges[0]
+        GeneratedChallenge.objects.filter(id=order.id).update(is_stale=True)
+        self.assertEqual(self.ids(q="find_order"), [])
+        self.assertEqual(self.ids(q="find_order", include_stale="1"), [order.id])
+
+    def test_staff_only(self):
+        response = self.client_for(User.objects.create(username="player")).get(
+            "/api/generator/challenges/search/", {"q": "order"})
+        self.assertEqual(response.status_code, 403)
+        self.search(expected_status=400)
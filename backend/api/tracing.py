@@ -0,0 +1,207 @@
+"""
+Offline distributed tracing for the generation path.
+
+A trace follows one generate click: the API request, the Celery task it
+enqueues, every attempt's LLM call and sandbox runs, and the tool
+subprocesses inside the runner. Context travels as a W3C ``traceparent``
+string: in the HTTP header, in the Celery message headers and in the
+runner job JSON (``job["trace"]``).
+
+Finished spans are appended to settings.TRACE_FILE, one OTLP/JSON
+``ExportTraceServiceRequest`` per line (the OpenTelemetry collector's file
+exporter format), so the file can be loaded into any OTLP-aware tool or
+summarised with ``manage.py trace_summary``. Nothing leaves the machine.
+With TRACE_FILE unset, tracing is off and spans cost a context-variable
+lookup.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_write_lock = threading.Lock()
+
+# OTLP SpanKind values
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT, KIND_PRODUCER, KIND_CONSUMER = 1, 2, 3, 4, 5
+
+
+def enabled():
+    return bool(settings.TRACE_FILE)
+
+
+def new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id="", kind=KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._token = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def parse_traceparent(value):
+    """(trace_id, parent_span_id) from a traceparent string, or None if malformed."""
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+def current_traceparent():
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+
+def begin(name, kind=KIND_INTERNAL, traceparent=None, **attributes):
+    """
+    Start a span as the current one. The parent is ``traceparent`` if given
+    (a remote caller), else the current span; without either a new trace
+    starts. Returns None when tracing is off. Pair with ``end``.
+    """
+    if not enabled():
+        return None
+    remote = parse_traceparent(traceparent) if traceparent else None
+    if remote:
+        trace_id, parent_id = remote
+    else:
+        parent = _current.get()
+        trace_id, parent_id = (parent.trace_id, parent.span_id) if parent else (new_id(16), "")
+    span = Span(name, trace_id, parent_id, kind, attributes)
+    span._token = _current.set(span)
+    return span
+
+
+def end(span, error=None):
+    if span is None:
+        return
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"[:500] if isinstance(error, BaseException) else str(error)
+    try:
+        _current.reset(span._token)
+    except ValueError:
+        # Ended from another context (e.g. Celery's postrun signal); just clear it
+        _current.set(None)
+    export([span.to_otlp()])
+
+
+@contextmanager
+def start_span(name, kind=KIND_INTERNAL, traceparent=None, **attributes):
+    """Context-manager form of begin/end; yields the Span (None when tracing is off)."""
+    span = begin(name, kind, traceparent, **attributes)
+    try:
+        yield span
+    except BaseException as exc:
+        end(span, exc)
+        raise
+    else:
+        end(span)
+
+
+def otlp_attributes(attributes):
+    out = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            v = {"boolValue": value}
+        elif isinstance(value, int):
+            v = {"intValue": str(value)}
+        elif isinstance(value, float):
+            v = {"doubleValue": value}
+        else:
+            v = {"stringValue": str(value)}
+        out.append({"key": key, "value": v})
+    return out
+
+
+def export(spans, service_name=None):
+    """Append finished spans (OTLP JSON dicts) to TRACE_FILE as one resourceSpans line."""
+    if not spans or not enabled():
+        return
+    line = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({
+                "service.name": service_name or settings.TRACE_SERVICE_NAME,
+                "process.pid": os.getpid(),
+            })},
+            "scopeSpans": [{"scope": {"name": "safecode"}, "spans": spans}],
+        }],
+    }, separators=(",", ":"))
+    with _write_lock:
+        # One O_APPEND write per line keeps lines whole across web and worker processes
+        fd = os.open(settings.TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (line + "\n").encode())
+        finally:
+            os.close(fd)
+
+
+# --- Celery propagation -----------------------------------------------------
+
+def _before_task_publish(headers=None, **kwargs):
+    traceparent = current_traceparent()
+    if traceparent and headers is not None:
+        headers["traceparent"] = traceparent
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    traceparent = getattr(task.request, "traceparent", None)
+    task.request.trace_span = begin(
+        f"task {task.name}", KIND_CONSUMER, traceparent,
+        **{"celery.task_id": task_id, "celery.task_name": task.name},
+    )
+
+
+def _task_postrun(task=None, state=None, **kwargs):
+    span = getattr(task.request, "trace_span", None)
+    if span is not None:
+        span.set(**{"celery.state": state})
+        end(span, None if state == "SUCCESS" else state)
+
+
+def connect_celery_signals():
+    from celery import signals
+
+    signals.before_task_publish.connect(_before_task_publish, weak=False)
+    signals.task_prerun.connect(_task_prerun, weak=False)
+    signals.task_postrun.connect(_task_postrun, weak=False)
@@ -1,11 +1,27 @@
-from django.db.models import Count
+from django.db.models import Count, Q
 from .models import Result, Certificate
 
 
 def get_user_stats(user):
-    qs = Result.objects.filter(user=user)
-    total = qs.count()
-    correct = qs.filter(is_correct=True).count()
+    # One aggregate instead of two COUNT queries
+    counts = Result.objects.filter(user=user).aggregate(
+        total=Count("id"),
+        correct=Count("id", filter=Q(is_correct=True)),
+    )
+    total = counts["total"]
+    correct = counts["correct"]
+    accuracy = (correct / total) if total > 0 else 0.0
+    return total, correct, accuracy
+
+
+async def aget_user_stats(user):
+    """Async-ORM version of get_user_stats for the async views."""
+    counts = await Result.objects.filter(user=user).aaggregate(
+        total=Count("id"),
+        correct=Count("id", filter=Q(is_correct=True)),
+    )
+    total = counts["total"]
+    correct = counts["correct"]
     accuracy = (correct / total) if total > 0 else 0.0
     return total, correct, accuracy
 
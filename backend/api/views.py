@@ -1,14 +1,35 @@
+import asyncio
+import hmac
+import time
+
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
-from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import APIException, ValidationError
+from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.db.models import Count
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.views import View
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth.models import User
 
 from .models import Challenge, Result, Certificate, GenerationRequest, GeneratedChallenge
-from .serializers import ChallengeSerializer, ResultSerializer, UserSerializer, RegisterSerializer
-from .utils import check_and_issue_certificate, get_user_stats
-from .tasks import generate_challenge
+from .serializers import (
+    ChallengeSerializer,
+    GeneratedChallengeSerializer,
+    ResultSerializer,
+    BulkResultSerializer,
+    UserSerializer,
+    RegisterSerializer,
+)
+from .pagination import ChallengeCursorPagination, GeneratedChallengeCursorPagination
+from . import leaderboard, metrics, queues, search
+from .authentication import AsyncJWTAuthentication
+from .tasks import VULNERABILITY_TYPES
+from .utils import check_and_issue_certificate, get_user_stats, aget_user_stats
 
 
 class RegisterView(generics.CreateAPIView):
@@ -25,17 +46,48 @@ class CurrentUserView(generics.RetrieveAPIView):
         return self.request.user
 
 
-class UserStatsView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    def get(self, request):
+class AsyncAuthenticatedView(View):
+    """
+    Base for read-only endpoints served natively under ASGI.
+
+    Mirrors an APIView with JWTAuthentication + IsAuthenticated, but awaits
+    the user lookup and view body instead of holding a worker thread. Error
+    bodies match DRF's so clients (e.g. the token refresh logic in the React
+    client) see the same responses.
+    """
+    authenticator = AsyncJWTAuthentication()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await self.authenticator.aauthenticate(request)
+            if auth is None:
+                return self._error_response(
+                    {"detail": "Authentication credentials were not provided."}, 401, request
+                )
+            request.user, request.auth = auth
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+            return self._error_response(data, exc.status_code, request)
+        except Http404 as exc:
+            return self._error_response({"detail": str(exc) or "Not found."}, 404, request)
+
+    def _error_response(self, data, status_code, request):
+        response = JsonResponse(data, status=status_code, safe=False)
+        if status_code == 401:
+            response["WWW-Authenticate"] = self.authenticator.authenticate_header(request)
+        return response
+
+
+class UserStatsView(AsyncAuthenticatedView):
+    async def get(self, request):
         user = request.user
-        total, correct, accuracy = get_user_stats(user)
+        total, correct, accuracy = await aget_user_stats(user)
 
         # Check if user has earned certificate (8/10 requirement)
-        has_certificate = Certificate.objects.filter(user=user).exists()
+        has_certificate = await Certificate.objects.filter(user=user).aexists()
 
-        return Response({
+        return JsonResponse({
             "total_answered": total,
             "correct_answers": correct,
             "accuracy": accuracy,
@@ -47,6 +99,7 @@ class ChallengeViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Challenge.objects.all()
     serializer_class = ChallengeSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = ChallengeCursorPagination
 
 
 class ResultViewSet(viewsets.ModelViewSet):
@@ -55,6 +108,17 @@ class ResultViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
+def _stats_payload(user):
+    total, correct, accuracy = get_user_stats(user)
+    return {
+        "stats": {
+            "total_answered": total,
+            "correct_answers": correct,
+            "accuracy": accuracy,
+        },
+    }
+
+
 class ResultCreateView(generics.CreateAPIView):
     queryset = Result.objects.all()
     serializer_class = ResultSerializer
@@ -63,19 +127,31 @@ class ResultCreateView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
 
         user = request.user
+        client_key = serializer.validated_data.get("client_key")
+        existing = client_key and Result.objects.filter(user=user, client_key=client_key).first()
+        if not existing:
+            try:
+                with transaction.atomic():
+                    self.perform_create(serializer)
+            except IntegrityError:
+                if not client_key:
+                    raise
+                # A concurrent retry inserted this client_key after our lookup
+                existing = Result.objects.get(user=user, client_key=client_key)
+        if existing:
+            # A retry of an answer we already recorded: report it, don't count it twice
+            return Response(
+                {**_stats_payload(user), "result": self.get_serializer(existing).data, "certificate_issued": False},
+                status=status.HTTP_200_OK,
+            )
+
         certificate = check_and_issue_certificate(user, min_questions=10, threshold=0.80)
-        total, correct, accuracy = get_user_stats(user)
 
         response_data = {
             "result": serializer.data,
-            "stats": {
-                "total_answered": total,
-                "correct_answers": correct,
-                "accuracy": accuracy,
-            },
+            **_stats_payload(user),
             "certificate_issued": certificate is not None,
         }
 
@@ -83,41 +159,335 @@ class ResultCreateView(generics.CreateAPIView):
         return Response(response_data, status=status.HTTP_201_CREATED, headers=headers)
 
 
-class GeneratorGenerateView(APIView):
+class BulkResultCreateView(APIView):
+    """
+    Record a batch of answers in one transaction.
+
+    Body: {"results": [{"generated_challenge": 1, "is_correct": true, "score": 1, "client_key": "..."}, ...]}
+
+    Items whose client_key was already recorded for this user (or repeats
+    within the batch) are skipped, so a client can safely resend a batch
+    after a dropped connection. The certificate rule runs once per batch.
+    """
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        gr = GenerationRequest.objects.create(created_by=request.user, status="queued")
-        generate_challenge.delay(gr.id)
-        return Response({"generation_id": gr.id, "status": gr.status})
+        serializer = BulkResultSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data["results"]
+        user = request.user
 
+        with transaction.atomic():
+            _lock_results_of(user)
+            keys = {item["client_key"] for item in items if item.get("client_key")}
+            recorded = set(
+                Result.objects.filter(user=user, client_key__in=keys).values_list("client_key", flat=True)
+            ) if keys else set()
+            seen = set(recorded)
+
+            new_results = []
+            for item in items:
+                key = item.get("client_key")
+                if key:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                new_results.append(Result(
+                    user=user,
+                    challenge_id=item.get("challenge"),
+                    generated_challenge_id=item.get("generated_challenge"),
+                    is_correct=item["is_correct"],
+                    score=item["score"],
+                    client_key=key,
+                ))
+
+            # ignore_conflicts covers two retries of the same batch racing each other
+            Result.objects.bulk_create(new_results, ignore_conflicts=True)
+            inserted = _inserted_results(user, new_results, recorded)
+            leaderboard.record_results(inserted)
+
+        certificate = check_and_issue_certificate(user, min_questions=10, threshold=0.80) if inserted else None
 
-class GeneratorStatusView(APIView):
-    permission_classes = [IsAuthenticated]
+        return Response({
+            "created": len(inserted),
+            "duplicates": len(items) - len(inserted),
+            **_stats_payload(user),
+            "certificate_issued": certificate is not None,
+        }, status=status.HTTP_201_CREATED if inserted else status.HTTP_200_OK)
 
-    def get(self, request, generation_id: int):
-        gr = get_object_or_404(GenerationRequest, id=generation_id)
-        payload = {"id": gr.id, "status": gr.status, "error": gr.error}
-        if gr.status == "done" and hasattr(gr, "challenge"):
-            payload["challenge_id"] = gr.challenge.id
-        return Response(payload)
 
+def _lock_results_of(user):
+    """
+    Serialise the result inserts of ``user`` until the transaction ends, so
+    the client_keys a request reads are still the recorded ones when it
+    inserts (PostgreSQL; SQLite's BEGIN IMMEDIATE already serialises writers).
+    """
+    User.objects.select_for_update().filter(pk=user.pk).exists()
 
-class GeneratorChallengeView(APIView):
-    permission_classes = [IsAuthenticated]
 
-    def get(self, request, challenge_id: int):
-        ch = get_object_or_404(GeneratedChallenge, id=challenge_id)
-        return Response({"id": ch.id, **ch.artifact})
+def _inserted_results(user, results, recorded):
+    """
+    The rows of ``results`` that bulk_create(ignore_conflicts=True) really
+    inserted: keyed rows whose client_key is stored now but was not among
+    the ``recorded`` keys read before the insert, and every keyless row.
+    """
+    keys = [r.client_key for r in results if r.client_key]
+    if not keys:
+        return results
+    stored = set(Result.objects.filter(user=user, client_key__in=keys).values_list("client_key", flat=True))
+    return [r for r in results if not r.client_key or (r.client_key in stored and r.client_key not in recorded)]
 
 
-class LatestChallengeView(APIView):
+class GeneratorGenerateView(APIView):
+    """
+    Start a generation. Optional body fields: ``priority``, ``vuln_type``,
+    ``difficulty``. Repeated clicks (same ``Idempotency-Key`` header, or
+    while one is still in flight) return the existing generation with
+    ``created: false``; see queues.submit_generation.
+    """
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
+    def post(self, request):
+        priority = request.data.get("priority", queues.INTERACTIVE)
+        if priority not in queues.PRIORITIES:
+            raise ValidationError({"priority": f"Expected one of {', '.join(queues.PRIORITIES)}."})
+        vuln_type = request.data.get("vuln_type", "")
+        if vuln_type and vuln_type not in VULNERABILITY_TYPES:
+            raise ValidationError({"vuln_type": f"Expected one of {', '.join(VULNERABILITY_TYPES)}."})
+        difficulty = request.data.get("difficulty", "easy")
+        if difficulty not in queues.DIFFICULTIES:
+            raise ValidationError({"difficulty": f"Expected one of {', '.join(queues.DIFFICULTIES)}."})
+        idempotency_key = request.headers.get("Idempotency-Key", "")
+        if len(idempotency_key) > 64:
+            raise ValidationError({"Idempotency-Key": "At most 64 characters."})
+
+        gr, created = queues.submit_generation(
+            request.user, priority=priority, vuln_type=vuln_type, difficulty=difficulty,
+            idempotency_key=idempotency_key,
+        )
+        return Response({
+            "generation_id": gr.id,
+            "status": gr.status,
+            "priority": gr.priority,
+            "created": created,
+            "coalesced_into": gr.coalesced_into_id,
+        })
+
+
+class GeneratorStatusView(AsyncAuthenticatedView):
+    """
+    Generation status. With ``?wait=<seconds>`` (max 30) the request is held
+    open until the generation finishes or the wait expires, so clients can
+    long-poll instead of re-requesting every second. Under ASGI a waiting
+    request costs a suspended coroutine rather than a worker thread.
+    """
+    MAX_WAIT = 30.0
+    POLL_INTERVAL = 0.5
+
+    async def get(self, request, generation_id: int):
+        try:
+            wait = min(max(float(request.GET.get("wait") or 0), 0.0), self.MAX_WAIT)
+        except ValueError:
+            raise ValidationError({"wait": "Expected a number of seconds."})
+
+        deadline = time.monotonic() + wait
+        while True:
+            gr = await aget_object_or_404(
+                GenerationRequest.objects.select_related("challenge", "coalesced_into__challenge"), id=generation_id,
+            )
+            if gr.status in ("done", "failed") or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+        # A coalesced request reports the run it follows: its progress, challenge and attempts
+        run = gr.coalesced_into or gr
+        payload = {
+            "id": gr.id, "status": run.status, "error": run.error,
+            "priority": gr.priority, "queue_wait_ms": run.queue_wait_ms,
+            "coalesced_into": gr.coalesced_into_id,
+        }
+        if run.status == "done" and hasattr(run, "challenge"):
+            payload["challenge_id"] = run.challenge.id
+        payload["attempts"] = [
+            {
+                "number": a.number,
+                "vuln_type": a.vuln_type,
+                "outcome": a.outcome,
+                "duration_ms": a.duration_ms,
+                "input_tokens": a.input_tokens,
+                "output_tokens": a.output_tokens,
+                "spans": a.spans,
+            }
+            async for a in run.attempts.defer("bundle", "results")
+        ]
+        return JsonResponse(payload)
+
+
+class GeneratorChallengeView(AsyncAuthenticatedView):
+    async def get(self, request, challenge_id: int):
+        ch = await aget_object_or_404(GeneratedChallenge, id=challenge_id)
+        if ch.is_stale:
+            # Failed re-verification on the current runner image (reverify.run_batch)
+            return JsonResponse({"error": "Challenge is no longer available", "id": ch.id}, status=410)
+        return JsonResponse({"id": ch.id, **ch.artifact})
+
+
+class LatestChallengeView(AsyncAuthenticatedView):
+    async def get(self, request):
         """Fetch the most recently generated challenge"""
-        ch = GeneratedChallenge.objects.order_by('-id').first()
+        ch = await GeneratedChallenge.objects.filter(is_stale=False).order_by('-id').afirst()
         if not ch:
-            return Response({"error": "No challenges available"}, status=404)
+            return JsonResponse({"error": "No challenges available"}, status=404)
         # Include the ID along with the artifact data
-        return Response({"id": ch.id, **ch.artifact})
+        return JsonResponse({"id": ch.id, **ch.artifact})
+
+
+class GeneratedChallengeListView(generics.ListAPIView):
+    """
+    Cursor-paginated list of generated challenges, newest first. Stale
+    challenges (no longer verified by the current runner) are left out.
+
+    Query params:
+        vuln_type, difficulty: exact match (comma-separated for several values)
+        created_after, created_before: ISO 8601 datetimes
+        fields: comma-separated subset of the serializer fields
+    """
+    serializer_class = GeneratedChallengeSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = GeneratedChallengeCursorPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        qs = GeneratedChallenge.objects.filter(is_stale=False)
+
+        for name in ("vuln_type", "difficulty"):
+            values = [v for v in params.get(name, "").split(",") if v]
+            if len(values) == 1:
+                qs = qs.filter(**{name: values[0]})
+            elif values:
+                qs = qs.filter(**{f"{name}__in": values})
+
+        for name, lookup in (("created_after", "created_at__gte"), ("created_before", "created_at__lt")):
+            raw = params.get(name)
+            if raw:
+                value = parse_datetime(raw)
+                if value is None:
+                    raise ValidationError({name: "Expected an ISO 8601 datetime."})
+                qs = qs.filter(**{lookup: value})
+
+        # The artifact blob dominates row size; skip loading it when not requested.
+        requested = GeneratedChallengeSerializer.requested_fields(
+            self.request, GeneratedChallengeSerializer.Meta.fields
+        )
+        if requested and "artifact" not in requested:
+            qs = qs.defer("artifact")
+        return qs
+
+
+class GeneratedChallengeSearchView(APIView):
+    """
+    Full-text search over generated challenges for staff (see search.py).
+
+    Query params:
+        q: words to find in the insecure code, explanation or seed topic
+           (all must match; ``word*`` matches a prefix)
+        vuln_type, difficulty: exact match (comma-separated for several values)
+        limit: number of results, at most 100 (default 20)
+        include_stale: 1 to include challenges marked stale by re-verification
+    """
+    permission_classes = [IsAdminUser]
+    MAX_LIMIT = 100
+
+    def get(self, request):
+        params = request.query_params
+        text = params.get("q", "").strip()
+        if not text:
+            raise ValidationError({"q": "This parameter is required."})
+        try:
+            limit = min(max(int(params.get("limit") or 20), 1), self.MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({"limit": "Expected an integer."})
+
+        results = search.search(
+            text,
+            vuln_types=[v for v in params.get("vuln_type", "").split(",") if v],
+            difficulties=[v for v in params.get("difficulty", "").split(",") if v],
+            limit=limit,
+            include_stale=params.get("include_stale") == "1",
+        )
+        return Response({"count": len(results), "results": results})
+
+
+class LeaderboardView(APIView):
+    """
+    Leaderboard read from the materialised LeaderboardEntry table.
+
+    Query params:
+        vuln_type: restrict to one vulnerability type (default: all types)
+        window: "all" (default), "week" or "month" (the current one)
+        limit: number of top entries, 1-100 (default 10)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        vuln_type = request.query_params.get("vuln_type", "")
+        window = request.query_params.get("window", "all")
+        if window not in leaderboard.WINDOWS:
+            raise ValidationError({"window": f"Expected one of {', '.join(leaderboard.WINDOWS)}."})
+        try:
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), 100)
+        except ValueError:
+            raise ValidationError({"limit": "Expected an integer."})
+
+        def entry_payload(rank, entry):
+            return {
+                "rank": rank,
+                "username": entry.user.username,
+                "score": entry.score,
+                "correct": entry.correct,
+                "total": entry.total,
+            }
+
+        my_rank, my_entry = leaderboard.rank_of(request.user, vuln_type, window)
+        if my_entry is not None:
+            my_entry.user = request.user
+
+        return Response({
+            "vuln_type": vuln_type or None,
+            "window": window,
+            "period": leaderboard.period_key(window),
+            "entries": [entry_payload(rank, e) for rank, e in leaderboard.top(vuln_type, window, limit)],
+            "me": entry_payload(my_rank, my_entry) if my_entry else None,
+        })
+
+
+class MetricsView(View):
+    """
+    Prometheus scrape endpoint (text exposition format).
+
+    Readable by staff users (session login), and by scrapers sending
+    "Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set.
+    """
+
+    def get(self, request):
+        token = getattr(settings, "METRICS_TOKEN", "")
+        bearer = request.headers.get("Authorization", "").encode()
+        if not (token and hmac.compare_digest(bearer, f"Bearer {token}".encode())) and not request.user.is_staff:
+            return HttpResponse(status=403 if request.user.is_authenticated else 401)
+
+        by_status = dict(
+            GenerationRequest.objects.filter(status__in=["queued", "running"])
+            .values_list("status")
+            .annotate(n=Count("id"))
+        )
+        generation_gauge = (
+            "safecode_generation_requests",
+            "Generation requests waiting for or being processed by a worker.",
+            ["status"],
+            {(st,): by_status.get(st, 0) for st in ("queued", "running")},
+        )
+
+        return HttpResponse(
+            metrics.render(extra_gauges=[generation_gauge]),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
+# Async views run their ORM calls in short-lived per-request threads, so a
+# persistent connection could never be reused and would only pile up.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
 application = get_asgi_application()
@@ -0,0 +1,35 @@
+"""
+Helpers shared by the benchmark scripts and the report commands.
+"""
+import http.client
+import time
+from urllib.parse import urlparse
+
+
+def percentile(values, q, scale=1, digits=None):
+    """
+    Nearest-rank ``q`` quantile of ``values`` (None if there are none),
+    multiplied by ``scale`` and rounded to ``digits`` if given.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    value = values[min(len(values) - 1, int(q * len(values)))] * scale
+    return value if digits is None else round(value, digits)
+
+
+def wait_until_up(base_url, path="/api/stats/", timeout=30):
+    """Poll GET ``path`` until the server at ``base_url`` answers; RuntimeError after ``timeout`` seconds."""
+    u = urlparse(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=timeout)
+        try:
+            conn.request("GET", path)
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.3)
+        finally:
+            conn.close()
+    raise RuntimeError(f"Server at {base_url} did not come up")
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Throughput benchmark for the challenge generation pipeline.
+
+Drives generate_challenge end to end (LLM stage, both sandbox runs, option
+building, database writes) with LLM_PROVIDER=replay, so every run uses the
+same recorded bundles from backend/bench/bundles.jsonl instead of a live
+model. Each configuration (sandbox backend x worker processes) runs against
+a fresh temporary SQLite database, with workers pulling generation requests
+the way prefork Celery workers would.
+
+Reports, per configuration, as JSON:
+  - accepted challenges per minute
+  - p50/p95/p99 time-to-accept (task start -> challenge stored)
+  - attempts per accepted challenge
+  - per-stage breakdown taken from the GenerationAttempt spans
+
+Usage:
+    python backend/scripts/bench_generation.py                                  # local sandbox, 1/2/4 workers
+    python backend/scripts/bench_generation.py --backends local docker --workers 1 4 --requests 40
+    python backend/scripts/bench_generation.py --save-baseline bench-baseline.json
+    python backend/scripts/bench_generation.py --baseline bench-baseline.json --threshold 15
+
+With --baseline the exit status is 1 when any configuration regressed by more
+than --threshold percent (lower accepted/min, or higher p95 time-to-accept).
+
+SANDBOX_BACKEND=local executes the recorded code on the host without Docker;
+only use it with the trusted corpus. This script is what allows it: outside the
+benchmark the local backend is refused.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from backend.scripts._benchutil import percentile  # noqa: E402
+
+DEFAULT_CORPUS = ROOT / "backend" / "bench" / "bundles.jsonl"
+
+
+def _setup_django(env):
+    os.environ.update(env)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+    from backend.api import docker_runner
+    # Replays the trusted corpus only, so the unsandboxed backend is acceptable here
+    docker_runner.LOCAL_BACKEND_ALLOWED = True
+
+
+def _worker(env, worker_id, seed, pending, queue):
+    _setup_django(env)
+    from django.db import connection
+    from backend.api.tasks import generate_challenge
+
+    random.seed(seed + worker_id)
+    timings = []
+    began = time.time()
+    while True:
+        generation_id = pending.get()
+        if generation_id is None:
+            break
+        start = time.perf_counter()
+        try:
+            generate_challenge(generation_id)
+            ok = True
+        except Exception:
+            ok = False
+        timings.append({"id": generation_id, "ok": ok, "ms": (time.perf_counter() - start) * 1000})
+
+    connection.close()
+    queue.put({"timings": timings, "began": began, "ended": time.time()})
+
+
+def _stage_breakdown():
+    """Aggregate span durations of every recorded attempt, per stage."""
+    from backend.api.models import GenerationAttempt
+
+    stages = {}
+    for spans in GenerationAttempt.objects.values_list("spans", flat=True):
+        for s in spans or []:
+            stages.setdefault(s["stage"], []).append(s["duration_ms"])
+    return {
+        stage: {
+            "count": len(durations),
+            "total_ms": round(sum(durations), 1),
+            "p50_ms": percentile(durations, 0.50, digits=1),
+            "p95_ms": percentile(durations, 0.95, digits=1),
+        }
+        for stage, durations in sorted(stages.items())
+    }
+
+
+def _driver(env, workers, requests, seed, out):
+    """Run one configuration; lives in its own process so each gets fresh settings."""
+    _setup_django(env)
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from backend.api.models import GenerationAttempt, GenerationRequest
+
+    user, _ = User.objects.get_or_create(username="bench")
+    # Bulk: one user with many requests in flight (interactive allows one per user)
+    ids = [GenerationRequest.objects.create(created_by=user, status="queued", priority="bulk").id
+           for _ in range(requests)]
+    connection.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    pending, queue = ctx.Queue(), ctx.Queue()
+    for generation_id in ids:
+        pending.put(generation_id)
+    for _ in range(workers):
+        pending.put(None)
+
+    procs = [ctx.Process(target=_worker, args=(env, w, seed, pending, queue)) for w in range(workers)]
+    for p in procs:
+        p.start()
+    reports = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    # Measure the window in which workers were generating (excludes process start-up)
+    elapsed = max(r["ended"] for r in reports) - min(r["began"] for r in reports)
+
+    timings = [t for r in reports for t in r["timings"]]
+    accepted_ms = [t["ms"] for t in timings if t["ok"]]
+    attempts = GenerationAttempt.objects.count()
+    out.put({
+        "workers": workers,
+        "requests": requests,
+        "elapsed_s": round(elapsed, 2),
+        "accepted": len(accepted_ms),
+        "failed": len(timings) - len(accepted_ms),
+        "accepted_per_min": round(len(accepted_ms) / elapsed * 60, 1) if elapsed else None,
+        "time_to_accept_ms": {
+            "p50": percentile(accepted_ms, 0.50, digits=1),
+            "p95": percentile(accepted_ms, 0.95, digits=1),
+            "p99": percentile(accepted_ms, 0.99, digits=1),
+        },
+        "attempts": attempts,
+        "attempts_per_accept": round(attempts / len(accepted_ms), 2) if accepted_ms else None,
+        "stages": _stage_breakdown(),
+    })
+    connection.close()
+
+
+def run_config(backend, workers, requests, seed, corpus, replay_speed):
+    tmpdir = tempfile.TemporaryDirectory()
+    env = {
+        "DB_ENGINE": "sqlite",
+        "SQLITE_PATH": os.path.join(tmpdir.name, "bench.sqlite3"),
+        "METRICS_DIR": os.path.join(tmpdir.name, "metrics"),
+        "LLM_PROVIDER": "replay",
+        "LLM_REPLAY_CORPUS": str(corpus),
+        "LLM_REPLAY_SPEED": str(replay_speed),
+        "SANDBOX_BACKEND": backend,
+    }
+    subprocess.run(
+        [sys.executable, str(ROOT / "manage.py"), "migrate", "-v", "0"],
+        env={**os.environ, **env}, check=True,
+    )
+
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    driver = ctx.Process(target=_driver, args=(env, workers, requests, seed, out))
+    driver.start()
+    result = {"backend": backend, **out.get()}
+    driver.join()
+    tmpdir.cleanup()
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Return human-readable regressions of results against a stored baseline."""
+    previous = {(r["backend"], r["workers"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        base = previous.get((r["backend"], r["workers"]))
+        if base is None:
+            continue
+        label = f"{r['backend']}/{r['workers']}w"
+        if base["accepted_per_min"] and r["accepted_per_min"] is not None:
+            drop = (base["accepted_per_min"] - r["accepted_per_min"]) / base["accepted_per_min"] * 100
+            if drop > threshold:
+                regressions.append(f"{label}: accepted/min {base['accepted_per_min']} -> "
+                                   f"{r['accepted_per_min']} (-{drop:.1f}%)")
+        old_p95, new_p95 = base["time_to_accept_ms"]["p95"], r["time_to_accept_ms"]["p95"]
+        if old_p95 and new_p95 is not None:
+            rise = (new_p95 - old_p95) / old_p95 * 100
+            if rise > threshold:
+                regressions.append(f"{label}: p95 time-to-accept {old_p95}ms -> {new_p95}ms (+{rise:.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generation pipeline throughput benchmark")
+    parser.add_argument("--backends", nargs="+", default=["local"], choices=["local", "docker"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4], help="Worker process counts")
+    parser.add_argument("--requests", type=int, default=24, help="Generation requests per configuration")
+    parser.add_argument("--seed", type=int, default=1234, help="Seeds vuln type / topic / option choices")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="Recorded bundles (JSON lines)")
+    parser.add_argument("--replay-speed", type=float, default=0.0,
+                        help="Fraction of the recorded LLM latency to simulate (0 = none)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results as the new baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a stored baseline")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent")
+    args = parser.parse_args()
+
+    results = [
+        run_config(backend, workers, args.requests, args.seed, args.corpus, args.replay_speed)
+        for backend in args.backends
+        for workers in args.workers
+    ]
+
+    print(f"{'BACKEND':<8} {'WORKERS':>7} {'ACC/MIN':>8} {'FAILED':>6} {'ATT/ACC':>7} {'P50ms':>8} {'P95ms':>8} {'P99ms':>8}",
+          file=sys.stderr)
+    for r in results:
+        lat = r["time_to_accept_ms"]
+        print(f"{r['backend']:<8} {r['workers']:>7} {r['accepted_per_min']:>8} {r['failed']:>6} "
+              f"{r['attempts_per_accept']:>7} {lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8}", file=sys.stderr)
+
+    report = {"config": {"requests": args.requests, "seed": args.seed, "replay_speed": args.replay_speed},
+              "results": results}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report["regressions"] = regressions
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
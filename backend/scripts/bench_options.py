@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for the answer-option builder (backend/api/options.py).
+
+Runs statement_spans and build_options over a corpus of challenges: the
+recorded bundles in backend/bench/bundles.jsonl and, with --db, the stored
+GeneratedChallenge artifacts of the configured database. Every challenge is
+built --iterations times with different seeds.
+
+Reports, as JSON:
+  - p50/p99/max microseconds per call for each function
+  - challenges the builder rejects (OptionBuildError) and why
+  - whether a fixed seed reproduces the same options
+
+Usage:
+    python backend/scripts/bench_options.py
+    python backend/scripts/bench_options.py --db --iterations 500
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from backend.scripts._benchutil import percentile  # noqa: E402
+
+DEFAULT_CORPUS = ROOT / "backend" / "bench" / "bundles.jsonl"
+
+
+def load_corpus(path, from_db):
+    corpus = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            if line.strip():
+                bundle = json.loads(line)
+                corpus.append((f"bench:{n}:{bundle['vuln_type']}", bundle["insecure_code"], bundle["vulnerable_lines"]))
+
+    if from_db:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+        import django
+        django.setup()
+        from backend.api.models import GeneratedChallenge
+
+        for cid, artifact in GeneratedChallenge.objects.values_list("id", "artifact").iterator():
+            if artifact.get("insecure_code") and artifact.get("vulnerable_lines"):
+                corpus.append((f"db:{cid}", artifact["insecure_code"], artifact["vulnerable_lines"]))
+    return corpus
+
+
+def _summary(samples_us):
+    return {
+        "calls": len(samples_us),
+        "p50_us": percentile(samples_us, 0.50, digits=1),
+        "p99_us": percentile(samples_us, 0.99, digits=1),
+        "max_us": round(max(samples_us), 1),
+    }
+
+
+def main():
+    from backend.api.options import OptionBuildError, build_options, statement_spans
+
+    parser = argparse.ArgumentParser(description="Answer-option builder micro-benchmark")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="Recorded bundles (JSON lines)")
+    parser.add_argument("--db", action="store_true", help="Also use the GeneratedChallenge rows of the database")
+    parser.add_argument("--iterations", type=int, default=200, help="Builds per challenge")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.db)
+    spans_us, build_us, rejected, unstable = [], [], {}, []
+
+    for name, code, vuln_lines in corpus:
+        for i in range(args.iterations):
+            start = time.perf_counter()
+            statement_spans(code)
+            spans_us.append((time.perf_counter() - start) * 1e6)
+
+            start = time.perf_counter()
+            try:
+                build_options(code, vuln_lines, random.Random(i))
+            except OptionBuildError as e:
+                rejected[name] = str(e)
+                break
+            build_us.append((time.perf_counter() - start) * 1e6)
+
+        if name not in rejected:
+            if build_options(code, vuln_lines, random.Random(7)) != build_options(code, vuln_lines, random.Random(7)):
+                unstable.append(name)
+
+    report = {
+        "challenges": len(corpus),
+        "iterations": args.iterations,
+        "statement_spans": _summary(spans_us),
+        "build_options": _summary(build_us) if build_us else None,
+        "rejected": rejected,
+        "non_deterministic": unstable,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Compare the read-heavy endpoints under WSGI (gunicorn) and ASGI (uvicorn).
+
+Each client thread keeps one HTTP connection open and loops over the
+endpoints the game polls while waiting for a challenge: generation status,
+latest challenge and user stats. Alongside them, a few "waiting" clients
+long-poll a generation that never finishes (status ?wait=N), which is what
+a player sitting on the generating screen does. The same load is sent to
+each server and throughput / latency of the regular requests are printed
+side by side.
+
+Usage:
+    # Start both servers on a throwaway SQLite database and compare them
+    python backend/scripts/compare_wsgi_asgi.py --launch --workers 2 --clients 64
+
+    # Or point it at servers you started yourself
+    python backend/scripts/compare_wsgi_asgi.py --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from urllib.parse import urlparse
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from backend.scripts._benchutil import percentile, wait_until_up  # noqa: E402
+
+SERVERS = {
+    "wsgi": lambda port, workers: [
+        sys.executable, "-m", "gunicorn", "backend.wsgi:application",
+        "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "--log-level", "warning",
+    ],
+    "asgi": lambda port, workers: [
+        sys.executable, "-m", "uvicorn", "backend.asgi:application",
+        "--workers", str(workers), "--port", str(port), "--log-level", "warning",
+    ],
+}
+
+
+def request(conn, method, path, token=None, body=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    resp = conn.getresponse()
+    data = resp.read()
+    return resp.status, data
+
+
+def connect(base_url, timeout=30):
+    u = urlparse(base_url)
+    return http.client.HTTPConnection(u.hostname, u.port or 80, timeout=timeout)
+
+
+SEED = """
+from backend.api.models import GenerationRequest, GeneratedChallenge
+pending = GenerationRequest.objects.create(status="queued")
+gr = GenerationRequest.objects.create(status="done")
+GeneratedChallenge.objects.create(generation=gr, artifact={
+    "language": "python", "vuln_type": "sqli", "difficulty": "easy",
+    "insecure_code": "x = 1\\n" * 25, "secure_code": "x = 1\\n" * 25, "tests": "def test(): pass",
+    "vulnerable_lines": [12], "explanation": {"short": "...", "fix": "..."},
+    "options": [{"lines": [12], "label": ""}, {"lines": [3], "label": ""}],
+})
+print(gr.id, pending.id)
+"""
+
+
+def seed(env):
+    """Create a finished and a pending generation; returns their ids."""
+    out = subprocess.run(
+        [sys.executable, str(ROOT / "manage.py"), "shell", "-c", SEED],
+        env=env, check=True, capture_output=True, text=True,
+    )
+    done_id, pending_id = out.stdout.strip().splitlines()[-1].split()
+    return int(done_id), int(pending_id)
+
+
+def login(base_url):
+    """Register and log in a throwaway user; returns an access token."""
+    conn = connect(base_url)
+    username = f"bench-{uuid.uuid4().hex[:8]}"
+    creds = {"username": username, "email": f"{username}@example.com", "password": "bench-pass-123"}
+    request(conn, "POST", "/api/auth/register/", body=creds)
+    status, data = request(conn, "POST", "/api/auth/login/", body={"username": username, "password": creds["password"]})
+    if status != 200:
+        raise RuntimeError(f"Login failed against {base_url}: {status} {data[:200]!r}")
+    conn.close()
+    return json.loads(data)["access"]
+
+
+def run_load(base_url, clients, duration, generation_id, long_pollers, pending_id, wait):
+    token = login(base_url)
+    paths = ["/api/generator/latest/", f"/api/generator/generation/{generation_id}/", "/api/stats/"]
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        conn = connect(base_url)
+        local, local_errors, i = [], 0, 0
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status, _ = request(conn, "GET", path, token)
+                if status >= 500:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = connect(base_url)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    def long_poller():
+        conn = connect(base_url, timeout=wait + 30)
+        while time.perf_counter() < deadline:
+            try:
+                request(conn, "GET", f"/api/generator/generation/{pending_id}/?wait={wait}", token)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = connect(base_url, timeout=wait + 30)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    threads += [threading.Thread(target=long_poller) for _ in range(long_pollers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50, scale=1000, digits=1),
+            "p95": percentile(latencies, 0.95, scale=1000, digits=1),
+            "p99": percentile(latencies, 0.99, scale=1000, digits=1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WSGI vs ASGI load comparison")
+    parser.add_argument("--launch", action="store_true", help="Start gunicorn and uvicorn on a temporary database")
+    parser.add_argument("--target", action="append", default=[], help="name=base_url of an already running server")
+    parser.add_argument("--workers", type=int, default=2, help="Server worker processes (with --launch)")
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent client connections")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per server")
+    parser.add_argument("--long-pollers", type=int, default=8, help="Clients long-polling an unfinished generation")
+    parser.add_argument("--wait", type=int, default=5, help="Long-poll wait in seconds")
+    parser.add_argument("--generation-id", type=int, default=1, help="Finished generation to poll (without --launch)")
+    parser.add_argument("--pending-id", type=int, default=2, help="Unfinished generation to long-poll (without --launch)")
+    args = parser.parse_args()
+
+    targets = dict(t.split("=", 1) for t in args.target)
+    procs, tmpdir = [], None
+    if args.launch:
+        tmpdir = tempfile.TemporaryDirectory()
+        env = {**os.environ, "SQLITE_PATH": os.path.join(tmpdir.name, "compare.sqlite3")}
+        subprocess.run([sys.executable, str(ROOT / "manage.py"), "migrate", "-v", "0"], env=env, check=True)
+        args.generation_id, args.pending_id = seed(env)
+        for port, name in enumerate(SERVERS, start=8101):
+            procs.append(subprocess.Popen(SERVERS[name](port, args.workers), cwd=ROOT, env=env))
+            targets[name] = f"http://127.0.0.1:{port}"
+
+    try:
+        results = {}
+        for name, url in targets.items():
+            wait_until_up(url)
+            results[name] = run_load(
+                url, args.clients, args.duration, args.generation_id,
+                args.long_pollers, args.pending_id, args.wait,
+            )
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    print(f"{'SERVER':<8} {'RPS':>8} {'REQS':>7} {'ERRORS':>7} {'P50ms':>8} {'P95ms':>8} {'P99ms':>8}")
+    for name, r in results.items():
+        lat = r["latency_ms"]
+        print(f"{name:<8} {r['throughput_rps']:>8} {r['requests']:>7} {r['errors']:>7} "
+              f"{lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Concurrency stress test for the database configuration.
+
+Spawns several processes that write the way the web tier and the Celery
+worker do at the same time (generation requests moving through
+queued -> running -> done, and players posting results + reading stats),
+then reports throughput and "database is locked" failures.
+
+Each SQLite mode runs against a fresh temporary database file, so the
+development db.sqlite3 is never touched.
+
+Usage:
+    python backend/scripts/db_concurrency_stress.py                    # untuned vs tuned SQLite
+    python backend/scripts/db_concurrency_stress.py --workers 8 --ops 200
+    DB_ENGINE=postgres python backend/scripts/db_concurrency_stress.py --modes postgres
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from backend.scripts._benchutil import percentile  # noqa: E402
+
+MODES = {
+    # Django defaults: rollback journal, 5s busy timeout, deferred transactions
+    "sqlite-untuned": {"DB_ENGINE": "sqlite", "SQLITE_TUNING": "0"},
+    # settings.py defaults: WAL, busy_timeout, synchronous=NORMAL, BEGIN IMMEDIATE
+    "sqlite-tuned": {"DB_ENGINE": "sqlite", "SQLITE_TUNING": "1"},
+    # Uses the POSTGRES_* environment variables
+    "postgres": {"DB_ENGINE": "postgres"},
+}
+
+
+def _setup_django(env):
+    os.environ.update(env)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+
+
+def _worker(env, role, worker_id, ops, queue):
+    _setup_django(env)
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, transaction, connection
+    from backend.api.models import GenerationRequest, GeneratedChallenge, Result
+    from backend.api.utils import get_user_stats
+
+    user, _ = User.objects.get_or_create(username=f"stress-{worker_id}")
+    done = errors = 0
+    latencies = []
+    began = time.time()
+
+    for i in range(ops):
+        start = time.perf_counter()
+        try:
+            if role == "generator":
+                # Mirrors generate_challenge: status updates around a slow stage
+                gr = GenerationRequest.objects.create(created_by=user, status="queued")
+                gr.status = "running"
+                gr.save(update_fields=["status"])
+                with transaction.atomic():
+                    GeneratedChallenge.objects.create(generation=gr, artifact={"i": i, "pad": "x" * 2000})
+                    gr.status = "done"
+                    gr.save(update_fields=["status"])
+            else:
+                # Mirrors ResultCreateView: insert, then stats reads
+                Result.objects.create(user=user, is_correct=bool(i % 2), score=1)
+                get_user_stats(user)
+            done += 1
+        except OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+
+    connection.close()
+    queue.put({"role": role, "done": done, "errors": errors, "latencies": latencies,
+               "began": began, "ended": time.time()})
+
+
+def run_mode(name, workers, ops):
+    env = dict(MODES[name])
+    tmpdir = None
+    if env["DB_ENGINE"] == "sqlite":
+        tmpdir = tempfile.TemporaryDirectory()
+        env["SQLITE_PATH"] = os.path.join(tmpdir.name, "stress.sqlite3")
+
+    subprocess.run(
+        [sys.executable, str(ROOT / "manage.py"), "migrate", "-v", "0"],
+        env={**os.environ, **env}, check=True,
+    )
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    procs = []
+    for w in range(workers):
+        # Roughly one Celery writer per three web writers
+        role = "generator" if w % 4 == 0 else "player"
+        procs.append(ctx.Process(target=_worker, args=(env, role, w, ops, queue)))
+
+    for p in procs:
+        p.start()
+    reports = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    # Measure the window in which workers were actually writing (excludes process start-up)
+    elapsed = max(r["ended"] for r in reports) - min(r["began"] for r in reports)
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+    latencies = sorted(l for r in reports for l in r["latencies"])
+    done = sum(r["done"] for r in reports)
+    errors = sum(r["errors"] for r in reports)
+
+    return {
+        "mode": name,
+        "workers": workers,
+        "ops_per_worker": ops,
+        "elapsed_s": round(elapsed, 2),
+        "completed": done,
+        "locked_errors": errors,
+        "throughput_ops_s": round(done / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50, scale=1000, digits=2),
+            "p95": percentile(latencies, 0.95, scale=1000, digits=2),
+            "p99": percentile(latencies, 0.99, scale=1000, digits=2),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database write-concurrency stress test")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent writer processes")
+    parser.add_argument("--ops", type=int, default=100, help="Operations per worker")
+    parser.add_argument("--modes", nargs="+", default=["sqlite-untuned", "sqlite-tuned"], choices=sorted(MODES))
+    args = parser.parse_args()
+
+    results = [run_mode(m, args.workers, args.ops) for m in args.modes]
+
+    print(f"{'MODE':<16} {'OPS/S':>8} {'DONE':>6} {'LOCKED':>7} {'P50ms':>8} {'P95ms':>8} {'P99ms':>8}")
+    for r in results:
+        lat = r["latency_ms"]
+        print(f"{r['mode']:<16} {r['throughput_ops_s']:>8} {r['completed']:>6} {r['locked_errors']:>7} "
+              f"{lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
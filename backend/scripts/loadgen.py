@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+Load generator for the game API ("a classroom logs in and starts playing").
+
+Registers / logs in N synthetic users through /api/auth/login/ at the same
+time, then replays a weighted mix of what the game does while playing:
+
+    latest   GET  /api/generator/latest/
+    status   GET  /api/generator/generation/<id>/
+    stats    GET  /api/stats/
+    results  POST /api/results/
+
+at a target aggregate request rate (Poisson arrivals, spread over the users,
+one keep-alive connection per user). Latency is measured from the moment a
+request was *scheduled*, so a server that falls behind shows up as growing
+latency instead of a silently lower request rate.
+
+Reports throughput, latency percentiles, error rates and -- when the server
+runs with DB_QUERY_COUNT_HEADER=1 -- the SQL queries per request, per
+endpoint, as JSON.
+
+Usage:
+    # Start uvicorn on a throwaway database (query counting enabled) and load it
+    python backend/scripts/loadgen.py --launch asgi --users 30 --rate 60 --duration 30
+
+    # Against a running server (needs a finished generation to poll)
+    DB_QUERY_COUNT_HEADER=1 python manage.py runserver
+    python backend/scripts/loadgen.py --url http://127.0.0.1:8000 --generation-id 1
+
+    # Different traffic mix
+    python backend/scripts/loadgen.py --launch wsgi --mix latest=1,status=6,stats=2,results=1
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from compare_wsgi_asgi import ROOT, SERVERS, seed  # noqa: E402
+from backend.scripts._benchutil import percentile, wait_until_up  # noqa: E402
+
+DEFAULT_MIX = "latest=3,status=4,stats=2,results=1"
+PASSWORD = "load-pass-123"
+
+
+class Connection:
+    """Minimal HTTP/1.1 keep-alive client on asyncio streams."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, token=None, body=None):
+        reused = self.writer is not None
+        try:
+            return await self._request(method, path, token, body)
+        except ConnectionResetError:
+            if not reused:
+                raise
+            # The server dropped an idle keep-alive connection; retry once on a new one
+            return await self._request(method, path, token, body)
+
+    async def _request(self, method, path, token, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(payload)}",
+        ]
+        if token:
+            lines.append(f"Authorization: Bearer {token}")
+        try:
+            self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + payload)
+            await self.writer.drain()
+            return await self._read_response()
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.close()
+            raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            data = b"".join(chunks)
+        else:
+            data = await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, endpoint, latency, status, headers):
+        queries = headers.get("x-db-queries") if headers else None
+        self.samples.setdefault(endpoint, []).append(
+            (latency, status, int(queries) if queries is not None else None)
+        )
+
+    def report(self, elapsed):
+        out = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(s[0] for s in samples)
+            errors = sum(1 for s in samples if s[1] is None or s[1] >= 400)
+            queries = [s[2] for s in samples if s[2] is not None]
+            out[endpoint] = {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else None,
+                "latency_ms": {
+                    "p50": percentile(latencies, 0.50, scale=1000, digits=1),
+                    "p95": percentile(latencies, 0.95, scale=1000, digits=1),
+                    "p99": percentile(latencies, 0.99, scale=1000, digits=1),
+                },
+                "db_queries": {
+                    "mean": round(sum(queries) / len(queries), 2),
+                    "max": max(queries),
+                } if queries else None,
+            }
+        return out
+
+
+def parse_mix(raw):
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("latest", "status", "stats", "results"):
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def login_user(host, port, index, prefix, recorder):
+    """Register (if needed) and log in one synthetic user; returns (connection, token)."""
+    conn = Connection(host, port)
+    username = f"{prefix}-{index}"
+    await conn.request("POST", "/api/auth/register/", body={
+        "username": username, "email": f"{username}@example.com", "password": PASSWORD,
+    })
+    start = time.perf_counter()
+    status, headers, data = await conn.request(
+        "POST", "/api/auth/login/", body={"username": username, "password": PASSWORD},
+    )
+    recorder.add("login", time.perf_counter() - start, status, headers)
+    if status != 200:
+        raise RuntimeError(f"Login failed for {username}: {status} {data[:200]!r}")
+    return conn, json.loads(data)["access"]
+
+
+async def play(conn, token, rng, mix, per_user_rate, deadline, generation_id, challenge_id, recorder):
+    names, weights = list(mix), list(mix.values())
+    scheduled = time.perf_counter() + rng.expovariate(per_user_rate)
+    while scheduled < deadline:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        endpoint = rng.choices(names, weights)[0]
+        if endpoint == "latest":
+            args = ("GET", "/api/generator/latest/")
+        elif endpoint == "status":
+            args = ("GET", f"/api/generator/generation/{generation_id}/")
+        elif endpoint == "stats":
+            args = ("GET", "/api/stats/")
+        else:
+            correct = rng.random() < 0.6
+            args = ("POST", "/api/results/", {
+                "generated_challenge": challenge_id, "is_correct": correct,
+                "score": 10 if correct else 0, "client_key": uuid.uuid4().hex,
+            })
+
+        try:
+            status, headers, _ = await conn.request(*args[:2], token, *args[2:])
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status, headers = None, None
+        recorder.add(endpoint, time.perf_counter() - scheduled, status, headers)
+        scheduled += rng.expovariate(per_user_rate)
+
+
+async def run(url, users, rate, duration, mix, generation_id, challenge_id, seed_value):
+    u = urlparse(url)
+    host, port = u.hostname, u.port or 80
+    recorder = Recorder()
+    prefix = f"load-{uuid.uuid4().hex[:6]}"
+
+    # Everyone logs in at once, like a class following the teacher's cue
+    started = time.perf_counter()
+    sessions = await asyncio.gather(*(login_user(host, port, i, prefix, recorder) for i in range(users)))
+    login_elapsed = time.perf_counter() - started
+
+    if challenge_id is None:
+        status, _, data = await sessions[0][0].request("GET", "/api/generator/latest/", sessions[0][1])
+        challenge_id = json.loads(data)["id"] if status == 200 else None
+
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        play(conn, token, random.Random(seed_value + i), mix, rate / users, deadline,
+             generation_id, challenge_id, recorder)
+        for i, (conn, token) in enumerate(sessions)
+    ))
+    elapsed = time.perf_counter() - started
+    for conn, _ in sessions:
+        conn.close()
+
+    endpoints = recorder.report(elapsed)
+    endpoints["login"]["throughput_rps"] = round(users / login_elapsed, 1)
+    played = [e for name, e in endpoints.items() if name != "login"]
+    total = sum(e["requests"] for e in played)
+    return {
+        "users": users,
+        "target_rps": rate,
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+        "error_rate": round(sum(e["errors"] for e in played) / total, 4) if total else None,
+        "endpoints": endpoints,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load generator for the game API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of a running server")
+    parser.add_argument("--launch", choices=sorted(SERVERS), help="Start this server on a temporary database")
+    parser.add_argument("--server-workers", type=int, default=2, help="Server worker processes (with --launch)")
+    parser.add_argument("--users", type=int, default=30, help="Synthetic users logging in at once")
+    parser.add_argument("--rate", type=float, default=30.0, help="Target requests per second across all users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of replayed traffic")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--generation-id", type=int, default=1, help="Generation to poll (without --launch)")
+    parser.add_argument("--challenge-id", type=int, help="Generated challenge to answer (default: the latest)")
+    parser.add_argument("--seed", type=int, default=1234, help="Seeds arrivals and the endpoint mix")
+    args = parser.parse_args()
+
+    proc, tmpdir, url = None, None, args.url
+    if args.launch:
+        tmpdir = tempfile.TemporaryDirectory()
+        env = {
+            **os.environ,
+            "SQLITE_PATH": os.path.join(tmpdir.name, "loadgen.sqlite3"),
+            "METRICS_DIR": os.path.join(tmpdir.name, "metrics"),
+            "DB_QUERY_COUNT_HEADER": "1",
+        }
+        subprocess.run([sys.executable, str(ROOT / "manage.py"), "migrate", "-v", "0"], env=env, check=True)
+        args.generation_id, _ = seed(env)
+        proc = subprocess.Popen(SERVERS[args.launch](8111, args.server_workers), cwd=ROOT, env=env)
+        url = "http://127.0.0.1:8111"
+
+    try:
+        wait_until_up(url)
+        result = asyncio.run(run(
+            url, args.users, args.rate, args.duration, args.mix,
+            args.generation_id, args.challenge_id, args.seed,
+        ))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    print(f"{'ENDPOINT':<9} {'REQS':>6} {'RPS':>7} {'ERR%':>6} {'P50ms':>8} {'P95ms':>8} {'P99ms':>8} {'QUERIES':>8}",
+          file=sys.stderr)
+    for name, e in result["endpoints"].items():
+        lat, q = e["latency_ms"], e["db_queries"]
+        print(f"{name:<9} {e['requests']:>6} {e['throughput_rps']:>7} {e['error_rate'] * 100:>6.1f} "
+              f"{lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8} {q['mean'] if q else '-':>8}", file=sys.stderr)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
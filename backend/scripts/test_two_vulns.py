@@ -8,12 +8,7 @@ sys.path.insert(0, project_root)
 from dotenv import load_dotenv
 load_dotenv(os.path.join(project_root, 'backend', '.env'))
 
-import importlib.util
-spec = importlib.util.spec_from_file_location("llm_generator", os.path.join(project_root, 'backend', 'api', 'llm_generator.py'))
-llm_generator = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(llm_generator)
-
-generate_challenge_bundle = llm_generator.generate_challenge_bundle
+from backend.api.llm_generator import generate_challenge_bundle
 
 for vuln_type, seed in [("xss", "user comment display"), ("ssrf", "URL preview generator")]:
     print(f"\n{'='*60}\nTesting: {vuln_type.upper()}\n{'='*60}")
@@ -20,16 +20,8 @@ sys.path.insert(0, project_root)
 from dotenv import load_dotenv
 load_dotenv(os.path.join(project_root, 'backend', '.env'))
 
-# Import directly from the module file to avoid backend.__init__
-import importlib.util
-spec = importlib.util.spec_from_file_location(
-    "llm_generator",
-    os.path.join(project_root, 'backend', 'api', 'llm_generator.py')
-)
-llm_generator = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(llm_generator)
-
-generate_challenge_bundle = llm_generator.generate_challenge_bundle
+# Import the generator (llm_generator imports its package's modules, so not from the file)
+from backend.api.llm_generator import generate_challenge_bundle
 
 # Test data
 VULN_TYPES = [
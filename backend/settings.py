@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+import json
 import os
 from dotenv import load_dotenv
 
@@ -71,6 +72,10 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    'backend.api.middleware.MetricsMiddleware',
+    'backend.api.middleware.QueryCountMiddleware',
+    'backend.api.middleware.TracingMiddleware',
+    'backend.api.middleware.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -110,12 +115,62 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# The web process and the Celery worker share this database. By default it
+# is a tuned SQLite file; set DB_ENGINE=postgres to use a pooled Postgres.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite').lower()
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'safecode'),
+            'USER': os.getenv('POSTGRES_USER', 'safecode'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Pooled connections (psycopg 3 + psycopg_pool) replace persistent
+            # ones; Django requires CONN_MAX_AGE = 0 when the pool is enabled.
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('POSTGRES_POOL_MIN', '2')),
+                    'max_size': int(os.getenv('POSTGRES_POOL_MAX', '10')),
+                    'timeout': float(os.getenv('POSTGRES_POOL_TIMEOUT', '10')),
+                },
+            },
+        }
     }
-}
+else:
+    SQLITE_TUNING = os.getenv('SQLITE_TUNING', '1') != '0'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '20000'))
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            # Keep connections open between requests/tasks instead of reconnecting
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'OPTIONS': {},
+        }
+    }
+
+    if SQLITE_TUNING:
+        DATABASES['default']['OPTIONS'] = {
+            # Run on every new connection:
+            #  - WAL lets readers proceed while the worker writes
+            #  - busy_timeout waits for the write lock instead of raising "database is locked"
+            #  - synchronous=NORMAL is crash-safe under WAL and avoids an fsync per commit
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};'
+                f'PRAGMA synchronous={SQLITE_SYNCHRONOUS};'
+            ),
+            # Take the write lock at BEGIN, so writers queue on busy_timeout rather
+            # than failing when a read transaction tries to upgrade to a write.
+            'transaction_mode': 'IMMEDIATE',
+        }
 
 
 # Password validation
@@ -159,8 +214,106 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Per-process metric snapshots merged by /metrics (defaults to <tmp>/safecode-metrics).
+# Web and worker processes must share this directory; clear it on deploy.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+# Bearer token for Prometheus; without it /metrics is only readable by staff users.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Append OTLP/JSON trace spans to this file (empty = tracing off). See backend/api/tracing.py.
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'safecode')
+
+# Opt-in cProfile sampling (backend/api/profiling.py); summarise with `manage.py profile_top`.
+# A request with "X-Profile: <PROFILE_HEADER_TOKEN>" is always profiled.
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')  # defaults to <tmp>/safecode-profiles
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TASK_SAMPLE_RATE = float(os.getenv('PROFILE_TASK_SAMPLE_RATE', '0'))
+PROFILE_HEADER_TOKEN = os.getenv('PROFILE_HEADER_TOKEN', '')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+
+# Adds an X-DB-Queries header to every response (used by backend/scripts/loadgen.py)
+DB_QUERY_COUNT_HEADER = os.getenv('DB_QUERY_COUNT_HEADER', '0') == '1'
+
+# Per-request LLM spend limits for generate_challenge; no new attempt starts once
+# either is reached (0 = unlimited). The cost limit needs LLM_TOKEN_PRICES.
+GENERATION_TOKEN_BUDGET = int(os.getenv('GENERATION_TOKEN_BUDGET', '0'))
+GENERATION_COST_BUDGET_USD = float(os.getenv('GENERATION_COST_BUDGET_USD', '0'))
+# USD per million tokens as JSON, e.g. {"gpt-4o-2024-08-06": {"input": 2.5, "output": 10}}
+LLM_TOKEN_PRICES = json.loads(os.getenv('LLM_TOKEN_PRICES', '{}'))
+
+# GeneratedChallenge.artifact is stored compressed: "zlib", or "zstd" if the
+# zstandard package is installed. Existing rows keep their codec until rewritten.
+ARTIFACT_COMPRESSION = os.getenv('ARTIFACT_COMPRESSION', 'zlib')
+# After ARTIFACT_RETENTION_DAYS the sandbox output of a challenge moves to
+# gzipped NDJSON files in ARTIFACT_ARCHIVE_DIR (backend/api/archive.py).
+ARTIFACT_RETENTION_DAYS = int(os.getenv('ARTIFACT_RETENTION_DAYS', '30'))
+ARTIFACT_ARCHIVE_DIR = os.getenv('ARTIFACT_ARCHIVE_DIR', str(BASE_DIR / 'artifact-archive'))
+
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
+
+# Two priority classes (backend/api/queues.py): "interactive" for generations a
+# player is waiting on, "bulk" for everything else. Run separate workers per
+# queue so bulk work can't occupy the interactive capacity (see README).
+CELERY_TASK_DEFAULT_QUEUE = "bulk"
+CELERY_TASK_ROUTES = {
+    # Callers pick the queue from GenerationRequest.priority; this is the fallback
+    "backend.api.tasks.generate_challenge": {"queue": "interactive"},
+    "backend.api.tasks.reconcile_leaderboard": {"queue": "bulk"},
+    "backend.api.tasks.reap_stale_generations": {"queue": "bulk"},
+    "backend.api.tasks.archive_verification_logs": {"queue": "bulk"},
+    "backend.api.tasks.reverify_attempts": {"queue": "bulk"},
+    "backend.api.tasks.reverify_corpus": {"queue": "bulk"},
+}
+
+# A worker may die or hang mid-task: acknowledge messages only once the task has
+# finished so a lost task is redelivered, and don't prefetch tasks a dead worker
+# would take down with it. The visibility timeout must exceed the longest task.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BROKER_TRANSPORT_OPTIONS = {"visibility_timeout": 3600}
+
+# generate_challenge time limits (seconds). The soft limit fails the request
+# cleanly; the hard limit kills the worker process and the task is redelivered.
+GENERATION_SOFT_TIME_LIMIT = int(os.getenv('GENERATION_SOFT_TIME_LIMIT', '600'))
+GENERATION_TIME_LIMIT = int(os.getenv('GENERATION_TIME_LIMIT', '660'))
+# Heartbeats are written at every pipeline stage boundary and every
+# GENERATION_HEARTBEAT_INTERVAL seconds during the LLM and sandbox stages; a
+# running request silent for longer than GENERATION_STALE_AFTER is reaped, as
+# is a request queued for longer than GENERATION_QUEUED_TIMEOUT.
+GENERATION_STALE_AFTER = int(os.getenv('GENERATION_STALE_AFTER', '300'))
+GENERATION_HEARTBEAT_INTERVAL = int(os.getenv('GENERATION_HEARTBEAT_INTERVAL', str(GENERATION_STALE_AFTER // 5)))
+GENERATION_QUEUED_TIMEOUT = int(os.getenv('GENERATION_QUEUED_TIMEOUT', '3600'))
+# Runs (first one included) before a request that keeps dying is marked failed
+GENERATION_MAX_RUNS = int(os.getenv('GENERATION_MAX_RUNS', '3'))
+# Infrastructure failures (sandbox, LLM timeouts and rate limits) retry the failed
+# stage with the same input this many times, waiting a random 0..min(MAX_DELAY,
+# BASE_DELAY * 2**n) seconds before retry n (backend/api/errors.py). They don't
+# spend an LLM attempt; if they persist, the request is queued again with its
+# candidate kept, up to GENERATION_MAX_RUNS runs.
+GENERATION_STAGE_RETRIES = int(os.getenv('GENERATION_STAGE_RETRIES', '3'))
+GENERATION_RETRY_BASE_DELAY = float(os.getenv('GENERATION_RETRY_BASE_DELAY', '2'))
+GENERATION_RETRY_MAX_DELAY = float(os.getenv('GENERATION_RETRY_MAX_DELAY', '30'))
+
+CELERY_BEAT_SCHEDULE = {
+    # Re-queue or fail generations whose worker went away
+    "reap-stale-generations": {
+        "task": "backend.api.tasks.reap_stale_generations",
+        "schedule": timedelta(minutes=1),
+    },
+    # Move sandbox output past ARTIFACT_RETENTION_DAYS to the archive files
+    "archive-verification-logs": {
+        "task": "backend.api.tasks.archive_verification_logs",
+        "schedule": timedelta(days=1),
+    },
+    # Correct drift in the incrementally maintained leaderboard
+    "reconcile-leaderboard": {
+        "task": "backend.api.tasks.reconcile_leaderboard",
+        "schedule": timedelta(hours=1),
+    },
+}
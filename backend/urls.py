@@ -8,13 +8,18 @@ from backend.api.views import (
     ChallengeViewSet,
     ResultViewSet,      # keep only if you actually use it elsewhere
     ResultCreateView,
+    BulkResultCreateView,
     RegisterView,
     CurrentUserView,
     UserStatsView,
     GeneratorGenerateView,
     GeneratorStatusView,
     GeneratorChallengeView,
+    GeneratedChallengeListView,
+    GeneratedChallengeSearchView,
     LatestChallengeView,
+    LeaderboardView,
+    MetricsView,
 )
 
 router = routers.DefaultRouter()
@@ -24,6 +29,7 @@ router.register(r'challenges', ChallengeViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 
     # Router endpoints, e.g. /api/challenges/
     path('api/', include(router.urls)),
@@ -34,12 +40,16 @@ urlpatterns = [
     path('api/auth/refresh/', TokenRefreshView.as_view(), name='auth-refresh'),
     path('api/auth/me/', CurrentUserView.as_view(), name='auth-me'),
     path('api/stats/', UserStatsView.as_view(), name='user-stats'),
+    path('api/leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
 
     # Result creation + stats + certificate
     path('api/results/', ResultCreateView.as_view(), name='result-create'),
+    path('api/results/bulk/', BulkResultCreateView.as_view(), name='result-bulk-create'),
 
     path('api/generator/generate/', GeneratorGenerateView.as_view(), name='generator-generate'),
     path('api/generator/generation/<int:generation_id>/', GeneratorStatusView.as_view(), name='generator-status'),
     path('api/generator/challenge/<int:challenge_id>/', GeneratorChallengeView.as_view(), name='generator-challenge'),
+    path('api/generator/challenges/', GeneratedChallengeListView.as_view(), name='generator-challenge-list'),
+    path('api/generator/challenges/search/', GeneratedChallengeSearchView.as_view(), name='generator-challenge-search'),
     path('api/generator/latest/', LatestChallengeView.as_view(), name='latest-challenge'),
 ]
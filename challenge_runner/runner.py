@@ -1,19 +1,138 @@
-import json, os, subprocess, tempfile, sys
+import json, os, subprocess, tempfile, sys, threading, time
 from typing import Any, Dict, List, Optional
 
+# os.wait4 gives the CPU time and peak RSS of exactly one tool run (POSIX only);
+# os.waitid lets the timeout kill race safely with the exit (see _run_measured)
+HAVE_WAIT4 = hasattr(os, "wait4") and hasattr(os, "waitid")
+
+# (result key, command, timeout in seconds), run in this order. The sandbox
+# allows a whole run more than their sum (backend/api/docker_runner.py RUN_TIMEOUT).
+TOOLS = [
+    ("tests", ["pytest", "-q"], 60),
+    ("bandit", ["bandit", "-q", "-r", "."], 60),
+    ("semgrep", ["semgrep", "--config", "p/python", "."], 120),
+    ("pip_audit", ["pip-audit"], 60),
+]
+
 def run(cmd: List[str], cwd: str, timeout: int = 60, env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    start = time.perf_counter()
     try:
-        p = subprocess.run(
-            cmd,
-            cwd=cwd,
-            env=env,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
-        return {"cmd": cmd, "returncode": p.returncode, "stdout": p.stdout, "stderr": p.stderr, "timeout": False}
+        if HAVE_WAIT4:
+            out = _run_measured(cmd, cwd, timeout, env)
+        else:
+            p = subprocess.run(
+                cmd,
+                cwd=cwd,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+            out = {"cmd": cmd, "returncode": p.returncode, "stdout": p.stdout, "stderr": p.stderr, "timeout": False}
     except subprocess.TimeoutExpired as e:
-        return {"cmd": cmd, "returncode": 124, "stdout": e.stdout or "", "stderr": (e.stderr or "") + "\n[runner] Command timed out.", "timeout": True}
+        out = {"cmd": cmd, "returncode": 124, "stdout": e.stdout or "", "stderr": (e.stderr or "") + "\n[runner] Command timed out.", "timeout": True}
+    except FileNotFoundError:
+        out = {"cmd": cmd, "returncode": 127, "stdout": "", "stderr": f"[runner] {cmd[0]} is not installed.", "timeout": False}
+    out["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return out
+
+def _run_measured(cmd: List[str], cwd: str, timeout: int, env: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Run cmd and reap it with os.wait4, which reports the rusage of that child
+    (and the descendants it waited for): user/system CPU time and peak RSS.
+    Output goes to temporary files so a chatty tool cannot fill a pipe.
+
+    The exit is first awaited without reaping (waitid WNOWAIT), so until the
+    timeout timer is disarmed the pid still names our child (a zombie at
+    worst) and the timer can never signal a reused pid.
+    """
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        p = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=stdout, stderr=stderr)
+        killed = threading.Event()
+        lock = threading.Lock()
+        exited = False
+
+        def kill():
+            with lock:
+                if not exited:
+                    killed.set()
+                    p.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            os.waitid(os.P_PID, p.pid, os.WEXITED | os.WNOWAIT)
+        finally:
+            with lock:
+                exited = True
+            timer.cancel()
+        _, status, usage = os.wait4(p.pid, 0)
+        p.returncode = os.waitstatus_to_exitcode(status)  # already reaped; keep Popen from waiting again
+
+        stdout.seek(0)
+        stderr.seek(0)
+        out_text = stdout.read().decode("utf-8", "replace")
+        err_text = stderr.read().decode("utf-8", "replace")
+
+    timed_out = killed.is_set()
+    out = {
+        "cmd": cmd,
+        "returncode": 124 if timed_out else p.returncode,
+        "stdout": out_text,
+        "stderr": err_text + ("\n[runner] Command timed out." if timed_out else ""),
+        "timeout": timed_out,
+    }
+    out["cpu_user_ms"] = round(usage.ru_utime * 1000, 1)
+    out["cpu_sys_ms"] = round(usage.ru_stime * 1000, 1)
+    # Kilobytes on Linux. Has a floor of roughly the runner's own RSS, which
+    # the child is charged for until it execs the tool.
+    out["max_rss_kb"] = usage.ru_maxrss
+    return out
+
+def cgroup_stats(root: str = "/sys/fs/cgroup") -> Optional[Dict[str, Any]]:
+    """Whole-container CPU time and peak memory from cgroup v2, when available."""
+    stats: Dict[str, Any] = {}
+    try:
+        with open(os.path.join(root, "cpu.stat")) as f:
+            cpu = dict(line.split() for line in f if line.strip())
+        stats["cpu_user_ms"] = round(int(cpu["user_usec"]) / 1000, 1)
+        stats["cpu_sys_ms"] = round(int(cpu["system_usec"]) / 1000, 1)
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        with open(os.path.join(root, "memory.peak")) as f:
+            stats["memory_peak_kb"] = int(f.read().strip()) // 1024
+    except (OSError, ValueError):
+        pass
+    return stats or None
+
+def _otlp_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    return {"stringValue": str(v)}
+
+def tool_span(traceparent: str, name: str, start_ns: int, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """An OTLP/JSON span for one tool run, child of the host's sandbox span."""
+    parts = traceparent.split("-")
+    if len(parts) != 4:
+        return None
+    attributes = {"tool": name, "returncode": result.get("returncode")}
+    for key in ("cpu_user_ms", "cpu_sys_ms", "max_rss_kb"):
+        if result.get(key) is not None:
+            attributes[key] = result[key]
+    return {
+        "traceId": parts[1],
+        "spanId": os.urandom(8).hex(),
+        "parentSpanId": parts[2],
+        "name": f"tool {name}",
+        "kind": 1,
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(start_ns + int(result["duration_ms"] * 1_000_000)),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None],
+        "status": {"code": 2 if result.get("timeout") else 1},
+    }
 
 def main():
     raw = (sys.stdin.read() or "").strip()
@@ -39,11 +158,17 @@ def main():
         env = dict(os.environ)
         env["PYTHONPATH"] = d + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
 
-        out["tests"] = run(["pytest", "-q"], cwd=d, timeout=60, env=env)
-        out["bandit"] = run(["bandit", "-q", "-r", "."], cwd=d, timeout=60, env=env)
-        out["semgrep"] = run(["semgrep", "--config", "p/python", "."], cwd=d, timeout=120, env=env)
-        out["pip_audit"] = run(["pip-audit"], cwd=d, timeout=60, env=env)
+        traceparent = (job.get("trace") or {}).get("traceparent")
+        spans = []
+        for key, cmd, timeout in TOOLS:
+            start_ns = time.time_ns()
+            out[key] = run(cmd, cwd=d, timeout=timeout, env=env)
+            if traceparent:
+                spans.append(tool_span(traceparent, key, start_ns, out[key]))
+        if traceparent:
+            out["spans"] = [sp for sp in spans if sp]
 
+    out["container"] = cgroup_stats() if os.getenv("RUNNER_CGROUP_STATS", "1") == "1" else None
     out["ok"] = True
     print(json.dumps(out))
 
@@ -61,7 +61,8 @@ func _on_challenges_received(result, response_code, headers, body):
 			push_error("Failed to parse response JSON: " + text)
 			return
 
-		for challenge in data:
+		# /api/challenges/ is cursor-paginated: {"next", "previous", "results"}
+		for challenge in data["results"]:
 			print("- %s (%s)" % [challenge["title"], challenge["difficulty"]])
 	else:
 		push_error("Server responded with code: %s" % response_code)